@@ -0,0 +1,260 @@
+from __future__ import division
+from collections import Counter, deque
+
+BYTES_PER_KILOBYTE = 1024.0
+BYTES_PER_MEGABYTE = 1048576.0
+
+"""The width, in milliseconds, of the windows that graphed values are averaged or summed over"""
+WINDOW_SIZE = 100
+
+"""The resolution, in milliseconds, of the round trip time histograms used for percentiles"""
+RTT_HISTOGRAM_RESOLUTION = 0.01
+
+class BlockAverage:
+    """Averages a series of (time, value) samples over consecutive windows as they arrive.
+       This is the streaming form of stats.block_average, and produces the same points for
+       the same samples: the first sample as is, the average of each window after it, and
+       the average of the final window at the time of the last sample.
+
+    Attributes:
+        times: Times of the completed points, in seconds
+        values: Values of the completed points
+    """
+
+    def __init__(self):
+        self.times = []
+        self.values = []
+        self._last_interval_start = 0
+        self._window_count = 0.0
+        self._window_total = 0
+        self._last_time = None
+
+    def add(self, time, value):   # time in milliseconds
+        if self._last_time is None:
+            self.times.append(time / 1000.0)
+            self.values.append(value)
+        else:
+            if time - self._last_interval_start > WINDOW_SIZE:
+                if self._window_count > 0:
+                    self.times.append((self._last_interval_start + (WINDOW_SIZE / 2)) / 1000.0)
+                    self.values.append(self._window_total / self._window_count)
+                self._window_count = 0.0
+                self._window_total = 0
+                self._last_interval_start += WINDOW_SIZE
+            self._window_count += 1
+            self._window_total += value
+        self._last_time = time
+
+    """Returns the (times, values) of the series, including the final, partial window."""
+    def series(self):
+        if self._window_count == 0:
+            return (list(self.times), list(self.values))
+        return (self.times + [self._last_time / 1000.0], self.values + [self._window_total / self._window_count])
+
+class BlockSum:
+    """Sums a series of (time, value) samples over consecutive windows as they arrive.
+       This is the streaming form of stats.block_sum; like it, the final, partial window
+       is left out of the series.
+
+    Attributes:
+        times: Times of the completed windows' midpoints, in seconds
+        values: Sums of the completed windows
+    """
+
+    def __init__(self):
+        self.times = []
+        self.values = []
+        self._last_interval_start = 0
+        self._window_total = 0
+
+    def add(self, time, value):   # time in milliseconds
+        if time - self._last_interval_start > WINDOW_SIZE:
+            self.times.append((self._last_interval_start + (WINDOW_SIZE / 2)) / 1000.0)
+            self.values.append(self._window_total)
+            self._window_total = 0
+            self._last_interval_start += WINDOW_SIZE
+        self._window_total += value
+
+    def series(self):
+        return (list(self.times), list(self.values))
+
+class FirstSendTimes:
+    """The time each packet of a flow was first sent, for the packets that the flow's
+       cumulative acknowledgement hasn't yet passed. A flow first sends its packets in id
+       order, so the times are kept in that order and discarded from the front as the
+       cumulative acknowledgement moves past them, and only about a window of packets is
+       held at a time.
+
+    Attributes:
+        acknowledged: The cumulative acknowledgement: every packet with a lower id has
+            been received
+        times: Time each packet not yet cumulatively acknowledged was first sent, keyed by id
+        order: The ids in `times`, in the order they were first sent
+    """
+
+    def __init__(self):
+        self.acknowledged = 0
+        self.times = {}
+        self.order = deque()
+
+    """Records a send of packet `identifier` at `time`, and returns whether it is the
+       packet's first."""
+    def sent(self, identifier, time):
+        if identifier < self.acknowledged or identifier in self.times:
+            return False
+        self.times[identifier] = time
+        self.order.append(identifier)
+        return True
+
+    """Records an acknowledgement of packet `identifier` that expects `next_id` next, and
+       returns the time the packet was first sent, or None if an earlier acknowledgement
+       had already passed it and the time was discarded."""
+    def acknowledge(self, identifier, next_id):
+        time = self.times.get(identifier)
+        if next_id > self.acknowledged:
+            self.acknowledged = next_id
+            (times, order) = (self.times, self.order)
+            while order and order[0] < next_id:
+                del times[order.popleft()]
+        return time
+
+class WindowedStatistics:
+    """Maintains the windowed series plotted by stats.show_graphs as the simulation runs,
+       so that the raw log entries don't need to be kept. The Logger feeds it every entry.
+
+       Memory grows with the number of windows rather than the number of events. To
+       compute round trip times, the time each packet was first sent is kept until the
+       flow's cumulative acknowledgement passes it (see FirstSendTimes). Round trip times
+       are measured when each acknowledgement arrives, from the first time its packet was
+       sent. An acknowledgement that arrives after the cumulative acknowledgement has
+       passed its packet, such as one for a needless retransmission, has no round trip
+       time.
+
+    Attributes:
+        free_buffer_space: BlockAverage of free buffer space in KB, keyed by link id
+        amounts_left: BlockAverage of MB left to transmit, keyed by flow id
+        round_trip_times: BlockAverage of round trip time in ms, keyed by flow id
+        dropped_packets: BlockAverage of the fraction of packets dropped, keyed by link or router id
+        droppers: The ids of the links and routers that have dropped at least one packet
+        bytes_sent: BlockSum of bytes sent, keyed by link id
+        flow_start_times: Time each flow started, keyed by flow id
+        flow_completion_times: Time each flow completed, keyed by flow id
+        payload_bytes: Bytes of distinct packets sent, or delivered by a fluid flow,
+            keyed by flow id
+        round_trip_time_histograms: Counter of round trip times rounded down to
+            RTT_HISTOGRAM_RESOLUTION, keyed by flow id
+        round_trip_time_totals: Sum of all round trip times, keyed by flow id
+        drop_counts: Counter of packets dropped, keyed by link or router id
+        link_bytes: Counter of bytes sent, keyed by link id
+    """
+
+    def __init__(self):
+        self.free_buffer_space = {}
+        self.amounts_left = {}
+        self.round_trip_times = {}
+        self.dropped_packets = {}
+        self.droppers = set()
+        self.bytes_sent = {}
+        self.flow_start_times = {}
+        self.flow_completion_times = {}
+        self.payload_bytes = Counter()
+        self.round_trip_time_histograms = {}
+        self.round_trip_time_totals = Counter()
+        self.drop_counts = Counter()
+        self.link_bytes = Counter()
+        self._first_sent = {}
+
+    @staticmethod
+    def _add(series, key, series_class, time, value):
+        accumulator = series.get(key)
+        if accumulator is None:
+            accumulator = series[key] = series_class()
+        accumulator.add(time, value)
+
+    def flow_started(self, time, flow_id):
+        self.flow_start_times[flow_id] = time
+
+    def flow_completed(self, time, flow_id):
+        self.flow_completion_times[flow_id] = time
+
+    def packet_sent(self, time, flow_id, packet):
+        first_sent = self._first_sent.get(flow_id)
+        if first_sent is None:
+            first_sent = self._first_sent[flow_id] = FirstSendTimes()
+        if first_sent.sent(packet.identifier, time):
+            self.payload_bytes[flow_id] += packet.size
+
+    def acknowledgement_received(self, time, flow_id, packet, amount_left):
+        self._add(self.amounts_left, flow_id, BlockAverage, time, amount_left / BYTES_PER_MEGABYTE)
+        sent = self._first_sent[flow_id].acknowledge(packet.identifier, packet.next_id)
+        if sent is None:
+            return
+        rtt = time - sent
+        self._add(self.round_trip_times, flow_id, BlockAverage, time, rtt)
+        self.round_trip_time_histograms.setdefault(flow_id, Counter())[int(rtt // RTT_HISTOGRAM_RESOLUTION)] += 1
+        self.round_trip_time_totals[flow_id] += rtt
+
+    """Records an update of a fluid flow, which has delivered `delivered` bytes."""
+    def fluid_flow_updated(self, time, flow_id, rtt, delivered, amount_left):
+        self._add(self.amounts_left, flow_id, BlockAverage, time, amount_left / BYTES_PER_MEGABYTE)
+        self._add(self.round_trip_times, flow_id, BlockAverage, time, rtt)
+        self.round_trip_time_histograms.setdefault(flow_id, Counter())[int(rtt // RTT_HISTOGRAM_RESOLUTION)] += 1
+        self.round_trip_time_totals[flow_id] += rtt
+        self.payload_bytes[flow_id] = int(delivered)
+
+    def buffer_space(self, time, link_id, available_space):
+        self._add(self.free_buffer_space, link_id, BlockAverage, time, available_space / BYTES_PER_KILOBYTE)
+
+    """Records a packet dropped by the link or router `dropper_id`."""
+    def packet_dropped(self, time, dropper_id):
+        self.droppers.add(dropper_id)
+        self.drop_counts[dropper_id] += 1
+        self._add(self.dropped_packets, dropper_id, BlockAverage, time, 1)
+
+    """Records a packet passed on by the link or router `dropper_id`."""
+    def packet_forwarded(self, time, dropper_id):
+        self._add(self.dropped_packets, dropper_id, BlockAverage, time, 0)
+
+    def link_sent(self, time, link_id, packet):
+        self.packet_forwarded(time, link_id)
+        self._add(self.bytes_sent, link_id, BlockSum, time, packet.size)
+        self.link_bytes[link_id] += packet.size
+
+    def free_buffer_space_series(self):
+        return dict((link_id, average.series()) for (link_id, average) in self.free_buffer_space.iteritems())
+
+    def amounts_left_series(self):
+        return dict((flow_id, average.series()) for (flow_id, average) in self.amounts_left.iteritems())
+
+    def round_trip_time_series(self):
+        return dict((flow_id, average.series()) for (flow_id, average) in self.round_trip_times.iteritems())
+
+    """Returns the drop fraction series of the links and routers that dropped any packets."""
+    def dropped_packets_series(self):
+        return dict((dropper_id, average.series()) for (dropper_id, average) in self.dropped_packets.iteritems() if dropper_id in self.droppers)
+
+    def bytes_sent_series(self):
+        return dict((link_id, total.series()) for (link_id, total) in self.bytes_sent.iteritems())
+
+    """Returns the per-flow, per-dropper and per-link figures of stats.summarize, as
+       (flows, drops, link bytes).
+       The 99th percentile round trip time is read from the histogram, so it is rounded
+       down to RTT_HISTOGRAM_RESOLUTION."""
+    def summary(self):
+        flows = {}
+        for (flow_id, time) in self.flow_start_times.iteritems():
+            flows.setdefault(flow_id, {})["start"] = time
+        for (flow_id, time) in self.flow_completion_times.iteritems():
+            flows.setdefault(flow_id, {})["completion"] = time
+        for (flow_id, size) in self.payload_bytes.iteritems():
+            flows.setdefault(flow_id, {})["bytes"] = size
+        for (flow_id, histogram) in self.round_trip_time_histograms.iteritems():
+            count = sum(histogram.itervalues())
+            flows.setdefault(flow_id, {})["mean_rtt"] = self.round_trip_time_totals[flow_id] / count
+            seen = 0
+            for bucket in sorted(histogram):
+                seen += histogram[bucket]
+                if seen >= 0.99 * count:
+                    flows[flow_id]["p99_rtt"] = bucket * RTT_HISTOGRAM_RESOLUTION
+                    break
+        return (flows, dict(self.drop_counts), dict(self.link_bytes))
@@ -0,0 +1,343 @@
+from __future__ import division
+import sys, os, time, json, argparse, heapq, itertools, resource, multiprocessing, Queue
+from contextlib import contextmanager
+from event_queue import SCHEDULERS
+from router import ROUTING_TABLES
+from queue_discipline import QUEUE_DISCIPLINES
+from topology import TOPOLOGIES
+from event import Event
+from packet import StandardPacket, RoutingPacket
+from parsing import read_testcase, generate_simulation_from_testcase
+
+@contextmanager
+def quiet():
+    """Silences the simulation's progress output while benchmarking."""
+    devnull = open(os.devnull, "w")
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = devnull
+    try:
+        yield
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+        devnull.close()
+
+"""Builds the simulation for a test case. `options` are passed on to
+   generate_simulation_from_testcase, such as routing="static" or pooling=True."""
+def load_simulation(testcase_path, fast_insteadof_reno, scheduler="heap", **options):
+    with open(testcase_path) as testcase_file:
+        testcase = read_testcase(testcase_file)
+    with quiet():
+        return generate_simulation_from_testcase(testcase, False, fast_insteadof_reno, scheduler, **options)
+
+"""Runs a simulation to completion, or only through the events scheduled up to `until`
+   ms if it is given, returning (simulation, events performed, wall seconds)."""
+def run_simulation(sim, until=None):
+    with quiet():
+        start = time.time()
+        events = sim.run_events(float("inf")) if until is None else sim.run_until(until)
+        elapsed = time.time() - start
+    return (sim, events, elapsed)
+
+"""Runs the full simulation and reports events per second of wall time."""
+def benchmark_simulation(testcase_path, fast_insteadof_reno, repeat, scheduler="heap", routing="dynamic"):
+    best = None
+    for _ in range(repeat):
+        (sim, events, elapsed) = run_simulation(load_simulation(testcase_path, fast_insteadof_reno, scheduler, routing=routing))
+        if best is None or elapsed < best[2]:
+            best = (sim, events, elapsed)
+    (sim, events, elapsed) = best
+    print "{0} scheduler, {1} routing, asserts {2}: {3} events in {4:.2f}s ({5:.0f} events/s, simulated {6})".format(
+        scheduler, routing, "on" if __debug__ else "off", events, elapsed, events / elapsed, sim.clock)
+    event_queue = sim.event_queue
+    print "canceled events: {0} skipped at head, {1} compacted in {2} rebuilds".format(event_queue.canceled_skipped, event_queue.canceled_compacted, event_queue.compactions)
+
+"""Records every push (as its scheduled time) and pop (as None) the event queue
+   sees during a full simulation run, including pops of canceled events."""
+def record_event_queue_trace(testcase_path, fast_insteadof_reno):
+    sim = load_simulation(testcase_path, fast_insteadof_reno)
+    event_queue = sim.event_queue
+    trace = [when for (when, _, _) in sorted(event_queue._priority_queue)]
+    schedule_event = event_queue.schedule_event
+    dequeue_next_event = event_queue.dequeue_next_event
+
+    def recording_schedule_event(when, event):
+        trace.append(when)
+        return schedule_event(when, event)
+
+    def recording_dequeue_next_event():
+        size = len(event_queue)
+        event = dequeue_next_event()
+        trace.extend([None] * (size - len(event_queue)))
+        return event
+
+    event_queue.schedule_event = recording_schedule_event
+    event_queue.dequeue_next_event = recording_dequeue_next_event
+    run_simulation(sim)
+    return trace
+
+def replay_locked_priority_queue(trace):
+    queue = Queue.PriorityQueue()
+    sequence = itertools.count()
+    start = time.time()
+    for when in trace:
+        if when is None:
+            queue.get_nowait()
+        else:
+            queue.put((when, next(sequence)))
+    return time.time() - start
+
+def replay_heap(trace):
+    queue = []
+    sequence = itertools.count()
+    push, pop = heapq.heappush, heapq.heappop
+    start = time.time()
+    for when in trace:
+        if when is None:
+            pop(queue)
+        else:
+            push(queue, (when, next(sequence)))
+    return time.time() - start
+
+"""Replays the recorded event-queue traffic of a run against the old lock-based
+   Queue.PriorityQueue engine and the heap engine, isolating scheduler cost."""
+def benchmark_event_queue(testcase_path, fast_insteadof_reno, repeat):
+    trace = record_event_queue_trace(testcase_path, fast_insteadof_reno)
+    pops = trace.count(None)
+    for (name, replay) in [("Queue.PriorityQueue", replay_locked_priority_queue), ("heapq", replay_heap)]:
+        elapsed = min(replay(trace) for _ in range(repeat))
+        print "{0:>20}: {1} operations in {2:.2f}s ({3:.0f} events/s)".format(name, len(trace), elapsed, pops / elapsed)
+
+"""Times every call to the flows' congestion controllers' acknowledgement_received
+   during a full run, and reports the average cost per ACK grouped by how many
+   packets were outstanding when it arrived, in power-of-two buckets."""
+def benchmark_acknowledgements(testcase_path, fast_insteadof_reno):
+    sim = load_simulation(testcase_path, fast_insteadof_reno)
+    buckets = {}
+
+    def timed(controller):
+        acknowledgement_received = controller.acknowledgement_received
+
+        def timed_acknowledgement_received(packet):
+            outstanding = len(controller.not_acknowledged)
+            start = time.time()
+            acknowledgement_received(packet)
+            elapsed = time.time() - start
+            bucket = buckets.setdefault(1 << max(outstanding - 1, 0).bit_length(), [0, 0.0])
+            bucket[0] += 1
+            bucket[1] += elapsed
+        return timed_acknowledgement_received
+
+    for flow in sim.flows.values():
+        flow.controller.acknowledgement_received = timed(flow.controller)
+    run_simulation(sim)
+    print "{0:>12} {1:>8} {2:>10}".format("outstanding", "ACKs", "us/ACK")
+    for size in sorted(buckets):
+        (count, elapsed) = buckets[size]
+        print "{0:>12} {1:>8} {2:>10.1f}".format("<= " + str(size), count, elapsed / count * 1e6)
+
+"""Runs the test case once with each routing mode, and with static ECMP routing, and
+   reports how long the flows took, the throughput they achieved overall and per flow,
+   and the fraction of its rate each link was busy sending until the flows completed."""
+def benchmark_routing(testcase_path, fast_insteadof_reno):
+    import stats
+    for (routing, multipath) in [(routing, False) for routing in sorted(ROUTING_TABLES)] + [("static", True)]:
+        (sim, events, elapsed) = run_simulation(load_simulation(testcase_path, fast_insteadof_reno, routing=routing, multipath=multipath))
+        summary = stats.summarize(sim.logger)
+        flows = summary["flows"]
+        start = min(flow["start"] for flow in flows.values())
+        completion = max(flow["completion"] for flow in flows.values())
+        total = sum(flow["bytes"] for flow in flows.values())
+        print "{0:>11} routing: {1} events, flows done at {2:.2f}s, aggregate {3:.3f} Mb/s ({4})".format(
+            routing + (" ECMP" if multipath else ""), events, completion / 1000, total / stats.BYTES_PER_MEGABIT / ((completion - start) / 1000),
+            ", ".join("{0} {1:.3f} Mb/s".format(flow_id, flows[flow_id]["throughput"]) for flow_id in sorted(flows)))
+        print "{0:>20} {1}".format("link utilization:", ", ".join("{0} {1:.0%}".format(link_id, link["bytes"] / (sim.links[link_id].rate * completion))
+                                                                   for (link_id, link) in sorted(summary["links"].iteritems())))
+
+"""Runs the test case with every queue discipline on every link, under both Reno and
+   FAST, and reports each flow's throughput and round trip times and each link's drops."""
+def benchmark_queue_disciplines(testcase_path):
+    import stats
+    for fast_insteadof_reno in [False, True]:
+        for discipline in sorted(QUEUE_DISCIPLINES):
+            (sim, events, elapsed) = run_simulation(load_simulation(testcase_path, fast_insteadof_reno, aggregate=True, queue_discipline=discipline))
+            summary = stats.summarize(sim.logger)
+            flows = summary["flows"]
+            print "{0:>5} {1:>8}: flows done at {2:.2f}s, {3} dropped ({4})".format(
+                summary["congestion_control"], discipline, max(flow["completion"] for flow in flows.values()) / 1000, sum(summary["drops"].values()),
+                ", ".join("{0} {1}".format(link_id, drops) for (link_id, drops) in sorted(summary["drops"].iteritems())) or "none")
+            for flow_id in sorted(flows):
+                print "{0:>20} {1:.3f} Mb/s, mean RTT {2:.1f} ms, p99 RTT {3:.1f} ms".format(
+                    flow_id + ":", flows[flow_id]["throughput"], flows[flow_id]["mean_rtt"], flows[flow_id]["p99_rtt"])
+
+"""Runs the test case with every flow simulated packet by packet, and again with the
+   flows in `fluid` modeled as fluid, and reports the events, wall time and each flow's
+   completion time and throughput of both."""
+def benchmark_fluid(testcase_path, fast_insteadof_reno, fluid):
+    import stats
+    for (name, options) in [("packets", {}), ("fluid " + ",".join(fluid), {"fluid": fluid})]:
+        (sim, events, elapsed) = run_simulation(load_simulation(testcase_path, fast_insteadof_reno, aggregate=True, **options))
+        flows = stats.summarize(sim.logger)["flows"]
+        print "{0}: {1} events in {2:.2f}s, flows done at {3:.2f}s".format(
+            name, events, elapsed, max(flow["completion"] for flow in flows.values()) / 1000)
+        for flow_id in sorted(flows):
+            print "{0:>20} done at {1:.2f}s, {2:.3f} Mb/s".format(flow_id + ":", flows[flow_id]["completion"] / 1000, flows[flow_id]["throughput"])
+
+# Counts every instance of `cls` allocated from now on in cls.allocated,
+# unless the class is pooled and pooling is on, in which case it counts itself.
+def _count_allocations(cls):
+    if cls._free_list is not None:
+        return
+    cls.allocated = 0
+
+    def counting_new(cls, *args):
+        cls.allocated += 1
+        return object.__new__(cls)
+    cls.__new__ = staticmethod(counting_new)
+
+"""Runs `target(*args, results)` in a fresh process, so that peak RSS belongs to that run
+   alone, and returns what it puts on the results queue, or None if the process exits
+   without putting anything, such as when the simulation exits with an error."""
+def run_in_child(target, args):
+    results = multiprocessing.Queue()
+    child = multiprocessing.Process(target=target, args=args + (results,))
+    child.start()
+    while True:
+        try:
+            result = results.get(timeout=1)
+            break
+        except Queue.Empty:
+            if not child.is_alive():
+                # The child may have exited just after putting its result
+                try:
+                    result = results.get(timeout=1)
+                except Queue.Empty:
+                    result = None
+                break
+    child.join()
+    return result
+
+# Run in a child process, so that peak RSS belongs to this run alone.
+def _measure_memory(testcase_path, fast_insteadof_reno, options, results):
+    sim = load_simulation(testcase_path, fast_insteadof_reno, **options)
+    classes = Event.__subclasses__() + StandardPacket.__subclasses__() + [RoutingPacket]
+    for cls in classes:
+        _count_allocations(cls)
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    (sim, events, elapsed) = run_simulation(sim)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    megabytes = sum(flow.total for flow in sim.flows.values()) / 1048576
+    results.put((events, elapsed, start_rss, peak_rss, sum(cls.allocated for cls in classes) / megabytes))
+
+"""Runs the test case in a fresh process with and without pooling, in aggregate
+   mode so that log entries don't dominate memory, and reports peak RSS and the
+   packets and events allocated per simulated megabyte of flow data."""
+def benchmark_memory(testcase_path, fast_insteadof_reno):
+    for pooling in [False, True]:
+        measurement = run_in_child(_measure_memory, (testcase_path, fast_insteadof_reno, {"aggregate": True, "pooling": pooling}))
+        if measurement is None:
+            print "pooling {0:>3}: failed".format("on" if pooling else "off")
+            continue
+        (events, elapsed, start_rss, peak_rss, allocations) = measurement
+        print "pooling {0:>3}: {1} events in {2:.2f}s, peak RSS {3:.1f} MB ({4:+.1f} MB during the run), {5:.0f} packets and events allocated per simulated MB".format(
+            "on" if pooling else "off", events, elapsed, peak_rss / 1024, (peak_rss - start_rss) / 1024, allocations)
+
+"""The sizes each topology is generated at by benchmark_scaling"""
+SCALING_SIZES = {
+    "dumbbell": [2, 4, 8, 16, 32, 64],
+    "diamond": [2, 4, 8, 16, 32, 64],
+    "parking_lot": [2, 4, 8, 16],
+    "fat_tree": [4, 6, 8],
+    "random": [8, 16, 32, 64],
+}
+
+"""The fraction by which a scaling run may be slower, or use more memory or a larger event
+   queue, than its baseline before it is reported as a regression"""
+SCALING_TOLERANCE = 0.25
+
+# Run in a child process, so that peak RSS belongs to this run alone.
+def _measure_scaling(testcase, fast_insteadof_reno, options, results):
+    with quiet():
+        sim = generate_simulation_from_testcase(testcase, False, fast_insteadof_reno, aggregate=True, **options)
+    (sim, events, elapsed) = run_simulation(sim)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.put({"events": events, "wall_time": elapsed, "events_per_second": events / elapsed, "peak_rss": peak_rss / 1024,
+                 "high_water_mark": sim.event_queue.high_water_mark, "simulated_time": sim.clock.current_time / 1000,
+                 "finished": sim.all_flows_finished()})
+
+"""Generates each topology at increasing sizes and runs each in a fresh process, reporting
+   wall time, events per second, peak RSS and the event queue's high-water mark. Results
+   are returned keyed by "topology size". Any given `baseline` results are compared with,
+   and the runs that are more than SCALING_TOLERANCE slower, or use more memory or a
+   larger queue, are reported as regressions, as are runs that fail."""
+def benchmark_scaling(fast_insteadof_reno, topologies, options, baseline=None):
+    measurements = {}
+    regressions = []
+    print "{0:<16}{1:>8}{2:>8}{3:>10}{4:>10}{5:>12}{6:>12}{7:>14}".format("topology", "routers", "flows", "events", "wall, s", "events/s", "peak MB", "queue max")
+    for name in topologies:
+        for size in SCALING_SIZES[name]:
+            testcase = TOPOLOGIES[name](size)
+            measurement = run_in_child(_measure_scaling, (testcase, fast_insteadof_reno, options))
+            key = "{0} {1}".format(name, size)
+            if measurement is None:
+                print "{0:<16}{1:>8}{2:>8}  failed".format(key, len(testcase["routers"]), len(testcase["flows"]))
+                regressions.append("{0}: the run failed".format(key))
+                continue
+            measurements[key] = measurement
+            print "{0:<16}{1:>8}{2:>8}{3:>10}{4:>10.2f}{5:>12.0f}{6:>12.1f}{7:>14}{8}".format(
+                key, len(testcase["routers"]), len(testcase["flows"]), measurement["events"], measurement["wall_time"],
+                measurement["events_per_second"], measurement["peak_rss"], measurement["high_water_mark"],
+                "" if measurement["finished"] else "  (flows unfinished)")
+            previous = (baseline or {}).get(key)
+            if previous is not None:
+                for (field, worse) in [("events_per_second", lambda new, old: new < old * (1 - SCALING_TOLERANCE)),
+                                       ("peak_rss", lambda new, old: new > old * (1 + SCALING_TOLERANCE)),
+                                       ("high_water_mark", lambda new, old: new > old * (1 + SCALING_TOLERANCE))]:
+                    if worse(measurement[field], previous[field]):
+                        regressions.append("{0}: {1} {2:.1f} against {3:.1f}".format(key, field, measurement[field], previous[field]))
+    for regression in regressions:
+        print "regression in " + regression
+    return (measurements, regressions)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the network simulator.')
+    parser.add_argument('-f', '--fast', action="store_true", dest="fast_insteadof_reno", default=False, help="TCP Fast")
+    parser.add_argument('-s', '--scheduler', action="append", dest="schedulers", choices=sorted(SCHEDULERS), help="event queue implementation to run with, may be repeated (default heap)")
+    parser.add_argument('--routing', action="store", dest="routing", choices=sorted(ROUTING_TABLES), default="dynamic", help="routing mode to run with (default dynamic)")
+    parser.add_argument('--memory', action="store_true", dest="memory", default=False, help="only measure peak memory and allocations, with and without pooling")
+    parser.add_argument('--compare-routing', action="store_true", dest="compare_routing", default=False, help="only compare the throughput of every routing mode")
+    parser.add_argument('--compare-queue-disciplines', action="store_true", dest="compare_queue_disciplines", default=False, help="only compare every queue discipline under Reno and FAST")
+    parser.add_argument('--compare-fluid', action="store", dest="compare_fluid", default=None, metavar="FLOW_IDS", help="only compare simulating every flow as packets with modeling these comma-separated flows as fluid")
+    parser.add_argument('--scaling', action="store_true", dest="scaling", default=False, help="only run generated topologies at increasing sizes")
+    parser.add_argument('--topology', action="append", dest="topologies", choices=sorted(TOPOLOGIES), help="topology for --scaling, may be repeated (default all)")
+    parser.add_argument('--scaling-output', action="store", dest="scaling_output", default=None, help="write the --scaling results to this JSON file")
+    parser.add_argument('--scaling-baseline', action="store", dest="scaling_baseline", default=None, help="compare the --scaling results with those in this JSON file, exiting with status 1 on a regression")
+    parser.add_argument('--repeat', action="store", type=int, default=3, help="runs per measurement, best is reported")
+    parser.add_argument('testcase_file', action="store", nargs="?", default="testcase2.json")
+    results = parser.parse_args()
+
+    if results.memory:
+        benchmark_memory(results.testcase_file, results.fast_insteadof_reno)
+        sys.exit(0)
+    if results.scaling:
+        baseline = None
+        if results.scaling_baseline is not None:
+            with open(results.scaling_baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+        (measurements, regressions) = benchmark_scaling(results.fast_insteadof_reno, results.topologies or sorted(TOPOLOGIES), {"routing": results.routing}, baseline)
+        if results.scaling_output is not None:
+            with open(results.scaling_output, "w") as output_file:
+                json.dump(measurements, output_file, indent=2, sort_keys=True)
+        sys.exit(1 if regressions else 0)
+    if results.compare_queue_disciplines:
+        benchmark_queue_disciplines(results.testcase_file)
+        sys.exit(0)
+    if results.compare_fluid is not None:
+        benchmark_fluid(results.testcase_file, results.fast_insteadof_reno, results.compare_fluid.split(","))
+        sys.exit(0)
+    if results.compare_routing:
+        benchmark_routing(results.testcase_file, results.fast_insteadof_reno)
+        sys.exit(0)
+    for scheduler in results.schedulers or ["heap"]:
+        benchmark_simulation(results.testcase_file, results.fast_insteadof_reno, results.repeat, scheduler, results.routing)
+    benchmark_event_queue(results.testcase_file, results.fast_insteadof_reno, results.repeat)
+    benchmark_acknowledgements(results.testcase_file, results.fast_insteadof_reno)
@@ -1,10 +1,32 @@
 import sys
 from event import FlowWakeEvent
+from outstanding_segments import OutstandingSegments
 
 slow_start = "Slow Start"
 congestion_avoidance = "Congestion Avoidance"
 fast_recovery = "Fast Recovery"
 
+"""The retransmission timeout, in ms, when it is fixed, and before the first round trip
+   time is measured when it is adaptive"""
+INITIAL_TIMEOUT = 1000
+
+"""The least margin, in ms, an adaptive timeout allows above the smoothed round trip
+   time. RFC 6298 bounds the timeout itself below by one second, which is as long as
+   the fixed timeout. Instead, as in Linux, the variation term is at least 200 ms, since
+   queueing delay grows smoothly enough that the measured variation can be far smaller
+   than the rise in round trip time when a new flow starts."""
+MIN_TIMEOUT_MARGIN = 200
+
+"""The greatest adaptive timeout, in ms"""
+MAX_TIMEOUT = 60000
+
+"""The smallest congestion window, in packets, that halving the window leaves"""
+MIN_WINDOW = 1.0
+
+"""Gains of the smoothed round trip time and its variation (RFC 6298)"""
+RTT_GAIN = 1 / 8.0
+RTT_VARIATION_GAIN = 1 / 4.0
+
 class CongestionController:
     """Implements Congestion Control
 
@@ -12,8 +34,12 @@ class CongestionController:
         ssthresh: Slow Start Threshold
         cwnd: Congestion Window Size
         timeout: Time period after which TCP times out
-        not_acknowledged: Dictionary with IDs of unacknowledged packets as key,
-            and timestamp that packet was sent as value
+        adaptive_timeout: Whether timeout is estimated from measured round trip
+            times rather than fixed
+        smoothed_RTT: Smoothed round trip time, or None before the first sample
+        RTT_variation: Smoothed mean deviation of the round trip time
+        not_acknowledged: OutstandingSegments holding the duplicate number and
+            send timestamp of each unacknowledged packet, keyed by packet ID
         timed_out: List of packets whose acknowledgements haven't been received,
             and have now timed out
         duplicate_count: Counter of the number of duplicate acknowledgements
@@ -30,11 +56,14 @@ class CongestionController:
         clock: Clock for congestion controller
 
     """
-    def __init__(self):
+    def __init__(self, adaptive_timeout=False):
         self.ssthresh = 50
         self.cwnd = 2.0
-        self.timeout = 1000
-        self.not_acknowledged = dict()
+        self.timeout = INITIAL_TIMEOUT
+        self.adaptive_timeout = adaptive_timeout
+        self.smoothed_RTT = None
+        self.RTT_variation = None
+        self.not_acknowledged = OutstandingSegments()
         self.timed_out = []
         self.duplicate_count = 0
         self.last_ack_received = -1
@@ -46,6 +75,46 @@ class CongestionController:
         self.event_scheduler = None
         self.clock = None
 
+    '''Sends copy `dup_num` of packet `packet_id` and records it as unacknowledged'''
+    def send_copy(self, packet_id, dup_num):
+        self.not_acknowledged.add(packet_id, dup_num, self.clock.current_time)
+        self.flow.send_a_packet(packet_id, dup_num)
+
+    '''Moves unacknowledged packets that have timed out to timed_out, oldest first,
+       returning how many did'''
+    def collect_timed_out(self):
+        timed_out = self.not_acknowledged.pop_timed_out(self.clock.current_time, self.timeout)
+        self.timed_out.extend(timed_out)
+        return len(timed_out)
+
+    '''Halves the congestion window after a loss, keeping at least MIN_WINDOW packets.
+       Repeated timeouts would otherwise shrink it towards zero, and Reno's 1 / cwnd
+       increase in congestion avoidance then grows it without bound.'''
+    def halve_window(self):
+        self.cwnd = max(self.cwnd / 2, MIN_WINDOW)
+
+    '''Updates an adaptive timeout from the round trip time of copy `duplicate_num` of a
+       packet, sent at `sent_time`, as in Jacobson and Karels. By Karn's rule, the round
+       trip times of retransmitted copies are ignored, since their acknowledgements
+       can't be told apart from those of earlier copies.'''
+    def update_timeout(self, sent_time, duplicate_num):
+        if not self.adaptive_timeout or sent_time is None or duplicate_num > 0:
+            return
+        rtt = self.clock.current_time - sent_time
+        if self.smoothed_RTT is None:
+            self.smoothed_RTT = rtt
+            self.RTT_variation = rtt / 2
+        else:
+            self.RTT_variation += RTT_VARIATION_GAIN * (abs(self.smoothed_RTT - rtt) - self.RTT_variation)
+            self.smoothed_RTT += RTT_GAIN * (rtt - self.smoothed_RTT)
+        self.timeout = min(self.smoothed_RTT + max(4 * self.RTT_variation, MIN_TIMEOUT_MARGIN), MAX_TIMEOUT)
+
+    '''Doubles an adaptive timeout after packets time out, until a new round trip time
+       is measured'''
+    def back_off_timeout(self):
+        if self.adaptive_timeout:
+            self.timeout = min(self.timeout * 2, MAX_TIMEOUT)
+
     def acknowledgement_received(self, packet):
         sys.exit("Abstract method acknowledgement_received not implemented")
 
@@ -65,25 +134,27 @@ class CongestionControllerReno(CongestionController):
             fast recovery
     """
 
-    def __init__(self):
-        CongestionController.__init__(self)
+    def __init__(self, adaptive_timeout=False):
+        CongestionController.__init__(self, adaptive_timeout)
         self.state = slow_start
         self.FR_packet = None
 
     '''Processes an acknowledgement packet based on the state of TCP Reno'''
     def acknowledgement_received(self, packet):
         
-        # Check for any unacknowledged packets that have timed out
-        for (packet_id, dup_num) in self.not_acknowledged.keys():
-            sent_time = self.not_acknowledged[(packet_id, dup_num)]
-            time_diff = self.clock.current_time - sent_time
-            if time_diff > self.timeout:
-                del self.not_acknowledged[(packet_id, dup_num)]
-                self.timed_out.append((packet_id, dup_num))
+        # Remove received packet from list of unacknowledged packets
+        sent_time = self.not_acknowledged.remove(packet.identifier, packet.duplicate_num)
+        self.update_timeout(sent_time, packet.duplicate_num)
+
+        # Check for any unacknowledged packets that have timed out. This comes after
+        # the round trip time is measured, as in FAST, so that the backoff lasts
+        # until the next measurement rather than being undone by this one
+        if self.collect_timed_out() > 0:
+            self.back_off_timeout()
         # If we have packets that have timed out, we want to retransmit these
         if len(self.timed_out) > 0:
             self.retransmit = True
-            self.cwnd /= 2
+            self.halve_window()
         else:
             self.retransmit = False
                 
@@ -91,10 +162,6 @@ class CongestionControllerReno(CongestionController):
         if self.wake_event != None:
             self.event_scheduler.cancel_event(self.wake_event)
             
-        # Remove received packet from list of unacknowledged packets
-        if (packet.identifier, packet.duplicate_num) in self.not_acknowledged.keys():
-            del self.not_acknowledged[(packet.identifier, packet.duplicate_num)]
-        
         # In slow start phase, increase congestion window size by 1
         if self.state == slow_start:
             self.cwnd += 1
@@ -109,8 +176,8 @@ class CongestionControllerReno(CongestionController):
                 # After 3 duplicate acknowledgements, if the packet has not
                 # already been received, halve the congestion window size and
                 # move into fast recovery phase
-                if (self.duplicate_count == 3) and (packet.next_id in [key[0] for key in self.not_acknowledged.keys()]):
-                    self.cwnd /= 2
+                if (self.duplicate_count == 3) and (packet.next_id in self.not_acknowledged):
+                    self.halve_window()
                     self.ssthresh = self.cwnd
                     self.state = fast_recovery
             # This is not a duplicate acknowledgement
@@ -144,25 +211,21 @@ class CongestionControllerReno(CongestionController):
                 # Retransmit timed out packets
                 while (len(self.not_acknowledged) < self.cwnd) and (len(self.timed_out) > 0):
                     (packet_id, dup_num) = self.timed_out[0]
-                    self.not_acknowledged[(packet_id, dup_num + 1)] = self.clock.current_time
-                    self.flow.send_a_packet(packet_id, dup_num + 1)
+                    self.send_copy(packet_id, dup_num + 1)
                     del self.timed_out[0]
             # Send packets, without exceeding congestion window size
             else:
                 while (len(self.not_acknowledged) < self.cwnd) and (self.window_start * 1024 < self.flow.total):
-                    self.not_acknowledged[(self.window_start, 0)] = self.clock.current_time
-                    self.flow.send_a_packet(self.window_start, 0)
+                    self.send_copy(self.window_start, 0)
                     self.window_start += 1
         # Send dropped packet
         else:
             packet_id = self.last_ack_received
             self.FR_packet = packet_id
-            keys = [key for key in self.not_acknowledged.keys() if key[0] == packet_id]
-            if len(keys) == 1:
-                dup_num = keys[0][1]
-                del self.not_acknowledged[(packet_id, dup_num)]
-                self.not_acknowledged[(packet_id, dup_num + 1)] = self.clock.current_time
-                self.flow.send_a_packet(packet_id, dup_num + 1)
+            dup_num = self.not_acknowledged.duplicate_num(packet_id)
+            if dup_num is not None:
+                self.not_acknowledged.remove(packet_id, dup_num)
+                self.send_copy(packet_id, dup_num + 1)
     
     '''Start sending packets when congestion control first begins or if the flow times out'''
     def wake(self):
@@ -170,16 +233,12 @@ class CongestionControllerReno(CongestionController):
         if self.state == fast_recovery:
             self.state = slow_start
         else:       
-            self.cwnd /= 2
+            self.halve_window()
         # Keep track of timed out packets
-        for (packet_id, dup_num) in self.not_acknowledged.keys():
-            sent_time = self.not_acknowledged[(packet_id, dup_num)]
-            time_diff = self.clock.current_time - sent_time
-            if time_diff > self.timeout:
-                del self.not_acknowledged[(packet_id, dup_num)]
-                self.timed_out.append((packet_id, dup_num))
+        self.collect_timed_out()
         if len(self.timed_out) > 0:
             self.retransmit = True
+            self.back_off_timeout()
         else:
             self.retransmit = False   
         self.send_packet()
@@ -198,8 +257,8 @@ class CongestionControllerFast(CongestionController):
         base_RTT: The minimum RTT encountered
     """
 
-    def __init__(self):
-        CongestionController.__init__(self)
+    def __init__(self, adaptive_timeout=False):
+        CongestionController.__init__(self, adaptive_timeout)
         self.alpha = 50.0
         self.base_RTT = -1
     
@@ -211,23 +270,25 @@ class CongestionControllerFast(CongestionController):
         # Check if this is a duplicate acknowledgement
         if self.last_ack_received == packet.next_id:
             self.duplicate_count += 1
-            keys = [key for key in self.not_acknowledged.keys() if key[0] == packet.next_id]
             # After 3 duplicate acknowledgements, if the packet has not
             # already been received, it has been dropped so it needs to be re-sent
-            if (self.duplicate_count == 3) and (len(keys) > 0):
-                expected = keys[0]
-                del self.not_acknowledged[(packet.next_id, expected[1])]
-                self.timed_out.append((packet.next_id, expected[1]))
+            if (self.duplicate_count == 3) and (packet.next_id in self.not_acknowledged):
+                dup_num = self.not_acknowledged.duplicate_num(packet.next_id)
+                self.not_acknowledged.remove(packet.next_id, dup_num)
+                self.timed_out.append((packet.next_id, dup_num))
         else:
             # reset duplicate count since the chain of dupACKS is broken
             self.duplicate_count = 0
 
         self.last_ack_received = packet.next_id
 
+        # Remove received packet from list of unacknowledged packets
+        sent_time = self.not_acknowledged.remove(packet.identifier, packet.duplicate_num)
+        self.update_timeout(sent_time, packet.duplicate_num)
         # This acknowledgement is for an unacknowledged packet
-        if (packet.identifier, packet.duplicate_num) in self.not_acknowledged.keys():
+        if sent_time is not None:
             # calculate RTT of this packet
-            rtt = self.clock.current_time - self.not_acknowledged[(packet.identifier, packet.duplicate_num)]
+            rtt = self.clock.current_time - sent_time
             # first packet, initialize base_RTT
             if self.base_RTT == -1:
                 self.base_RTT = rtt
@@ -236,19 +297,13 @@ class CongestionControllerFast(CongestionController):
             # update minimum RTT
             if rtt < self.base_RTT:
                 self.base_RTT = rtt
-            # Remove received packet from list of unacknowledged packets
-            del self.not_acknowledged[(packet.identifier, packet.duplicate_num)]
 
         # Check for any unacknowledged packets that have timed out
-        for (packet_id, dup_num) in self.not_acknowledged.keys():
-            sent_time = self.not_acknowledged[(packet_id, dup_num)]
-            time_diff = self.clock.current_time - sent_time
-            if time_diff > self.timeout:
-                del self.not_acknowledged[(packet_id, dup_num)]
-                self.timed_out.append((packet_id, dup_num))
+        if self.collect_timed_out() > 0:
+            self.back_off_timeout()
         if len(self.timed_out) > 0:
             self.retransmit = True
-            self.cwnd /= 2
+            self.halve_window()
         else:
             self.retransmit = False
 
@@ -261,31 +316,25 @@ class CongestionControllerFast(CongestionController):
             # send timed out packets. Their duplicate number will be incremented
             while (len(self.not_acknowledged) < self.cwnd) and (len(self.timed_out) > 0):
                 (packet_id, dup_num) = self.timed_out[0]
-                self.not_acknowledged[(packet_id, dup_num + 1)] = self.clock.current_time
-                self.flow.send_a_packet(packet_id, dup_num + 1)
+                self.send_copy(packet_id, dup_num + 1)
                 del self.timed_out[0]
         else:
             # send new packets
             while (len(self.not_acknowledged) < self.cwnd) and (self.window_start * 1024 < self.flow.total):
-                self.not_acknowledged[(self.window_start, 0)] = self.clock.current_time
-                self.flow.send_a_packet(self.window_start, 0)
+                self.send_copy(self.window_start, 0)
                 self.window_start += 1
 
     '''Start sending packets when congestion control first begins or if the flow times out'''
     def wake(self):
         # Check for any unacknowledged packets that have timed out
-        for packet_id in self.not_acknowledged.keys():
-            sent_time = self.not_acknowledged[packet_id]
-            time_diff = self.clock.current_time - sent_time
-            if time_diff > self.timeout:
-                del self.not_acknowledged[packet_id]
-                self.timed_out.append(packet_id)
-            if len(self.timed_out) > 0:
-                self.retransmit = True
-            else:
-                self.retransmit = False
+        self.collect_timed_out()
+        if len(self.timed_out) > 0:
+            self.retransmit = True
+            self.back_off_timeout()
+        else:
+            self.retransmit = False
                 
-        self.cwnd /= 2
+        self.halve_window()
         self.send_packet() 
         self.wake_event = self.event_scheduler.delay_event(self.timeout, FlowWakeEvent(self.flow))    
 
@@ -3,19 +3,27 @@
 # The Simulation.add_event and Simulation.get_next_event functions are good
 
 import sys
+from pooling import pooled
 
-class Event:
+class Event(object):
     """Function implemented by concrete base classes of Event to perform their function.
+       Events use __slots__ rather than an instance dictionary, since one is created for
+       nearly every packet sent. PacketArrivalEvents and LinkReadyEvents may also be
+       reused once performed; see pooling.py.
 
     Attributes:
         is_canceled: records whether an event has been canceled
     """
+    __slots__ = ("is_canceled",)
+    _free_list = None
+
     def __init__(self):
         self.is_canceled = False
 
     def perform(self):
         sys.exit("Abstract method perform not implemented")
 
+@pooled
 class PacketArrivalEvent(Event):
     """This event represents the arrival of a packet
        to the other end of a link.
@@ -25,6 +33,7 @@ class PacketArrivalEvent(Event):
         device: the Device on the other end of the link to which it's traveling
         from_link: the Link on which the packet is arriving
     """
+    __slots__ = ("packet", "from_link", "device")
     def __init__(self, packet, device, from_link):
         Event.__init__(self)
         self.packet = packet
@@ -34,6 +43,19 @@ class PacketArrivalEvent(Event):
     def perform(self):
         self.device.handle_packet(self.packet, self.from_link)
 
+@pooled
+class TrainArrivalEvent(PacketArrivalEvent):
+    """The arrival of a packet that a batching link sent as part of a packet
+       train. The link first catches up on the bookkeeping for the packets of
+       the train that have started sending by now.
+    """
+    __slots__ = ()
+
+    def perform(self):
+        self.from_link.retire_train()
+        self.device.handle_packet(self.packet, self.from_link)
+
+@pooled
 class LinkReadyEvent(Event):
     """This event represents the delay between when a links
         sends a given packet and when it can again send another
@@ -42,6 +64,7 @@ class LinkReadyEvent(Event):
     Attributes:
         link: The Link that's busy until the next wake
     """
+    __slots__ = ("link",)
 
     def __init__(self, link):
         Event.__init__(self)
@@ -60,6 +83,7 @@ class FlowWakeEvent(Event):
     Attributes:
         flow: the Flow that is being started
     """
+    __slots__ = ("flow",)
     def __init__(self, flow):
         Event.__init__(self)
         self.flow = flow
@@ -74,6 +98,7 @@ class RoutingUpdateEvent(Event):
     Attributes:
         host: the host for which the routing information needs be updated
     """
+    __slots__ = ("host",)
     def __init__(self, host):
         Event.__init__(self)
         self.host = host
@@ -84,6 +109,7 @@ class RoutingUpdateEvent(Event):
 class PrintElapsedSimulationTimeEvent(Event):
     """This event is scheduled every 0.2 seconds (in simulation time) and updates
         the terminal with the amount of time that has elapsed."""
+    __slots__ = ("time", "event_queue")
 
     def __init__(self, time, event_queue):
         Event.__init__(self)
@@ -93,3 +119,18 @@ class PrintElapsedSimulationTimeEvent(Event):
     def perform(self):
         sys.stderr.write('\rSimulation time: {0:.1f}s'.format(self.time / 1000.0))
         self.event_queue.delay_event(200, PrintElapsedSimulationTimeEvent(self.time + 200, self.event_queue))
+
+class FluidUpdateEvent(Event):
+    """This event advances every fluid flow by one timestep, and schedules the next.
+
+    Attributes:
+        model: the FluidModel to update
+    """
+    __slots__ = ("model",)
+
+    def __init__(self, model):
+        Event.__init__(self)
+        self.model = model
+
+    def perform(self):
+        self.model.update()
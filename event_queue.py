@@ -1,37 +1,297 @@
-import Queue, heapq
+import heapq, itertools
+from bisect import insort
+
+"""The fraction of the heap that canceled events may occupy before the heap is rebuilt without them"""
+COMPACTION_THRESHOLD = 0.5
+
+"""Heaps smaller than this are never compacted, since skipping their canceled events on dequeue is cheap"""
+COMPACTION_MIN_SIZE = 256
+
+"""The smallest number of buckets a calendar queue shrinks to"""
+CALENDAR_MIN_BUCKETS = 16
+
+"""How many of the earliest events a calendar queue samples to choose its bucket width when resizing"""
+CALENDAR_WIDTH_SAMPLE = 25
 
 class EventQueue:
     """A queue that allows scheduling of events at a given time, and dequeues events in the correct
        order, updating the global clock.
-        
+
+       The queue is a plain heap of (time, sequence, event) tuples. The simulation is single
+       threaded, so no locking is needed, and the sequence number breaks ties between events
+       scheduled for the same time in the order they were scheduled (FIFO), which keeps runs
+       deterministic without ever comparing Event objects.
+
+       Canceled events stay in the heap until they reach its head, unless they come to make up
+       more than COMPACTION_THRESHOLD of it, in which case the heap is rebuilt without them.
+
         Attributes:
-        _priority_queue: The interal queue used to store the events.
+        _priority_queue: The interal heap used to store the events.
+        _sequence: Counter producing the tie-breaking sequence numbers.
+        canceled_pending: Number of canceled events still sitting in the heap
+        canceled_skipped: Number of canceled events discarded on reaching the head of the heap
+        canceled_compacted: Number of canceled events discarded by rebuilding the heap
+        compactions: Number of times the heap has been rebuilt
+        high_water_mark: The most entries the queue has held, including canceled events,
+            as measured before each dequeue
     """
 
     def __init__(self, clock):
-        self._priority_queue = Queue.PriorityQueue()
+        self._priority_queue = []
+        self._sequence = itertools.count()
         self.clock = clock
+        self.canceled_pending = 0
+        self.canceled_skipped = 0
+        self.canceled_compacted = 0
+        self.compactions = 0
+        self.high_water_mark = 0
+
+    """The number of entries in the heap, including canceled events not yet discarded."""
+    def __len__(self):
+        return len(self._priority_queue)
+
+    # A checkpoint (see checkpoint.py) stores the sequence counter as the next number it
+    # would produce, since itertools.count can't be pickled
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_sequence"] = next(self._sequence)
+        self._sequence = itertools.count(state["_sequence"])
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._sequence = itertools.count(state["_sequence"])
+
+    """The number of scheduled events that have not been canceled."""
+    def live_count(self):
+        return len(self) - self.canceled_pending
 
     """Schedules `event` to occur at `time` and returns an event identifier."""
     def schedule_event(self, time, event):
         assert time >= self.clock.current_time
-        self._priority_queue.put((time, event))
+        heapq.heappush(self._priority_queue, (time, next(self._sequence), event))
         return event
 
+    # Adds an entry to the heap, for TrainOrdering
+    def _add(self, entry):
+        heapq.heappush(self._priority_queue, entry)
+
     """Schedules `event` to occur at `delay` milliseconds after the current time
        and returns an event identifier."""
     def delay_event(self, delay, event):
         return self.schedule_event(self.clock.current_time + delay, event)
 
-    """Cancels the event with the given `event_identifier` with O(1) time complexity."""
+    """Cancels the event with the given `event_identifier` with O(1) amortized time complexity."""
+    # Events must still be scheduled when they are canceled
     def cancel_event(self, event):
+        if event.is_canceled:
+            return
         event.is_canceled = True
+        self.canceled_pending += 1
+        size = len(self)
+        if size >= COMPACTION_MIN_SIZE and self.canceled_pending > size * COMPACTION_THRESHOLD:
+            self._compact()
+
+    # Rebuilds the heap without its canceled events. Sequence numbers are
+    # unique, so the order of the remaining events is unchanged.
+    def _compact(self):
+        size = len(self._priority_queue)
+        self._priority_queue = [entry for entry in self._priority_queue if not entry[-1].is_canceled]
+        heapq.heapify(self._priority_queue)
+        self.canceled_compacted += size - len(self._priority_queue)
+        self.canceled_pending = 0
+        self.compactions += 1
+
+    """Returns the time of the next event that has not been canceled, without
+       dequeueing it, or None if no events remain."""
+    def next_event_time(self):
+        queue = self._priority_queue
+        while queue and queue[0][-1].is_canceled:
+            heapq.heappop(queue)
+            self.canceled_pending -= 1
+            self.canceled_skipped += 1
+        return queue[0][0] if queue else None
 
-    """Removes next event from queue, updates the global time, and returns the event."""
+    """Removes next event from queue, updates the global time, and returns the event.
+       Returns None once no events remain."""
     def dequeue_next_event(self):
-        (time, event) = (None, None)
-        while event is None or event.is_canceled:
-            (time, event) = self._priority_queue.get_nowait()
+        queue = self._priority_queue
+        if len(queue) > self.high_water_mark:
+            self.high_water_mark = len(queue)
+        while queue:
+            entry = heapq.heappop(queue)
+            (time, event) = (entry[0], entry[-1])
+            if event.is_canceled:
+                self.canceled_pending -= 1
+                self.canceled_skipped += 1
+                continue
+            assert time >= self.clock.current_time
+            self.clock.current_time = time
+            return event
+        return None
+
+class CalendarEventQueue(EventQueue):
+    """An EventQueue backed by a calendar queue (R. Brown, 1988) instead of a heap.
+
+       Time is divided into days of `_width` milliseconds, and the days are dealt out in turn
+       to a ring of buckets, so each bucket holds the events of one day in every year. Each
+       bucket is a sorted list. Nearly every event in the simulation is scheduled a short,
+       similar delay after the current time, so once the width matches the typical spacing of
+       events the earliest one is found in the current or next few buckets, giving O(1)
+       amortized scheduling and dequeueing. The queue doubles or halves its bucket count as it
+       grows or shrinks, choosing a new width from the spacing of its earliest events.
+
+       Entries are the same (time, sequence, event) tuples the heap uses, so events are
+       dequeued in exactly the same order and simulations produce identical results.
+
+        Attributes:
+        _buckets: The ring of sorted buckets
+        _width: The length of a day, in milliseconds
+        _day: The absolute day number (time // width) of the last dequeued event
+        _size: The number of entries in the buckets, including canceled events
+    """
+
+    def __init__(self, clock):
+        EventQueue.__init__(self, clock)
+        self._priority_queue = None  # replaced by the buckets
+        self._buckets = [[] for _ in range(CALENDAR_MIN_BUCKETS)]
+        self._width = 1.0
+        self._day = int(clock.current_time // self._width)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _insert(self, entry):
+        insort(self._buckets[int(entry[0] // self._width) % len(self._buckets)], entry)
+
+    """Schedules `event` to occur at `time` and returns an event identifier."""
+    def schedule_event(self, time, event):
         assert time >= self.clock.current_time
-        self.clock.current_time = time
+        self._add((time, next(self._sequence), event))
         return event
+
+    def _add(self, entry):
+        self._insert(entry)
+        self._size += 1
+        if self._size > 2 * len(self._buckets):
+            self._resize(2 * len(self._buckets))
+
+    # Redistributes every entry over `bucket_count` buckets, with a day as
+    # long as three times the average spacing of the earliest events.
+    def _resize(self, bucket_count):
+        entries = sorted(entry for bucket in self._buckets for entry in bucket)
+        sample = entries[:CALENDAR_WIDTH_SAMPLE]
+        if len(sample) > 1 and sample[-1][0] > sample[0][0]:
+            self._width = 3.0 * (sample[-1][0] - sample[0][0]) / (len(sample) - 1)
+        self._buckets = [[] for _ in range(bucket_count)]
+        for entry in entries:
+            self._buckets[int(entry[0] // self._width) % bucket_count].append(entry)
+        self._day = int(self.clock.current_time // self._width)
+
+    # Removes and returns the earliest entry, or None if the queue is empty.
+    def _pop(self):
+        if self._size == 0:
+            return None
+        buckets = self._buckets
+        bucket_count = len(buckets)
+        width = self._width
+        day = self._day
+        # Look for an entry due in the current year, one day at a time
+        for _ in range(bucket_count):
+            bucket = buckets[day % bucket_count]
+            if bucket and int(bucket[0][0] // width) <= day:
+                break
+            day += 1
+        else:
+            # Nothing is due this year, so jump straight to the earliest entry
+            bucket = min((bucket for bucket in buckets if bucket), key=lambda bucket: bucket[0])
+            day = int(bucket[0][0] // width)
+        self._day = day
+        self._size -= 1
+        entry = bucket.pop(0)
+        if self._size < len(buckets) // 2 and len(buckets) > CALENDAR_MIN_BUCKETS:
+            self._resize(len(buckets) // 2)
+        return entry
+
+    """Returns the time of the next event that has not been canceled, without
+       dequeueing it, or None if no events remain."""
+    def next_event_time(self):
+        while True:
+            entry = self._pop()
+            if entry is None:
+                return None
+            if entry[-1].is_canceled:
+                self.canceled_pending -= 1
+                self.canceled_skipped += 1
+                continue
+            # Put it back, and move the calendar back to the current time's day, since
+            # _pop moved it to the entry's day and events may still be scheduled before it
+            self._insert(entry)
+            self._size += 1
+            self._day = int(self.clock.current_time // self._width)
+            return entry[0]
+
+    # Removes the canceled events from every bucket. Buckets stay sorted.
+    def _compact(self):
+        size = self._size
+        self._buckets = [[entry for entry in bucket if not entry[-1].is_canceled] for bucket in self._buckets]
+        self._size = sum(len(bucket) for bucket in self._buckets)
+        self.canceled_compacted += size - self._size
+        self.canceled_pending = 0
+        self.compactions += 1
+
+    """Removes next event from queue, updates the global time, and returns the event.
+       Returns None once no events remain."""
+    def dequeue_next_event(self):
+        if self._size > self.high_water_mark:
+            self.high_water_mark = self._size
+        while True:
+            entry = self._pop()
+            if entry is None:
+                return None
+            (time, event) = (entry[0], entry[-1])
+            if event.is_canceled:
+                self.canceled_pending -= 1
+                self.canceled_skipped += 1
+                continue
+            assert time >= self.clock.current_time
+            self.clock.current_time = time
+            return event
+
+class TrainOrdering:
+    """Makes an event queue order the events for the same time by the simulated time they
+       were scheduled at, and only then by their sequence number, so that a link sending
+       a packet train (see Link._send_train) can schedule each packet's arrival as of the
+       packet's own start. Entries are then (time, scheduled at, sequence, event). Events
+       are otherwise scheduled at the current time, which gives the same order as the
+       sequence number alone. Only simulations with batching links use it, so that the
+       entries of every other run stay (time, sequence, event).
+    """
+
+    """Schedules `event` to occur at `time` and returns an event identifier. Among events
+       for the same time it is performed as if it had been scheduled at `scheduled_at`,
+       which defaults to the current time."""
+    def schedule_event(self, time, event, scheduled_at=None):
+        now = self.clock.current_time
+        assert time >= now
+        self._add((time, now if scheduled_at is None else scheduled_at, next(self._sequence), event))
+        return event
+
+class TrainEventQueue(TrainOrdering, EventQueue):
+    """An EventQueue whose entries record when each event was scheduled (see TrainOrdering)."""
+
+class CalendarTrainEventQueue(TrainOrdering, CalendarEventQueue):
+    """A CalendarEventQueue whose entries record when each event was scheduled (see TrainOrdering)."""
+
+"""The event queue implementations that a simulation can be run with, keyed by name"""
+SCHEDULERS = {
+    "heap": EventQueue,
+    "calendar": CalendarEventQueue,
+}
+
+"""The implementation of each scheduler used by simulations with batching links"""
+TRAIN_SCHEDULERS = {
+    "heap": TrainEventQueue,
+    "calendar": CalendarTrainEventQueue,
+}
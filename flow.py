@@ -14,6 +14,7 @@ class Flow:
         event_scheduler: A reference to the global event scheduler
         complete: This flow has successfully transmitted all its data
         controller: Instance of Congestion Controller.
+        completion_callback: Called with the flow once it has transmitted all its data
     """
 
     def __init__(self, identifier, source, destination, amount, start_time, controller):
@@ -22,13 +23,14 @@ class Flow:
         self.destination = destination
         self.amount = amount
         self.total = amount
-	self.done = False
+        self.done = False
         self.start_time = start_time
         self.event_scheduler = None
         self.logger = None
         self.ack_tracker = PacketTracker()
         assert isinstance(controller, CongestionController)
         self.controller = controller
+        self.completion_callback = None
 
     def __str__(self):
         return ("Flow ID      " + self.identifier + "\n"
@@ -66,7 +68,9 @@ class Flow:
         self.controller.acknowledgement_received(packet)
         if (len(self.controller.not_acknowledged) == 0) and (not self.done):
             self.logger.log_flow_completed(self.identifier)
-	    self.done = True
+            self.done = True
+            if self.completion_callback is not None:
+                self.completion_callback(self)
 
     def completed(self):
         return self.done
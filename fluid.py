@@ -0,0 +1,264 @@
+from __future__ import division
+from event import FluidUpdateEvent
+from router import Router
+from congestion_controller import MIN_WINDOW
+
+"""The time, in ms, between updates of the fluid flows"""
+FLUID_TIMESTEP = 10.0
+
+"""The size, in bytes, of the packets a fluid flow's window is counted in, the same as
+   a payload packet"""
+FLUID_PACKET_SIZE = 1024
+
+"""The congestion window and slow start threshold, in packets, that fluid flows start
+   with, the same as CongestionController"""
+INITIAL_WINDOW = 2.0
+INITIAL_SSTHRESH = 50
+
+"""FAST's alpha, the same as CongestionControllerFast"""
+FAST_ALPHA = 50.0
+
+"""The least share of a saturated link's rate that fluid flows leave to packets. Fluid
+   and packets otherwise share a saturated link in proportion to how much of each it
+   has to send, so a packet arriving at a link only fluid had been using would never
+   be sent."""
+MIN_PACKET_SHARE = 0.01
+
+class FluidFlow:
+    """A flow modeled as a rate rather than as individual packets. Every timestep its
+       window follows the fluid limit of the packet-level controller: under TCP Reno
+       it doubles every round trip in slow start and then grows by a packet every round
+       trip, and under FAST each acknowledgement sets it to w * base_RTT / RTT + alpha.
+       It is halved for every packet the flow would have lost. The flow sends at one
+       window per round trip.
+
+    Attributes:
+        identifier: The unique identification of the flow
+        source: The source host
+        destination: The destination host
+        amount: The amount of data left to deliver, in bytes
+        total: The amount of data to deliver, in bytes
+        start_time: The time at which the flow begins, in milliseconds
+        fast_insteadof_reno: Whether the window follows FAST rather than TCP Reno
+        alpha: FAST's alpha
+        window: The congestion window, in packets
+        ssthresh: Slow start threshold, in packets
+        slow_start: Whether a Reno window is in slow start
+        base_RTT: The least round trip time seen, or None before the first
+        rtt: The round trip time at the last update, in ms, or None before the first
+        rate: The rate the flow sends at, in bytes per ms
+        path: The links from the source to the destination at the last update, or
+            None while the routers know no route
+        hop_rates: The rate of the flow arriving at each link of the path, in bytes per
+            ms. Each is what left the link before it at the last update.
+        started: Whether the flow has started
+        done: Whether all the data has been delivered
+        completion_callback: Called with the flow once it has delivered all its data
+        logger: the Logger used by the flow
+    """
+
+    def __init__(self, identifier, source, destination, amount, start_time, fast_insteadof_reno):
+        self.identifier = identifier
+        self.source = source
+        self.destination = destination
+        self.amount = amount
+        self.total = amount
+        self.start_time = start_time
+        self.fast_insteadof_reno = fast_insteadof_reno
+        self.alpha = FAST_ALPHA
+        self.window = INITIAL_WINDOW
+        self.ssthresh = INITIAL_SSTHRESH
+        self.slow_start = True
+        self.base_RTT = None
+        self.rtt = None
+        self.rate = 0.0
+        self.path = None
+        self.hop_rates = []
+        self.started = False
+        self.done = False
+        self.completion_callback = None
+        self.logger = None
+
+    def __str__(self):
+        return ("Fluid flow   " + self.identifier + "\n"
+                "source:      " + self.source.identifier + "\n"
+                "destination: " + self.destination.identifier + "\n"
+                "amount:      " + str(self.amount) + " bytes\n"
+                "start_time:   " + str(self.start_time) + " ms\n")
+
+    def set_logger(self, logger):
+        self.logger = logger
+
+    def completed(self):
+        return self.done
+
+    """Records `delivered` bytes as having reached the destination."""
+    def deliver(self, delivered):
+        self.amount -= delivered
+        if self.amount <= 0 and not self.done:
+            self.amount = 0
+            self.rate = 0.0
+            self.logger.log_flow_completed(self.identifier)
+            self.done = True
+            if self.completion_callback is not None:
+                self.completion_callback(self)
+
+    """Advances the window over `timestep` ms in which the flow saw a round trip time
+       of `rtt` ms and lost the fraction `loss` of what it sent, then sets the rate."""
+    def update_window(self, timestep, rtt, loss):
+        sent = self.rate * timestep / FLUID_PACKET_SIZE
+        if self.base_RTT is None or rtt < self.base_RTT:
+            self.base_RTT = rtt
+        if self.fast_insteadof_reno:
+            acknowledged = sent * (1 - loss)
+            if rtt > self.base_RTT:
+                # Repeating w = w * base_RTT / rtt + alpha approaches its fixed point
+                # geometrically, so the acknowledgements of a step are applied at once
+                target = self.alpha * rtt / (rtt - self.base_RTT)
+                self.window = target + (self.window - target) * (self.base_RTT / rtt) ** acknowledged
+            else:
+                self.window += self.alpha * acknowledged
+        elif self.slow_start:
+            self.window *= 2 ** (timestep / rtt)
+            if self.window >= self.ssthresh:
+                self.slow_start = False
+        else:
+            self.window += timestep / rtt
+        losses = sent * loss
+        if losses > 0:
+            self.window = max(self.window * 0.5 ** losses, MIN_WINDOW)
+            if self.slow_start:
+                self.slow_start = False
+                self.ssthresh = self.window
+        self.rtt = rtt
+        # Don't send more in a step than is left to deliver
+        self.rate = min(self.window * FLUID_PACKET_SIZE / rtt, self.amount / timestep)
+
+class FluidModel:
+    """Advances every fluid flow one timestep at a time, with a single FluidUpdateEvent
+       per step however many flows there are.
+
+       Each step, every link on a fluid flow's path is offered the sum of the fluid
+       flows' rates arriving at it. If the link can't send all the fluid and packets
+       it has for the step, buffered or arriving, it sends each in proportion to how
+       much of it there is, as a FIFO queue would; the packets arriving are taken to
+       be those that arrived during the last step. The fluid that isn't sent waits in
+       the link's buffer, taking space from packets, and whatever doesn't fit is lost.
+       Packets are sent at the rate the fluid leaves them (see Link.fluid_rate).
+
+       Each flow's round trip time is the propagation delay there and back plus the
+       time to send everything buffered on its path, fluid and packets alike. What a
+       flow sends reaches each link one step after leaving the previous one, and the
+       acknowledgements of fluid flows aren't modeled.
+
+    Attributes:
+        flows: The FluidFlows
+        timestep: The time between updates, in ms
+        links: Every link that has carried fluid
+        event_scheduler: The event scheduler the updates are scheduled with
+        logger: the Logger used by the model
+    """
+
+    def __init__(self, flows, event_scheduler, logger, timestep=FLUID_TIMESTEP):
+        self.flows = sorted(flows, key=lambda flow: flow.identifier)
+        self.timestep = timestep
+        self.links = []
+        self.event_scheduler = event_scheduler
+        self.logger = logger
+        if self.flows:
+            first_start = min(flow.start_time for flow in self.flows)
+            self.event_scheduler.delay_event(first_start, FluidUpdateEvent(self))
+
+    # The links from the flow's source to its destination as the routers currently
+    # route it, or None if they don't know a route yet
+    def _path(self, flow):
+        (device, link) = (flow.source, flow.source.link)
+        path = []
+        while link is not None and link not in path:
+            path.append(link)
+            device = link.other_device(device)
+            if device is flow.destination:
+                return path
+            if not isinstance(device, Router):
+                return None
+            link = device.next_link(flow.destination.identifier, flow.identifier)
+        return None
+
+    # Updates the fluid in a link's buffer, which is offered `offered` bytes per ms of
+    # fluid, and returns the fraction of the offered fluid that left the link and the
+    # fraction that was lost
+    def _update_link(self, link, offered, now):
+        timestep = self.timestep
+        buffer = link.buffer
+        capacity = link.rate * timestep
+        # The bytes of fluid and of packets to send this step: what is buffered, and
+        # what arrives, taking the packets sent to the link last step as the estimate
+        fluid = buffer.fluid_backlog + offered * timestep
+        packets = buffer.capacity - buffer.available_space - buffer.fluid_backlog + link.packet_bytes
+        packets = max(packets, MIN_PACKET_SHARE * capacity)
+        link.packet_bytes = 0
+        # A FIFO queue sends each in proportion to what it holds of it
+        if fluid + packets > capacity:
+            served = capacity * fluid / (fluid + packets)
+        else:
+            served = fluid
+        backlog = fluid - served
+        served /= timestep
+        # The space not taken by packets
+        room = buffer.available_space + buffer.fluid_backlog
+        lost = max(backlog - room, 0)
+        buffer.set_fluid_backlog(int(round(min(backlog, room))), now)
+        link.fluid_rate = served
+        if offered <= 0:
+            return (0.0, 0.0)
+        return (served / offered, lost / (offered * timestep))
+
+    """Advances every fluid flow and the fluid in every link one timestep, and schedules
+       the next update until every fluid flow is done and the fluid has drained."""
+    def update(self):
+        now = self.event_scheduler.clock.current_time
+        for flow in self.flows:
+            if not flow.started and flow.start_time <= now:
+                flow.started = True
+                self.logger.log_flow_started(flow.identifier)
+        active = [flow for flow in self.flows if flow.started and not flow.done]
+
+        offered = dict((link, 0.0) for link in self.links)
+        for flow in active:
+            path = self._path(flow)
+            if path != flow.path:
+                flow.path = path
+                flow.hop_rates = [flow.rate] * len(path) if path is not None else []
+            for (link, rate) in zip(flow.path or [], flow.hop_rates):
+                if link not in offered:
+                    self.links.append(link)
+                    offered[link] = 0.0
+                offered[link] += rate
+
+        outcomes = dict((link, self._update_link(link, offered[link], now)) for link in self.links)
+
+        for flow in active:
+            if flow.path is None:
+                continue
+            rtt = 0.0
+            survived = 1.0
+            departures = []
+            for (link, rate) in zip(flow.path, flow.hop_rates):
+                (passed, lost) = outcomes[link]
+                departures.append(rate * passed)
+                survived *= 1 - lost
+                rtt += 2 * link.delay + (link.buffer.capacity - link.buffer.available_space) / link.rate
+            # The model only sees the network once a step, so a round trip is taken to
+            # last at least one, which also keeps empty zero-delay paths from dividing by 0
+            rtt = max(rtt, self.timestep)
+            flow.deliver(departures[-1] * self.timestep)
+            if not flow.done:
+                flow.update_window(self.timestep, rtt, 1 - survived)
+                flow.hop_rates = [flow.rate] + departures[:-1]
+            self.logger.log_fluid_flow(flow.identifier, flow.rate, flow.window, rtt, flow.total - flow.amount, flow.amount)
+
+        if any(not flow.done for flow in self.flows) or any(link.buffer.fluid_backlog > 0 for link in self.links):
+            self.event_scheduler.delay_event(self.timestep, FluidUpdateEvent(self))
+        else:
+            for link in self.links:
+                link.fluid_rate = 0.0
@@ -1,8 +1,9 @@
 import sys
 from device import Device
-from packet import StandardPacket, PayloadPacket, AcknowledgementPacket, RoutingPacket
+from packet import PayloadPacket, AcknowledgementPacket, RoutingPacket
 from event import RoutingUpdateEvent
 from packet_tracker import PacketTracker
+from pooling import release
 import sys
 
 """The wait time, in milliseconds, between sending out each routing update packet"""
@@ -30,6 +31,11 @@ class Host(Device):
         self.event_scheduler = None
         self.logger = None
         self.payload_packet_trackers = {}
+        self._packet_handlers = {
+            PayloadPacket: self._handle_payload_packet,
+            AcknowledgementPacket: self._handle_acknowledgement_packet,
+            RoutingPacket: self._handle_routing_packet,
+        }
 
     def __str__(self):
         return "Host ID  " + self.identifier
@@ -45,7 +51,6 @@ class Host(Device):
 
     """Account for the received payload packet, and send a suitable acknlowedgmenet."""
     def _payload_received(self, packet):
-        assert isinstance(packet, PayloadPacket)
         if packet.flow_id not in self.payload_packet_trackers:
             self.payload_packet_trackers[packet.flow_id] = PacketTracker()
         ack_tracker = self.payload_packet_trackers[packet.flow_id]
@@ -53,27 +58,33 @@ class Host(Device):
         return packet.acknowledgement(ack_tracker.next_packet)
 
     """Called to deliver a packet to this host.
-       RoutingPackets are ignored; StandardPackets are delivered to the host."""
+       RoutingPackets are ignored; StandardPackets are delivered to the host.
+       The handler is looked up by the packet's exact type."""
     def handle_packet(self, packet, from_link):
-        if isinstance(packet, RoutingPacket):
-            # Should only happen if two hosts are directly connected by a link
-            # since Routers don't forward routing packets to Hosts.
-            return
+        try:
+            handler = self._packet_handlers[type(packet)]
+        except KeyError:
+            sys.exit("Host doesn't know how to handle packet of type " + type(packet).__name__)
+        handler(packet)
 
-        assert isinstance(packet, StandardPacket)
+    # Respond to a payload packet by sending an acknowledgement packet
+    # across the same link
+    def _handle_payload_packet(self, packet):
         assert packet.destination == self
-        # - If this packet is an acknowledgment packet,
-        #   notify flow so it can do the bookkeeping
-        # - If this packet is a payload packet, respond
-        #   by sending an acknowledgement packet across
-        #   the same link
-        if isinstance(packet, PayloadPacket):
-            ack_packet = self._payload_received(packet)
-            self.link.send_packet(ack_packet, self)
-        elif isinstance(packet, AcknowledgementPacket):
-            self.flows[packet.flow_id].acknowledgement_received(packet)
-        else:
-            sys.exit("Host doesn't know how to handle packet of type " + type(packet).__name__)
+        ack_packet = self._payload_received(packet)
+        self.link.send_packet(ack_packet, self)
+        release(packet)
+
+    # Notify the flow of an acknowledgement packet so it can do the bookkeeping
+    def _handle_acknowledgement_packet(self, packet):
+        assert packet.destination == self
+        self.flows[packet.flow_id].acknowledgement_received(packet)
+        release(packet)
+
+    # Should only happen if two hosts are directly connected by a link
+    # since Routers don't forward routing packets to Hosts.
+    def _handle_routing_packet(self, packet):
+        pass
 
     """Called during parsing to set up network graph."""
     def attach_link(self, link):
@@ -1,44 +1,125 @@
 from __future__ import division
 import sys
-import Queue
-from event import LinkReadyEvent, PacketArrivalEvent
+from collections import deque
+from event import LinkReadyEvent, PacketArrivalEvent, TrainArrivalEvent
+from pooling import release
+from queue_discipline import TailDrop, FULL_PACKET_SIZE
+
+"""The shortest period, in ms, over which Link.cost averages the occupancy of the buffer.
+   Routing rounds are further apart, so each round's costs average the whole period since
+   the previous round."""
+COST_AVERAGING_PERIOD = 1000
 
 class Buffer:
     """A buffer that holds packets that are waiting to send.
 
+       Packets that don't fit are always dropped. The buffer's queue discipline may
+       also drop packets that do fit, as they arrive or as they leave.
+
     Attributes:
+        capacity: the size of the buffer, in bytes
         available_space: how much space in the buffer is free, in bytes
         link: the link this buffer belongs to
-        queue: the Queue of packets waiting in the buffer
+        discipline: the queue discipline deciding which other packets to drop
+        queue: deque of (packet, destination, time enqueued) waiting in the buffer
+        fluid_backlog: bytes of fluid flows waiting in the buffer (see fluid.py), which
+            take space from packets
+        occupancy: the integral over time of the bytes occupying the buffer, in byte ms,
+            up to occupancy_time
+        occupancy_time: the time, in ms, of the latest change to available_space
         logger: the Logger used by the buffer
     """
 
-    def __init__(self, size, link):
+    def __init__(self, size, link, discipline=None):
+        self.capacity = size
         self.available_space = size
         self.link = link
-        self.queue = Queue.Queue()
+        self.discipline = discipline if discipline is not None else TailDrop()
+        self.queue = deque()
+        self.fluid_backlog = 0
+        self.occupancy = 0
+        self.occupancy_time = 0
         self.logger = None
 
     def set_logger(self, logger):
         self.logger = logger
         self.logger.log_link_buffer_available_space(self.link.identifier, self.available_space)
 
-    """Places a packet in the buffer, or drops the packet if no space is available."""
+    """Whether no packets are waiting in the buffer."""
+    def is_empty(self):
+        return not self.queue
+
+    # Adds the occupancy since the latest change to available_space, which is about to
+    # change at `time`
+    def _accumulate_occupancy(self, time):
+        self.occupancy += (self.capacity - self.available_space) * (time - self.occupancy_time)
+        self.occupancy_time = time
+
+    """The integral over time of the bytes occupying the buffer, in byte ms, up to `now`."""
+    def occupancy_until(self, now):
+        return self.occupancy + (self.capacity - self.available_space) * (now - self.occupancy_time)
+
+    """Places a packet in the buffer, or drops the packet if no space is available
+       or the queue discipline chooses to drop it."""
     def put(self, packet, destination):
-        if self.available_space >= packet.size:
-            self.queue.put((packet, destination))
+        now = self.link.event_scheduler.clock.current_time
+        if self.available_space < packet.size:
+            self.logger.log_link_dropped_packet_buffer_full(self.link.identifier, packet)
+            release(packet)
+        elif self.discipline.drop_on_enqueue(self, packet, now):
+            self.logger.log_link_dropped_packet_queue_discipline(self.link.identifier, packet)
+            release(packet)
+        else:
+            self.queue.append((packet, destination, now))
+            self._accumulate_occupancy(now)
             self.available_space -= packet.size
             self.logger.log_link_buffer_available_space(self.link.identifier, self.available_space)
-        # Otherwise, drop the packet
-        else:
-            self.logger.log_link_dropped_packet_buffer_full(self.link.identifier, packet)
 
-    """Retrieves the next packet from the buffer in FIFO order."""
+    """Retrieves the next packet from the buffer in FIFO order that the queue discipline
+       doesn't drop, as (packet, destination), or None if there is none."""
     def get(self):
-        (packet, destination) = self.queue.get_nowait()
+        now = self.link.event_scheduler.clock.current_time
+        while self.queue:
+            (packet, destination, enqueue_time) = self.queue.popleft()
+            self._accumulate_occupancy(now)
+            self.available_space += packet.size
+            self.logger.log_link_buffer_available_space(self.link.identifier, self.available_space)
+            dropped = self.discipline.drop_on_dequeue(self, now - enqueue_time, now)
+            if self.available_space == self.capacity:
+                self.discipline.buffer_emptied(self, now)
+            if not dropped:
+                return (packet, destination)
+            self.logger.log_link_dropped_packet_queue_discipline(self.link.identifier, packet)
+            release(packet)
+        return None
+
+    """Retrieves every packet from the buffer in FIFO order as (packet, destination),
+       without freeing their space. The space of each is freed with free_space once
+       it starts sending. Only for disciplines that never drop on dequeue."""
+    def get_all(self):
+        packets = [(packet, destination) for (packet, destination, _) in self.queue]
+        self.queue.clear()
+        return packets
+
+    """Frees the space of a packet taken by get_all that started sending at `time`."""
+    def free_space(self, packet, time):
+        self._accumulate_occupancy(time)
         self.available_space += packet.size
+        self.logger.log_link_buffer_available_space(self.link.identifier, self.available_space, time)
+        if self.available_space == self.capacity:
+            self.discipline.buffer_emptied(self, time)
+
+    """Sets the bytes of fluid waiting in the buffer at `now`. The backlog is in whole
+       bytes, so that available_space stays exact."""
+    def set_fluid_backlog(self, backlog, now):
+        if backlog == self.fluid_backlog:
+            return
+        self._accumulate_occupancy(now)
+        self.available_space -= backlog - self.fluid_backlog
+        self.fluid_backlog = backlog
         self.logger.log_link_buffer_available_space(self.link.identifier, self.available_space)
-        return (packet, destination)
+        if self.available_space == self.capacity:
+            self.discipline.buffer_emptied(self, now)
 
 class Link:
     """A network link between two Devices.
@@ -51,18 +132,37 @@ class Link:
         deviceA: instance of Device
         deviceB: instance of Device
         busy: true when the link is actively transmitting
+        batching: whether a backlog is sent as a packet train (see _send_train), which
+            parsing only sets for links where can_batch holds
+        _train: deque of (start time, packet) for the packets of the current train
+            whose start hasn't been accounted for yet
+        _other_devices: maps each device attached to the link to the device at the other end
+        fluid_rate: the rate, in bytes per ms, at which the link sends fluid flows, and
+            which packets can't use
+        packet_bytes: bytes of packets sent to the link since the fluid model last
+            measured it
+        _cost_period: (start time, buffer occupancy at that time) of the period being
+            averaged for cost
+        _queueing_delay: the average queueing delay, in ms, of the latest complete period
         event_scheduler: reference to global event scheduler
         logger: the Logger used by the link
     """
 
-    def __init__(self, identifier, rate, delay, buffer_size, deviceA, deviceB):
+    def __init__(self, identifier, rate, delay, buffer_size, deviceA, deviceB, discipline=None):
         self.identifier = identifier
         self.rate = rate
         self.delay = delay
-        self.buffer = Buffer(buffer_size, self)
+        self.buffer = Buffer(buffer_size, self, discipline)
         self.deviceA = deviceA
         self.deviceB = deviceB
+        self._other_devices = {deviceA: deviceB, deviceB: deviceA}
         self.busy = False
+        self.batching = False
+        self._train = deque()
+        self.fluid_rate = 0.0
+        self.packet_bytes = 0
+        self._cost_period = (0, 0)
+        self._queueing_delay = 0
         self.event_scheduler = None
         self.logger = None
 
@@ -80,18 +180,32 @@ class Link:
 
     """Given a device attached to this link, returns the other device attached to the link."""
     def other_device(self, device):
-        if device == self.deviceA:
-            return self.deviceB
-        elif device == self.deviceB:
-            return self.deviceA
-        else:
+        try:
+            return self._other_devices[device]
+        except KeyError:
             sys.exit("Device {0} not attached to link {1}".format(device.identifier, self.identifier))
 
+    """The estimated time, in milliseconds, for a packet to cross the link: the average
+       time packets waited in the buffer over the latest period of at least
+       COST_AVERAGING_PERIOD, plus the propagation delay. A snapshot of the buffer is
+       too noisy to route by, as a full buffer empties for a while after each loss."""
+    def cost(self):
+        self.retire_train()
+        now = self.event_scheduler.clock.current_time
+        (start, start_occupancy) = self._cost_period
+        if now - start >= COST_AVERAGING_PERIOD:
+            occupancy = self.buffer.occupancy_until(now)
+            self._queueing_delay = (occupancy - start_occupancy) / (now - start) / self.rate
+            self._cost_period = (now, occupancy)
+        return self._queueing_delay + self.delay
+
     """Send a packet from one sender attached to the link to the other sender attached."""
     # Sends a packet instantly if the link is not busy
     # or enqueues the packet in the buffer if the link is busy
     def send_packet(self, packet, sender):
 
+        self.packet_bytes += packet.size
+
         # The recipient is whatever device is not the sender
         recipient = self.other_device(sender)
 
@@ -100,6 +214,7 @@ class Link:
             self._send_packet_now(packet, recipient)
             self.logger.log_link_sent_packet_immediately(self.identifier, packet)
         else:
+            self.retire_train()
             self.buffer.put(packet, recipient)
 
     # Called internally to send a packet by scheduling the relevant events
@@ -107,7 +222,7 @@ class Link:
         assert not self.busy
         self.busy = True
 
-        sending_delay = packet.size / self.rate
+        sending_delay = packet.size / (self.rate - self.fluid_rate)
         self.event_scheduler.delay_event(sending_delay + self.delay, PacketArrivalEvent(packet, recipient, self))
         self.event_scheduler.delay_event(sending_delay, LinkReadyEvent(self))
 
@@ -115,10 +230,76 @@ class Link:
     # Called by LinkReadyEvent when the link is no longer busy
     def wake(self):
         self.busy = False
-        try:
-            # If there are any packets in the buffer, send one
-            (packet, destination) = self.buffer.get()
-            self._send_packet_now(packet, destination)
-            self.logger.log_link_sent_packet_from_buffer(self.identifier, packet)
-        except Queue.Empty:
-            pass
+        if self.batching:
+            self.retire_train()
+            if not self.buffer.is_empty():
+                self._send_train()
+            return
+        # If there are any packets in the buffer, send one
+        if not self.buffer.is_empty():
+            next_packet = self.buffer.get()
+            if next_packet is not None:
+                (packet, destination) = next_packet
+                self._send_packet_now(packet, destination)
+                self.logger.log_link_sent_packet_from_buffer(self.identifier, packet)
+
+    # Sends every buffered packet back to back as a packet train. The start and
+    # arrival time of each packet are computed up front, exactly as sending them
+    # one at a time would. Their arrivals are all scheduled now, each as of its
+    # packet's start (see event_queue.TrainOrdering), with a single LinkReadyEvent
+    # at the end of the train, scheduled as of the last start. Packets buffered
+    # meanwhile queue up behind the train, so they can't change its timing.
+    #
+    # Each packet keeps its buffer space until its own start time. Rather than
+    # scheduling an event for every start, retire_train catches up on the starts
+    # that have passed whenever the link is next used.
+    def _send_train(self):
+        assert not self.busy
+        self.busy = True
+        time = self.event_scheduler.clock.current_time
+        start = time
+        for (packet, recipient) in self.buffer.get_all():
+            sending_delay = packet.size / (self.rate - self.fluid_rate)
+            self._train.append((time, packet))
+            self.event_scheduler.schedule_event(time + (sending_delay + self.delay), TrainArrivalEvent(packet, recipient, self), time)
+            (start, time) = (time, time + sending_delay)
+        self.event_scheduler.schedule_event(time, LinkReadyEvent(self), start)
+        self.retire_train(True)
+
+    """Frees the buffer space of, and logs as sent, the packets of the current
+       train that started sending before now, at the times they started, and also
+       those starting now if `including_now` is set.
+
+       Sending packet by packet, each start is a LinkReadyEvent scheduled one sending
+       time before it, while a packet reaching the link at the same instant was
+       scheduled at least a propagation delay before it (see can_batch) and so comes
+       first. Starts at the current time are therefore left until the link's next
+       use, except the first start of a train, which happens as the train is sent."""
+    def retire_train(self, including_now=False):
+        train = self._train
+        now = self.event_scheduler.clock.current_time
+        while train and (train[0][0] < now or (including_now and train[0][0] == now)):
+            (start, packet) = train.popleft()
+            self.buffer.free_space(packet, start)
+            self.logger.log_link_sent_packet_from_buffer(self.identifier, packet, start)
+
+    """Whether the link's packet trains have exactly the timing of sending packet by
+       packet, given `neighbors`, the other links attached to either of its ends.
+
+       A train schedules its arrivals as it starts, so an arrival tied with another
+       event for the same instant that was scheduled during the train would come
+       before it instead of after. Such ties come from links of the same rate and
+       delay fed from the same device, as a router flooding routing packets or two
+       trains started together, so a link with such a neighbor sends packet by packet.
+       A packet that reaches the link as one of the train's packets starts must also
+       come before that start, as retire_train assumes, so every link at its ends
+       must take longer to cross than the link takes to send a full packet. The queue
+       discipline may only drop packets as they arrive."""
+    def can_batch(self, neighbors):
+        if self.buffer.discipline.__class__ is not TailDrop:
+            return False
+        sending_delay = FULL_PACKET_SIZE / self.rate
+        for link in [self] + neighbors:
+            if link.delay <= sending_delay:
+                return False
+        return not any(link.rate == self.rate and link.delay == self.delay for link in neighbors)
@@ -1,117 +1,405 @@
-import sys
+import sys, csv
+from array import array
+from collections import namedtuple
+from itertools import izip
+from aggregation import WindowedStatistics
+
+"""The fields of a logged packet that are kept by the logger. Routing packets have
+   neither an identifier nor a flow, so both are None for them."""
+PacketRecord = namedtuple("PacketRecord", ["identifier", "flow_id", "size"])
+
+"""Field kind for string identifiers of links, flows, routers and hosts, stored interned as integers"""
+IDENTIFIER = "identifier"
+
+"""Field kind for packets, stored as the identifier, flow_id and size columns of a PacketRecord"""
+PACKET = "packet"
+
+class Identifiers:
+    """Interns identifier strings as small integers so logs can store them in typed arrays.
+
+    Attributes:
+        names: The interned identifiers, indexed by their integer
+    """
+
+    def __init__(self):
+        self.names = []
+        self._indices = {}
+
+    """Returns the integer for `name`, interning it if it hasn't been seen before. None is -1."""
+    def index(self, name):
+        if name is None:
+            return -1
+        index = self._indices.get(name)
+        if index is None:
+            index = self._indices[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+    """Returns the identifier string for `index`."""
+    def name(self, index):
+        return self.names[index] if index >= 0 else None
+
+class LogStream:
+    """A log of entries of one kind, stored as parallel typed arrays (columns) rather than
+       as a dictionary per entry, and without keeping references to any logged objects.
+
+       Iterating over a stream, or adding two streams together, still produces one
+       dictionary per entry, keyed by field name, with packets as PacketRecords.
+
+    Attributes:
+        fields: The (name, kind) pairs of each entry, where kind is an array typecode,
+            IDENTIFIER or PACKET. Every stream also has a leading "time" field.
+        columns: Dictionary mapping column name to array. Packet fields are stored in
+            the three columns <name>_identifier, <name>_flow_id and <name>_size.
+        identifiers: The Identifiers shared by every stream of the logger
+    """
+
+    def __init__(self, identifiers, fields):
+        self.fields = [("time", "d")] + fields
+        self.identifiers = identifiers
+        self.columns = {}
+        self._appenders = self._make_appenders()
+
+    # Creates any columns that don't exist yet, and returns the function appending each
+    # field's value to its columns
+    def _make_appenders(self):
+        appenders = []
+        for (name, kind) in self.fields:
+            if kind == PACKET:
+                appenders.append(self._packet_appender(name))
+            elif kind == IDENTIFIER:
+                appenders.append(self._identifier_appender(name))
+            else:
+                appenders.append(self.columns.setdefault(name, array(kind)).append)
+        return appenders
+
+    def _identifier_appender(self, name):
+        column = self.columns.setdefault(name, array("i"))
+        index = self.identifiers.index
+        return lambda identifier: column.append(index(identifier))
+
+    def _packet_appender(self, name):
+        identifier_column = self.columns.setdefault(name + "_identifier", array("l"))
+        flow_id_column = self.columns.setdefault(name + "_flow_id", array("i"))
+        size_column = self.columns.setdefault(name + "_size", array("l"))
+        index = self.identifiers.index
+        def append(packet):
+            identifier = getattr(packet, "identifier", None)
+            identifier_column.append(identifier if identifier is not None else -1)
+            flow_id_column.append(index(getattr(packet, "flow_id", None)))
+            size_column.append(packet.size)
+        return append
+
+    """Adds an entry; `values` are given in the order of `fields`, starting with the time."""
+    def append(self, *values):
+        for (append, value) in izip(self._appenders, values):
+            append(value)
+
+    def __len__(self):
+        return len(self.columns["time"])
+
+    """Returns the values of field `name` in logged order. Identifiers are returned as strings
+       and packets as PacketRecords."""
+    def column(self, name):
+        kind = dict(self.fields).get(name)
+        if kind == PACKET:
+            return [self._packet_record(name, i) for i in range(len(self))]
+        elif kind == IDENTIFIER:
+            return [self.identifiers.name(index) for index in self.columns[name]]
+        else:
+            return self.columns[name]
+
+    def _packet_record(self, name, i):
+        identifier = self.columns[name + "_identifier"][i]
+        return PacketRecord(identifier if identifier >= 0 else None,
+                            self.identifiers.name(self.columns[name + "_flow_id"][i]),
+                            self.columns[name + "_size"][i])
+
+    def __iter__(self):
+        names = [name for (name, _) in self.fields]
+        columns = [self.column(name) for name in names]
+        for values in izip(*columns):
+            yield dict(izip(names, values))
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    # The appenders are closures, which can't be pickled, so a checkpoint keeps only
+    # the columns and the appenders are made again on restore
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_appenders"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._appenders = self._make_appenders()
+
+"""The name and fields of every kind of log entry, in the order the Logger creates them"""
+LOG_STREAMS = [
+    ("flow_started_logs", [("flow_id", IDENTIFIER)]),
+    ("flow_completed_logs", [("flow_id", IDENTIFIER)]),
+    ("flow_send_packet_logs", [("flow_id", IDENTIFIER), ("packet", PACKET)]),
+    ("flow_received_acknowledgement_logs", [("flow_id", IDENTIFIER), ("packet", PACKET), ("amount_left", "d")]),
+    ("router_sending_packet_logs", [("router_id", IDENTIFIER), ("packet", PACKET), ("link_id", IDENTIFIER)]),
+    ("router_dropped_packet_unknown_path_logs", [("router_id", IDENTIFIER), ("packet", PACKET)]),
+    ("updated_routing_table_logs", [("router_id", IDENTIFIER), ("host_id", IDENTIFIER), ("link_id", IDENTIFIER), ("timestamp", "d")]),
+    ("link_dropped_packet_buffer_full_logs", [("link_id", IDENTIFIER), ("packet", PACKET)]),
+    ("link_dropped_packet_queue_discipline_logs", [("link_id", IDENTIFIER), ("packet", PACKET)]),
+    ("link_buffer_available_space_logs", [("link_id", IDENTIFIER), ("available_space", "d")]),
+    ("link_sent_packet_immediately_logs", [("link_id", IDENTIFIER), ("packet", PACKET)]),
+    ("link_sent_packet_from_buffer_logs", [("link_id", IDENTIFIER), ("packet", PACKET)]),
+    ("fluid_flow_logs", [("flow_id", IDENTIFIER), ("rate", "d"), ("window", "d"), ("rtt", "d"), ("delivered", "d"), ("amount_left", "d")]),
+]
+
+"""The number of records a LogSink holds in memory before writing them to its file"""
+LOG_SINK_BUFFER_RECORDS = 8192
+
+class LogSink:
+    """A CSV file that log entries are written to as they happen.
+
+       Records are collected in a buffer that is written out and flushed to disk whenever
+       it fills up, so memory use stays bounded however long the simulation runs. The first
+       record holds the settings of the run; every other record is the name of a log stream
+       followed by the fields of one entry, with packets spread over three fields.
+
+    Attributes:
+        path: The path of the log file
+        records_written: The number of entries written so far
+    """
+
+    def __init__(self, path, fast_insteadof_reno):
+        self.path = path
+        self.records_written = 0
+        self._file = open(path, "wb")
+        self._writer = csv.writer(self._file)
+        self._buffer = []
+        self._writer.writerow(["settings", "fast_insteadof_reno", int(fast_insteadof_reno)])
+
+    def write(self, record):
+        self._buffer.append(record)
+        if len(self._buffer) >= LOG_SINK_BUFFER_RECORDS:
+            self.flush()
+
+    """Writes the buffered records to the file and flushes it to disk."""
+    def flush(self):
+        self._writer.writerows(self._buffer)
+        self.records_written += len(self._buffer)
+        self._buffer = []
+        self._file.flush()
+
+    def close(self):
+        self.flush()
+        self._file.close()
+
+    # A restored or forked simulation would append to the same file as the original
+    def __getstate__(self):
+        sys.exit("A simulation writing its log to " + self.path + " can't be checkpointed; run it without a log file")
+
+class StreamingLogStream(LogStream):
+    """A LogStream that writes each entry to a LogSink instead of keeping it in memory.
+       Entries can only be read back by loading the sink's file with load_logger.
+
+    Attributes:
+        name: The name of the stream, written at the start of each record
+        sink: The LogSink written to
+        count: The number of entries logged
+    """
+
+    def __init__(self, identifiers, fields, name, sink):
+        LogStream.__init__(self, identifiers, fields)
+        self.name = name
+        self.sink = sink
+        self.count = 0
+        self._kinds = [kind for (_, kind) in self.fields]
+
+    def append(self, *values):
+        record = [self.name]
+        for (kind, value) in izip(self._kinds, values):
+            if kind == PACKET:
+                record.extend((getattr(value, "identifier", ""), getattr(value, "flow_id", ""), value.size))
+            elif kind == "d":
+                record.append(repr(value))
+            else:
+                record.append(value)
+        self.sink.write(record)
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def column(self, name):
+        sys.exit("Log stream " + self.name + " was written to " + self.sink.path + ", load it with logger.load_logger")
+
+    def __iter__(self):
+        self.column(None)
+
+class CountingLogStream(LogStream):
+    """A LogStream that discards its entries and only counts them, for runs that
+       keep nothing but the windowed statistics.
+
+    Attributes:
+        name: The name of the stream
+        count: The number of entries logged
+    """
+
+    def __init__(self, identifiers, fields, name):
+        LogStream.__init__(self, identifiers, fields)
+        self.name = name
+        self.count = 0
+
+    def append(self, *values):
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def column(self, name):
+        sys.exit("Log stream " + self.name + " was discarded because only windowed statistics were kept")
+
+    def __iter__(self):
+        self.column(None)
 
 class Logger:
-    """Singleton class, stores arrays of log entries, which are dictionaries.
-        Has methods for adding log entries to those dictionaries.
-	Logs to standard output depending on verbosity."""
+    """Singleton class, stores a LogStream for each kind of log entry.
+        Has methods for adding log entries to those streams.
+	Logs to standard output depending on verbosity.
+
+        If `log_file` is given, entries are written to that file as they happen instead
+        of being kept in memory, and can be read back later with load_logger.
+
+        If `aggregate` is set, the windowed series that stats.show_graphs plots are
+        maintained in `windows` as entries arrive. Unless a `log_file` is also given,
+        the entries themselves are then discarded."""
 
-    def __init__(self, clock, verbose, fast_insteadof_reno):
+    def __init__(self, clock, verbose, fast_insteadof_reno, log_file=None, aggregate=False):
         self.clock = clock
         self.verbose = verbose
         self.fast_insteadof_reno = fast_insteadof_reno
-        self.flow_started_logs = []
-        self.flow_completed_logs = []
-        self.flow_send_packet_logs = []
-        self.flow_received_acknowledgement_logs = []
-        self.router_sending_packet_logs = []
-        self.router_dropped_packet_unknown_path_logs = []
-        self.updated_routing_table_logs = []
-        self.link_dropped_packet_buffer_full_logs = []
-        self.link_buffer_available_space_logs = []
-        self.link_sent_packet_immediately_logs = []
-        self.link_sent_packet_from_buffer_logs = []
+        self.identifiers = Identifiers()
+        self.sink = LogSink(log_file, fast_insteadof_reno) if log_file is not None else None
+        self.windows = WindowedStatistics() if aggregate else None
+        for (name, fields) in LOG_STREAMS:
+            if self.sink is not None:
+                setattr(self, name, StreamingLogStream(self.identifiers, fields, name, self.sink))
+            elif aggregate:
+                setattr(self, name, CountingLogStream(self.identifiers, fields, name))
+            else:
+                setattr(self, name, LogStream(self.identifiers, fields))
+
+    """Writes out any entries still buffered for the log file."""
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
 
     def log_flow_started(self, flow_id):
         sys.stdout.write("\r" + str(self.clock) + ": Flow " + str(flow_id) + " started              \n")
-        self.flow_started_logs.append({
-            "time" : self.clock.current_time,
-            "flow_id" : flow_id
-        })
+        self.flow_started_logs.append(self.clock.current_time, flow_id)
+        if self.windows is not None:
+            self.windows.flow_started(self.clock.current_time, flow_id)
 
     def log_flow_completed(self, flow_id):
         sys.stdout.write("\r" + str(self.clock) + ": Flow " + str(flow_id) + " completed            \n")
-        self.flow_completed_logs.append({
-            "time" : self.clock.current_time,
-            "flow_id" : flow_id
-        })
+        self.flow_completed_logs.append(self.clock.current_time, flow_id)
+        if self.windows is not None:
+            self.windows.flow_completed(self.clock.current_time, flow_id)
 
     def log_flow_send_packet(self, flow_id, packet):
         if self.verbose:
             print str(self.clock) + ": Flow " + str(flow_id) + " sending packet " + str(packet)
-        self.flow_send_packet_logs.append({
-            "time" : self.clock.current_time,
-            "flow_id" : flow_id,
-            "packet" : packet
-        })
+        self.flow_send_packet_logs.append(self.clock.current_time, flow_id, packet)
+        if self.windows is not None:
+            self.windows.packet_sent(self.clock.current_time, flow_id, packet)
 
     def log_flow_received_acknowledgement(self, flow_id, packet, amount_left):
         if self.verbose:
             print str(self.clock) + ": Flow " + str(flow_id) + " now has " +str(amount_left) + " bytes left to receive after receiving acknowledgement packet " + str(packet)
-        self.flow_received_acknowledgement_logs.append({
-            "time" : self.clock.current_time,
-            "flow_id" : flow_id,
-            "packet" : packet,
-            "amount_left" : amount_left
-        })
+        self.flow_received_acknowledgement_logs.append(self.clock.current_time, flow_id, packet, amount_left)
+        if self.windows is not None:
+            self.windows.acknowledgement_received(self.clock.current_time, flow_id, packet, amount_left)
 
     def log_router_sending_packet(self, router_id, packet, link_id):
         if self.verbose:
             print str(self.clock) + ": Router " + str(router_id) + " sending over link " + str(link_id) + " packet " + str(packet)
-        self.router_sending_packet_logs.append({
-            "time" : self.clock.current_time,
-            "router_id" : router_id,
-            "packet" : packet,
-            "link_id" : link_id
-        })
+        self.router_sending_packet_logs.append(self.clock.current_time, router_id, packet, link_id)
+        if self.windows is not None:
+            self.windows.packet_forwarded(self.clock.current_time, router_id)
 
     def log_router_dropped_packet_unknown_path(self, router_id, packet):
         if self.verbose:
             print str(self.clock) + ": Router " + str(router_id) + " dropped packet because next hop is unknown: " + str(packet)
-        self.router_dropped_packet_unknown_path_logs.append({
-            "time" : self.clock.current_time,
-            "router_id" : router_id,
-            "packet" : packet
-        })
+        self.router_dropped_packet_unknown_path_logs.append(self.clock.current_time, router_id, packet)
+        if self.windows is not None:
+            self.windows.packet_dropped(self.clock.current_time, router_id)
 
     def log_updated_routing_table(self, router_id, host_id, link_id, timestamp):
         if self.verbose:
             print str(self.clock) + ": Router " + str(router_id) + " updated routing table entry for host " + str(host_id) + " to send over link " + str(link_id) + " by packet sent at time " + str(timestamp)
-        self.updated_routing_table_logs.append({
-            "time" : self.clock.current_time,
-            "router_id" : router_id,
-            "host_id" : host_id,
-            "link_id" : link_id,
-            "timestamp" : timestamp
-        })
+        self.updated_routing_table_logs.append(self.clock.current_time, router_id, host_id, link_id, timestamp)
 
     def log_link_dropped_packet_buffer_full(self, link_id, packet):
         if self.verbose:
             print str(self.clock) + ": Link " + link_id + " dropped packet because buffer is full " + str(packet)
-        self.link_dropped_packet_buffer_full_logs.append({
-            "time": self.clock.current_time,
-            "link_id": link_id,
-            "packet": packet
-        })
-
-    def log_link_buffer_available_space(self, link_id, available_space):
-        self.link_buffer_available_space_logs.append({
-            "time": self.clock.current_time,
-            "link_id": link_id,
-            "available_space": available_space
-        })
+        self.link_dropped_packet_buffer_full_logs.append(self.clock.current_time, link_id, packet)
+        if self.windows is not None:
+            self.windows.packet_dropped(self.clock.current_time, link_id)
+
+    def log_link_dropped_packet_queue_discipline(self, link_id, packet):
+        if self.verbose:
+            print str(self.clock) + ": Link " + link_id + " dropped packet by its queue discipline " + str(packet)
+        self.link_dropped_packet_queue_discipline_logs.append(self.clock.current_time, link_id, packet)
+        if self.windows is not None:
+            self.windows.packet_dropped(self.clock.current_time, link_id)
+
+    # `time` may be given for entries a batching link logs after the fact
+    def log_link_buffer_available_space(self, link_id, available_space, time=None):
+        if time is None:
+            time = self.clock.current_time
+        self.link_buffer_available_space_logs.append(time, link_id, available_space)
+        if self.windows is not None:
+            self.windows.buffer_space(time, link_id, available_space)
 
     def log_link_sent_packet_immediately(self, link_id, packet):
 #        print str(self.clock) + ": Link " + link_id + " sent packet immediately " + str(packet)
-        self.link_sent_packet_immediately_logs.append({
-            "time": self.clock.current_time,
-            "link_id": link_id,
-            "packet": packet
-        })
+        self.link_sent_packet_immediately_logs.append(self.clock.current_time, link_id, packet)
+        if self.windows is not None:
+            self.windows.link_sent(self.clock.current_time, link_id, packet)
 
-    def log_link_sent_packet_from_buffer(self, link_id, packet):
+    # `time` may be given for entries a batching link logs after the fact
+    def log_link_sent_packet_from_buffer(self, link_id, packet, time=None):
 #        print str(self.clock) + ": Link " + link_id + " sent packet from buffer " + str(packet)
-        self.link_sent_packet_from_buffer_logs.append({
-            "time": self.clock.current_time,
-            "link_id": link_id,
-            "packet": packet
-        })
+        if time is None:
+            time = self.clock.current_time
+        self.link_sent_packet_from_buffer_logs.append(time, link_id, packet)
+        if self.windows is not None:
+            self.windows.link_sent(time, link_id, packet)
+
+    # `rate` is in bytes per ms and `window` in packets
+    def log_fluid_flow(self, flow_id, rate, window, rtt, delivered, amount_left):
+        if self.verbose:
+            print str(self.clock) + ": Fluid flow " + str(flow_id) + " sending " + str(rate) + " bytes/ms with window " + str(window) + ", RTT " + str(rtt) + " ms and " + str(amount_left) + " bytes left"
+        self.fluid_flow_logs.append(self.clock.current_time, flow_id, rate, window, rtt, delivered, amount_left)
+        if self.windows is not None:
+            self.windows.fluid_flow_updated(self.clock.current_time, flow_id, rtt, delivered, amount_left)
+
+"""Reads a log file written by a streaming Logger back into an in-memory Logger,
+   so statistics can be computed without re-running the simulation."""
+def load_logger(path):
+    with open(path, "rb") as log_file:
+        reader = csv.reader(log_file)
+        (_, _, fast_insteadof_reno) = next(reader)
+        logger = Logger(None, False, fast_insteadof_reno == "1")
+        kinds = dict((name, [kind for (_, kind) in [("time", "d")] + fields]) for (name, fields) in LOG_STREAMS)
+        for record in reader:
+            values = []
+            fields = iter(record[1:])
+            for kind in kinds[record[0]]:
+                if kind == PACKET:
+                    (identifier, flow_id, size) = (next(fields), next(fields), next(fields))
+                    values.append(PacketRecord(int(identifier) if identifier else None, flow_id or None, int(size)))
+                elif kind == IDENTIFIER:
+                    values.append(next(fields))
+                else:
+                    values.append(float(next(fields)))
+            getattr(logger, record[0]).append(*values)
+    return logger
@@ -1,18 +1,59 @@
 import sys
 import argparse
 import stats
+from event_queue import SCHEDULERS
+from logger import load_logger
+from router import ROUTING_TABLES, ROUTE_WEIGHTS
+from queue_discipline import QUEUE_DISCIPLINES
 from parsing import read_testcase, generate_simulation_from_testcase
+from checkpoint import load_checkpoint
 
 parser = argparse.ArgumentParser(description='Simulate a network.')
 parser.add_argument('-v', '--verbose', action="store_true", dest="verbose", default=False, help="increase verbosity")
 parser.add_argument('-r', '--reno', action="store_false", dest="fast_insteadof_reno", default=False, help="TCP Reno (default)")
 parser.add_argument('-f', '--fast', action="store_true", dest="fast_insteadof_reno", default=False, help="TCP Fast")
 parser.add_argument('-n', '--no-graphs', action="store_false", dest="show_graphs", default=True, help="don't display graphs")
+parser.add_argument('-s', '--scheduler', action="store", dest="scheduler", choices=sorted(SCHEDULERS), default="heap", help="event queue implementation (default heap)")
+parser.add_argument('-l', '--log-file', action="store", dest="log_file", default=None, help="write log entries to this file as they happen instead of keeping them in memory")
+parser.add_argument('-a', '--aggregate', action="store_true", dest="aggregate", default=False, help="keep only the windowed statistics that are graphed, not every log entry")
+parser.add_argument('-o', '--output-dir', action="store", dest="output_dir", default=None, help="save graphs, series and a summary to this directory instead of displaying them")
+parser.add_argument('--formats', action="store", dest="formats", default="png", help="comma-separated image formats to save graphs in (default png)")
+parser.add_argument('--routing', action="store", dest="routing", choices=sorted(ROUTING_TABLES), default="dynamic", help="route by the first routing packet to arrive (dynamic, default), by the cheapest path measured from link buffer occupancy and rate (cost), or by static shortest paths (static)")
+parser.add_argument('--route-weight', action="store", dest="route_weight", choices=sorted(ROUTE_WEIGHTS), default="delay", help="link weight for static routes (default delay)")
+parser.add_argument('--ecmp', action="store_true", dest="multipath", default=False, help="with static routing, spread flows across all equal-cost paths")
+parser.add_argument('-p', '--pool', action="store_true", dest="pooling", default=False, help="reuse delivered packets and performed events instead of allocating new ones")
+parser.add_argument('-b', '--batch', action="store_true", dest="batching", default=False, help="send a link's backlog as a packet train, scheduling fewer events, on links where that keeps the timing of sending packet by packet")
+parser.add_argument('-q', '--queue-discipline', action="store", dest="queue_discipline", choices=sorted(QUEUE_DISCIPLINES), default=None, help="queue discipline for links that don't set their own (default droptail)")
+parser.add_argument('--adaptive-rto', action="store_true", dest="adaptive_timeout", default=False, help="estimate each flow's retransmission timeout from measured round trip times instead of fixing it at one second")
+parser.add_argument('--profile', action="store", dest="profile", default=None, metavar="JSON_FILE", help="time every event, print the time per event type and save the profile to this file")
+parser.add_argument('--fluid', action="store", dest="fluid", default=None, metavar="FLOW_IDS", help="comma-separated flows to model as fluid rates rather than packets, besides any the test case marks")
+parser.add_argument('--checkpoint', action="store", dest="checkpoint", nargs=2, default=None, metavar=("SECONDS", "FILE"), help="save a snapshot of the simulation to FILE once it reaches SECONDS of simulated time")
+parser.add_argument('--restore', action="store_true", dest="restore", default=False, help="carry on from a snapshot saved with --checkpoint, given in place of the test case; the simulation keeps the options it was saved with")
 parser.add_argument('testcase_file', action="store", type=argparse.FileType('r'))
 results = parser.parse_args()
+if results.restore and results.log_file is not None:
+    parser.error("a restored simulation keeps logging the way it was saved, so --log-file can't be given")
 
-sim = generate_simulation_from_testcase(read_testcase(results.testcase_file), results.verbose, results.fast_insteadof_reno)
+if results.restore:
+    sim = load_checkpoint(results.testcase_file)
+    print "Restored simulation at " + str(sim.clock)
+    if results.profile is not None and sim.profiler is None:
+        sim.enable_profiling()
+else:
+    sim = generate_simulation_from_testcase(read_testcase(results.testcase_file), results.verbose, results.fast_insteadof_reno, results.scheduler, results.log_file, results.aggregate, results.routing, results.route_weight, results.multipath, results.pooling, results.batching, results.queue_discipline, results.adaptive_timeout, results.profile is not None, results.fluid.split(",") if results.fluid else None)
+if results.checkpoint is not None:
+    sim.run_until(float(results.checkpoint[0]) * 1000)
+    size = sim.checkpoint(results.checkpoint[1])
+    print "\rSaved snapshot at " + str(sim.clock) + " to " + results.checkpoint[1] + " ({0:.0f} KB)".format(size / 1024.0)
 sim.run()
-print "Generating graphs..."
-if results.show_graphs:
-    stats.show_graphs(sim.logger)
+sim.logger.close()
+if results.profile is not None:
+    sys.stdout.write(sim.profiler.format_table())
+    sim.profiler.write_json(results.profile)
+logger = load_logger(results.log_file) if results.log_file and not results.aggregate else sim.logger
+if results.output_dir:
+    print "Exporting graphs..."
+    sys.stdout.write(stats.format_summary(stats.export_graphs(logger, results.output_dir, results.formats.split(","))))
+elif results.show_graphs:
+    print "Generating graphs..."
+    stats.show_graphs(logger)
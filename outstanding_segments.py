@@ -0,0 +1,60 @@
+from collections import deque
+
+class OutstandingSegments:
+    """Tracks the packets a congestion controller has sent that have not yet
+       been acknowledged, keyed by packet id. At most one copy of each packet
+       is outstanding at a time, so every lookup by packet id is O(1).
+
+    Attributes:
+        segments: Dictionary with the IDs of unacknowledged packets as key, and
+            (duplicate number, timestamp that copy was sent) as value
+        send_order: Deque of (timestamp, packet ID, duplicate number) for every
+            copy sent, oldest first. Entries for copies that have since been
+            acknowledged or resent are discarded lazily, once they reach the
+            front and have timed out
+    """
+
+    def __init__(self):
+        self.segments = dict()
+        self.send_order = deque()
+
+    def __len__(self):
+        return len(self.segments)
+
+    """Whether any copy of the packet `packet_id` is outstanding."""
+    def __contains__(self, packet_id):
+        return packet_id in self.segments
+
+    """Records that copy `duplicate_num` of packet `packet_id` was sent at `time`."""
+    def add(self, packet_id, duplicate_num, time):
+        assert packet_id not in self.segments
+        self.segments[packet_id] = (duplicate_num, time)
+        self.send_order.append((time, packet_id, duplicate_num))
+
+    """The duplicate number of the outstanding copy of `packet_id`, or None."""
+    def duplicate_num(self, packet_id):
+        segment = self.segments.get(packet_id)
+        return segment[0] if segment is not None else None
+
+    """Removes copy `duplicate_num` of packet `packet_id` and returns the time it
+       was sent, or None if that copy is not outstanding."""
+    def remove(self, packet_id, duplicate_num):
+        segment = self.segments.get(packet_id)
+        if segment is None or segment[0] != duplicate_num:
+            return None
+        del self.segments[packet_id]
+        return segment[1]
+
+    """Removes the copies sent more than `timeout` before `current_time` and
+       returns their (packet ID, duplicate number), oldest first. Copies are sent
+       in time order, so only the front of send_order is examined."""
+    def pop_timed_out(self, current_time, timeout):
+        timed_out = []
+        send_order = self.send_order
+        segments = self.segments
+        while send_order and current_time - send_order[0][0] > timeout:
+            (sent_time, packet_id, duplicate_num) = send_order.popleft()
+            if segments.get(packet_id) == (duplicate_num, sent_time):
+                del segments[packet_id]
+                timed_out.append((packet_id, duplicate_num))
+        return timed_out
@@ -1,7 +1,13 @@
-class StandardPacket():
+from pooling import pooled
+
+class StandardPacket(object):
     """A packet for sending information between hosts on the network.
        Superclass of PayloadPacket and AcknowledgementPacket.
 
+       Packets are created for every payload and acknowledgement, so they
+       use __slots__ rather than an instance dictionary. Payloads and
+       acknowledgements may also be reused once delivered; see pooling.py.
+
     Attributes:
         identifier: the packet ID that a pair of Payload and ACK packets share
         duplicate_num: Which duplicate of the original packet this packet is
@@ -10,6 +16,8 @@ class StandardPacket():
         destination: The host to which the packet was sent
         size: The packet size, in bytes
     """
+    __slots__ = ("size", "identifier", "duplicate_num", "flow_id", "source", "destination")
+    _free_list = None
 
     def __init__(self, identifier, duplicate_num, flow_id, source, destination, size):
         self.size = size
@@ -20,6 +28,7 @@ class StandardPacket():
         self.destination = destination
 
 
+@pooled
 class PayloadPacket(StandardPacket):
     """A packet for sending information to another host on the network.
 
@@ -31,6 +40,7 @@ class PayloadPacket(StandardPacket):
         destination: The host to which the packet was sent
         size: The packet size, in bytes
     """
+    __slots__ = ("ack_size",)
 
     def __init__(self, identifier, duplicate_num, flow_id, source, destination, payload_size, ack_size):
         StandardPacket.__init__(self, identifier, duplicate_num, flow_id, source, destination, payload_size)
@@ -48,6 +58,7 @@ class PayloadPacket(StandardPacket):
                 "size:          " + str(self.size) + " bytes\n")
 
 
+@pooled
 class AcknowledgementPacket(StandardPacket):
     """A packet for acknowledging receipt of a PayloadPacket
        from another host on the network.
@@ -61,6 +72,7 @@ class AcknowledgementPacket(StandardPacket):
         destination: The host to which the packet was sent
         size: The packet size, in bytes
     """
+    __slots__ = ("payload_size", "next_id")
 
     def __init__(self, identifier, duplicate_num, next_id, flow_id, source, destination, payload_size, ack_size):
         StandardPacket.__init__(self, identifier, duplicate_num, flow_id, source, destination, ack_size)
@@ -75,7 +87,7 @@ class AcknowledgementPacket(StandardPacket):
                 "destination:           " + self.destination.identifier + "\n"
                 "size:                  " + str(self.size) + " bytes\n")
 
-class RoutingPacket:
+class RoutingPacket(object):
     """A packet for communicating routing information between routers on
        the network such that routing tables can be updated in a distributed
        manner.
@@ -84,15 +96,21 @@ class RoutingPacket:
         source: The host that sent the packet
         timestamp: The time at which the host sent the packet
         size: The packet size, in bytes
+        cost: The summed cost of the links the packet has crossed, used by
+            cost-aware routing
     """
+    __slots__ = ("size", "source", "timestamp", "cost")
+    _free_list = None
 
-    def __init__(self, source, timestamp, size):
+    def __init__(self, source, timestamp, size, cost=0):
         self.size = size
         self.source = source
         self.timestamp = timestamp
+        self.cost = cost
 
     def __str__(self):
         return ("RoutingPacket\n"
                 "source:      " + self.source.identifier + "\n"
                 "timestamp: " + str(self.timestamp) + "\n"
+                "cost:        " + str(self.cost) + "\n"
                 "size:        " + str(self.size) + " bytes\n")
@@ -1,40 +1,82 @@
-import Queue
+import sys
+from bisect import bisect
 
 class PacketTracker:
     """Tracks the packets that have been received before a packet with a
        smaller id, and keeps track of the packet with the smallest id number
        that is expected next.
-    
+
+       Packets that arrive early are kept as runs of consecutive ids rather
+       than one by one, so memory grows with the number of gaps in the
+       sequence rather than the number of packets received out of order.
+       Packets nearly always extend the latest run or close the gap at
+       `next_packet`, both of which take constant time.
+
     Attributes:
         next_packet: Identifier of next expected packet
-        early_packets: Ordered array holding packets that arrived out of order,
-            specifically, recieved packets with ids greater than `next_packet`
+        early_ranges: Sorted list of disjoint [first, last] runs of ids that
+            arrived out of order, all greater than `next_packet`. Each run is
+            preceded by at least one missing id
+        early_count: Number of distinct ids in `early_ranges`
     """
 
     def __init__(self):
         self.next_packet = 0
-        self.early_packets = Queue.PriorityQueue()
+        self.early_ranges = []
+        self.early_count = 0
 
     """Account that a packet has been recieved by updating internal variables."""
     # Called by flow when an acknowledgement has been received
     def account_for_packet(self, packet_id):
-        # The acknowledgement we just received is for the packet that 
+        # The acknowledgement we just received is for the packet that
         # we were expecting, so update the next packet
         if packet_id == self.next_packet:
             self.next_packet += 1
-            # If our new next packet has already been received (in the early 
-            # packets queue), we want to find the subsequent packet that hasn't 
-            # been received yet
-            while not self.early_packets.empty() and self.next_packet == self.early_packets.queue[0]:
-                self.next_packet += 1
-                self.early_packets.get_nowait()
+            # If our new next packet has already been received (in the first
+            # early run), we want to skip past the whole run
+            ranges = self.early_ranges
+            if ranges and ranges[0][0] == self.next_packet:
+                (first, last) = ranges.pop(0)
+                self.next_packet = last + 1
+                self.early_count -= last - first + 1
         # Packet of larger id arrived before the next packet we were expecting
         elif packet_id > self.next_packet:
-            self.early_packets.put(packet_id)
+            self._add_early(packet_id)
         else:
             pass
             #received packet again - do nothing
 
+    # Adds an id greater than next_packet to the early runs, merging it with
+    # the runs either side. Ids that were already received are ignored.
+    def _add_early(self, packet_id):
+        ranges = self.early_ranges
+        # Common case: the id extends the latest run
+        if ranges and ranges[-1][1] + 1 == packet_id:
+            ranges[-1][1] = packet_id
+            self.early_count += 1
+            return
+        index = bisect(ranges, [packet_id, sys.maxint])
+        before = ranges[index - 1] if index > 0 else None
+        after = ranges[index] if index < len(ranges) else None
+        if before is not None and before[1] >= packet_id:
+            return
+        if before is not None and before[1] + 1 == packet_id:
+            if after is not None and after[0] == packet_id + 1:
+                before[1] = after[1]
+                del ranges[index]
+            else:
+                before[1] = packet_id
+        elif after is not None and after[0] == packet_id + 1:
+            after[0] = packet_id
+        else:
+            ranges.insert(index, [packet_id, packet_id])
+        self.early_count += 1
+
     """The total number of packets accounted for, disregarding duplicates."""
     def total_count_received(self):
-        return self.next_packet + len(self.early_packets.queue)
+        return self.next_packet + self.early_count
+
+    """The runs of ids received beyond `next_packet`, as SACK-style inclusive
+       (first, last) ranges in ascending order."""
+    def received_ranges(self):
+        return [(first, last) for (first, last) in self.early_ranges]
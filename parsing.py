@@ -1,8 +1,10 @@
-import json
+import sys, json
 from link import Link
+from queue_discipline import make_queue_discipline
 from flow import Flow
+from fluid import FluidFlow
 from host import Host
-from router import Router
+from router import Router, ROUTING_TABLES, ROUTE_WEIGHTS, install_static_routes
 from simulation import Simulation
 from congestion_controller import CongestionControllerReno, CongestionControllerFast
 
@@ -13,7 +15,7 @@ BYTES_PER_MEGABIT = 131072.0
 def read_testcase(file):
     return json.load(file)
 
-def generate_simulation_from_testcase(input_dict, verbose, fast_insteadof_reno):
+def generate_simulation_from_testcase(input_dict, verbose, fast_insteadof_reno, scheduler="heap", log_file=None, aggregate=False, routing="dynamic", route_weight="delay", multipath=False, pooling=False, batching=False, queue_discipline=None, adaptive_timeout=False, profile=False, fluid=None):
     links_info = input_dict["links"]
     flows_info = input_dict["flows"]
     hosts_info = input_dict["hosts"]
@@ -26,7 +28,7 @@ def generate_simulation_from_testcase(input_dict, verbose, fast_insteadof_reno):
 
     routers = {}
     for r in routers_info:
-        routers[r["id"]] = Router(r["id"])
+        routers[r["id"]] = Router(r["id"], ROUTING_TABLES[routing]())
 
     links = {}
     for l in links_info:
@@ -34,21 +36,45 @@ def generate_simulation_from_testcase(input_dict, verbose, fast_insteadof_reno):
         deviceB_id = l["endpoints"][1]
         deviceA = [ d.get(deviceA_id) for d in [hosts, routers] if deviceA_id in d ][0]
         deviceB = [ d.get(deviceB_id) for d in [hosts, routers] if deviceB_id in d ][0]
-        link = Link(l["id"], l["rate"] * BYTES_PER_MEGABIT / 1000, l["delay"], l["buffer"] * BYTES_PER_KILOBYTE, deviceA, deviceB)
+        # A link's own queue discipline takes precedence over the one given for every link
+        discipline = make_queue_discipline(l.get("queue_discipline", queue_discipline), l["id"], l["buffer"] * BYTES_PER_KILOBYTE)
+        link = Link(l["id"], l["rate"] * BYTES_PER_MEGABIT / 1000, l["delay"], l["buffer"] * BYTES_PER_KILOBYTE, deviceA, deviceB, discipline)
         deviceA.attach_link(link)
         deviceB.attach_link(link)
         links[l["id"]] = link
 
+    if routing == "static":
+        install_static_routes(hosts, routers, ROUTE_WEIGHTS[route_weight], multipath)
+
+    # Flows are simulated packet by packet unless the test case or `fluid` says otherwise
+    fluid = set(fluid or [])
+    unknown = fluid - set(f["id"] for f in flows_info)
+    if unknown:
+        sys.exit("Fluid flows " + ", ".join(sorted(unknown)) + " aren't in the test case")
     flows = {}
+    fluid_flows = {}
     for f in flows_info:
         source_id = f["source"]
         destination_id = f["destination"]
         source = hosts.get(source_id)
         destination = hosts.get(destination_id)
-        controller = CongestionControllerFast() if fast_insteadof_reno else CongestionControllerReno()
+        model = "fluid" if f["id"] in fluid else f.get("model", "packet")
+        if model == "fluid":
+            fluid_flows[f["id"]] = FluidFlow(f["id"], source, destination, f["amount"] * BYTES_PER_MEGABYTE, f["start"] * 1000, fast_insteadof_reno)
+            continue
+        elif model != "packet":
+            sys.exit("Flow " + f["id"] + " has unknown model " + str(model) + "; expected packet or fluid")
+        controller = CongestionControllerFast(adaptive_timeout) if fast_insteadof_reno else CongestionControllerReno(adaptive_timeout)
         flow = Flow(f["id"], source, destination, f["amount"] * BYTES_PER_MEGABYTE, f["start"] * 1000, controller)
         controller.flow = flow
         flows[f["id"]] = flow
         source.flows[f["id"]] = flow
 
-    return Simulation(links, flows, hosts, routers, verbose, fast_insteadof_reno) # verbose
+    # Trains are sent at the rate left by the fluid flows when they start, which the
+    # fluid model changes every step, so links only batch without fluid flows
+    if batching and not fluid_flows:
+        for link in links.values():
+            neighbors = [other for other in links.values() if other is not link and {other.deviceA, other.deviceB} & {link.deviceA, link.deviceB}]
+            link.batching = link.can_batch(neighbors)
+
+    return Simulation(links, flows, hosts, routers, verbose, fast_insteadof_reno, scheduler, log_file, aggregate, routing, pooling, profile, fluid_flows) # verbose
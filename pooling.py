@@ -0,0 +1,80 @@
+"""Optional free lists for the packets and events that the simulation creates and
+   discards by the hundred thousand.
+
+   A pooled class keeps a free list of instances that are no longer referenced.
+   While pooling is enabled, constructing the class takes an instance off its free
+   list, if there is one, and __init__ then overwrites every field. Objects are put
+   on the free list with `release` at the one point where they are finished with:
+   a payload or acknowledgement once the host it was sent to has handled it or a
+   link or router has dropped it, and a PacketArrivalEvent or LinkReadyEvent once
+   it has been performed. The Logger copies the fields it needs rather than keeping
+   packets, so logging doesn't stop packets being reused.
+
+   Pooling changes class-wide behaviour, so every simulation alive in a process
+   shares one mode. use_pooling sets the mode for a new simulation, and refuses one
+   whose mode differs from that of the simulations still alive.
+"""
+import sys, gc, weakref
+
+"""The classes whose instances can be reused, in the order they were declared"""
+POOLED_CLASSES = []
+
+"""The simulations alive in the process, which all share its pooling mode"""
+_simulations = weakref.WeakSet()
+
+"""Class decorator marking a class as one whose instances can be reused. Each pooled
+   class has its own free list, which is None while pooling is disabled."""
+def pooled(cls):
+    cls._free_list = None
+    cls.allocated = 0
+    POOLED_CLASSES.append(cls)
+    return cls
+
+def _new_from_free_list(cls, *args):
+    free_list = cls._free_list
+    if free_list:
+        return free_list.pop()
+    cls.allocated += 1
+    return object.__new__(cls)
+
+"""Makes pooled classes reuse released instances, and resets their allocation counts."""
+def enable_pooling():
+    for cls in POOLED_CLASSES:
+        cls._free_list = []
+        cls.allocated = 0
+        cls.__new__ = staticmethod(_new_from_free_list)
+
+"""Makes pooled classes allocate every instance afresh, and empties their free lists."""
+def disable_pooling():
+    for cls in POOLED_CLASSES:
+        if "__new__" in cls.__dict__:
+            del cls.__new__
+        cls._free_list = None
+
+"""Whether pooled classes are currently reusing instances."""
+def pooling_enabled():
+    return any(cls._free_list is not None for cls in POOLED_CLASSES)
+
+"""Sets the process's pooling mode for `sim`, a new simulation that pools if `pooling`
+   is set. The mode is only changed while no other simulation is alive, so a simulation
+   with the other mode exits with an error rather than changing how those run."""
+def use_pooling(sim, pooling):
+    if pooling != pooling_enabled() and _simulations:
+        # Simulations hold reference cycles, so finished ones may linger until collected
+        gc.collect()
+        if _simulations:
+            sys.exit("A simulation {0} pooling can't run in a process that has simulations {1} it".format(
+                "with" if pooling else "without", "without" if pooling else "with"))
+    if not _simulations:
+        if pooling:
+            enable_pooling()
+        else:
+            disable_pooling()
+    _simulations.add(sim)
+
+"""Puts `obj`, which nothing references any more, on its class's free list. Does
+   nothing if pooling is disabled or the class isn't pooled."""
+def release(obj):
+    free_list = obj._free_list
+    if free_list is not None:
+        free_list.append(obj)
@@ -0,0 +1,113 @@
+from __future__ import division
+import json
+
+"""How often, in simulated milliseconds, the profiler samples the size of the event queue"""
+PROFILE_SAMPLE_INTERVAL = 100
+
+class EventProfiler:
+    """Records where the wall time of a simulation goes, event by event. It is only
+       created for simulations run with profiling, whose step is then replaced by one that
+       reports to it, so simulations without profiling pay nothing for it.
+
+    Attributes:
+        event_counts: Number of events performed, keyed by event class name
+        event_seconds: Wall time spent performing events, keyed by event class name
+        dequeue_seconds: Wall time spent dequeueing events, including skipping
+            canceled ones
+        samples: List of (simulated time in ms, wall seconds since profiling started,
+            queue entries including canceled events, canceled events skipped so far),
+            taken every PROFILE_SAMPLE_INTERVAL simulated ms
+        start_wall_time: Wall time when the first event started, or None before it
+        start_simulated_time: Simulated time, in ms, when profiling started
+        end_wall_time: Wall time when the last event finished
+        end_simulated_time: Simulated time, in ms, of the last event
+        event_queue: The EventQueue of the simulation
+    """
+
+    def __init__(self, event_queue):
+        self.event_counts = {}
+        self.event_seconds = {}
+        self.dequeue_seconds = 0.0
+        self.samples = []
+        self.event_queue = event_queue
+        self.start_wall_time = None
+        self.end_wall_time = None
+        self.start_simulated_time = self.end_simulated_time = event_queue.clock.current_time
+        self._next_sample_time = self.start_simulated_time
+
+    """Records an event of class `name` whose dequeue started at wall time `started`,
+       which was performed from wall time `dequeued` until `now`."""
+    def record(self, name, started, dequeued, now):
+        if self.start_wall_time is None:
+            self.start_wall_time = started
+        (dequeue_seconds, perform_seconds) = (dequeued - started, now - dequeued)
+        count = self.event_counts.get(name)
+        if count is None:
+            self.event_counts[name] = 1
+            self.event_seconds[name] = perform_seconds
+        else:
+            self.event_counts[name] = count + 1
+            self.event_seconds[name] += perform_seconds
+        self.dequeue_seconds += dequeue_seconds
+        self.end_wall_time = now
+        simulated_time = self.event_queue.clock.current_time
+        self.end_simulated_time = simulated_time
+        if simulated_time >= self._next_sample_time:
+            self.samples.append((simulated_time, now - self.start_wall_time, len(self.event_queue), self.event_queue.canceled_skipped))
+            self._next_sample_time = simulated_time + PROFILE_SAMPLE_INTERVAL
+
+    """Wall seconds from the start of the first event to the end of the last."""
+    def wall_seconds(self):
+        if self.start_wall_time is None:
+            return 0.0
+        return self.end_wall_time - self.start_wall_time
+
+    """Simulated seconds per wall second over the profiled run, or None if no time passed."""
+    def simulated_per_wall_second(self):
+        wall_seconds = self.wall_seconds()
+        if wall_seconds <= 0:
+            return None
+        return (self.end_simulated_time - self.start_simulated_time) / 1000 / wall_seconds
+
+    """The profile as a dictionary that can be saved as JSON."""
+    def summary(self):
+        event_queue = self.event_queue
+        return {
+            "events": dict((name, {"count": count, "seconds": self.event_seconds[name]}) for (name, count) in self.event_counts.iteritems()),
+            "dequeue_seconds": self.dequeue_seconds,
+            "wall_seconds": self.wall_seconds(),
+            "simulated_seconds": (self.end_simulated_time - self.start_simulated_time) / 1000,
+            "simulated_per_wall_second": self.simulated_per_wall_second(),
+            "canceled_skipped": event_queue.canceled_skipped,
+            "canceled_compacted": event_queue.canceled_compacted,
+            "compactions": event_queue.compactions,
+            "queue_high_water_mark": event_queue.high_water_mark,
+            "queue_samples": [{"time": simulated_time, "wall_time": wall_time, "queue_size": size, "canceled_skipped": skipped}
+                              for (simulated_time, wall_time, size, skipped) in self.samples],
+        }
+
+    """Formats the profile as a table of event classes, most expensive first."""
+    def format_table(self):
+        total_count = sum(self.event_counts.itervalues())
+        total_seconds = sum(self.event_seconds.itervalues()) + self.dequeue_seconds
+        def share(seconds):
+            return "{0:.1%}".format(seconds / total_seconds) if total_seconds > 0 else "-"
+        lines = ["{0:<34}{1:>10}{2:>12}{3:>12}{4:>8}".format("event", "count", "total, s", "mean, us", "share")]
+        for name in sorted(self.event_seconds, key=self.event_seconds.get, reverse=True):
+            (count, seconds) = (self.event_counts[name], self.event_seconds[name])
+            lines.append("{0:<34}{1:>10}{2:>12.3f}{3:>12.2f}{4:>8}".format(name, count, seconds, seconds / count * 1e6, share(seconds)))
+        if total_count > 0:
+            lines.append("{0:<34}{1:>10}{2:>12.3f}{3:>12.2f}{4:>8}".format("(dequeue)", total_count, self.dequeue_seconds, self.dequeue_seconds / total_count * 1e6, share(self.dequeue_seconds)))
+        event_queue = self.event_queue
+        sizes = [size for (_, _, size, _) in self.samples]
+        lines.append("event queue: {0} entries at most, {1:.0f} on average over time".format(event_queue.high_water_mark, sum(sizes) / len(sizes) if sizes else 0))
+        lines.append("canceled events: {0} skipped at head, {1} compacted in {2} rebuilds".format(event_queue.canceled_skipped, event_queue.canceled_compacted, event_queue.compactions))
+        rate = self.simulated_per_wall_second()
+        lines.append("simulated {0:.2f}s in {1:.2f}s of wall time ({2} simulated s per wall s)".format(
+            (self.end_simulated_time - self.start_simulated_time) / 1000, self.wall_seconds(), "-" if rate is None else "{0:.3f}".format(rate)))
+        return "\n".join(lines) + "\n"
+
+    """Saves the profile to `path` as JSON."""
+    def write_json(self, path):
+        with open(path, "w") as json_file:
+            json.dump(self.summary(), json_file, indent=2, sort_keys=True)
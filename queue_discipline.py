@@ -0,0 +1,179 @@
+from __future__ import division
+import sys, math, random, zlib
+
+BYTES_PER_KILOBYTE = 1024.0
+
+"""The size, in bytes, of a full payload packet, used by RED as the typical packet
+   size and by CoDel as the MTU"""
+FULL_PACKET_SIZE = 1024
+
+class TailDrop:
+    """The queue discipline that drops a packet only when the buffer has no space for it."""
+
+    """Whether to drop `packet`, which fits in `buffer`, rather than enqueue it at `now`."""
+    def drop_on_enqueue(self, buffer, packet, now):
+        return False
+
+    """Whether to drop a packet that waited `sojourn` ms, rather than send it at `now`.
+       `buffer` no longer holds the packet."""
+    def drop_on_dequeue(self, buffer, sojourn, now):
+        return False
+
+    """Called when the last byte in `buffer` leaves it at `now`."""
+    def buffer_emptied(self, buffer, now):
+        pass
+
+class RandomEarlyDetection(TailDrop):
+    """Random Early Detection (Floyd and Jacobson, 1993) in byte mode. Arriving packets
+       are dropped with a probability that grows with the average queue length, so that
+       flows back off before the buffer overflows.
+
+       The average is an exponentially weighted moving average of the bytes queued,
+       updated on every arrival. While the queue is empty the average decays as though
+       full packets had arrived to an empty queue at the link's rate.
+
+    Attributes:
+        min_threshold: average queue length, in bytes, below which nothing is dropped
+        max_threshold: average queue length, in bytes, from which every packet is dropped
+        max_probability: drop probability as the average reaches max_threshold
+        weight: weight of each new sample in the average
+        average: the average queue length, in bytes
+        count: packets enqueued since the last drop while the average was above
+            min_threshold, or -1 while it was below
+        idle_since: when the queue last became empty, or None if it isn't empty
+        random: the random number generator, seeded per link so runs are repeatable
+    """
+
+    def __init__(self, min_threshold, max_threshold, max_probability=0.1, weight=0.002, seed=0):
+        self.min_threshold = min_threshold
+        self.max_threshold = max_threshold
+        self.max_probability = max_probability
+        self.weight = weight
+        self.average = 0.0
+        self.count = -1
+        self.idle_since = 0.0
+        self.random = random.Random(seed)
+
+    def drop_on_enqueue(self, buffer, packet, now):
+        queued = buffer.capacity - buffer.available_space
+        if self.idle_since is not None:
+            idle_packets = (now - self.idle_since) * buffer.link.rate / FULL_PACKET_SIZE
+            self.average *= (1 - self.weight) ** idle_packets
+            self.idle_since = None
+        self.average += self.weight * (queued - self.average)
+
+        if self.average < self.min_threshold:
+            self.count = -1
+            return False
+        if self.average >= self.max_threshold:
+            self.count = 0
+            return True
+        self.count += 1
+        probability = self.max_probability * (self.average - self.min_threshold) / (self.max_threshold - self.min_threshold)
+        probability *= packet.size / FULL_PACKET_SIZE
+        # Spread drops evenly rather than in clusters, as in the paper
+        if self.count * probability < 1:
+            probability /= 1 - self.count * probability
+        else:
+            probability = 1
+        if self.random.random() < probability:
+            self.count = 0
+            return True
+        return False
+
+    def buffer_emptied(self, buffer, now):
+        self.idle_since = now
+
+class CoDel(TailDrop):
+    """Controlled Delay (Nichols and Jacobson, 2012; RFC 8289). Packets are timestamped
+       as they are enqueued, and once every packet has waited longer than `target` for
+       a whole `interval`, packets are dropped as they leave the buffer, at a rate that
+       grows with the square root of the number of drops until the delay falls again.
+
+    Attributes:
+        target: acceptable standing queue delay, in milliseconds
+        interval: how long the delay must stay above target before dropping, in milliseconds
+        first_above_time: when the delay will have been above target for an interval,
+            or 0 if it is below target
+        dropping: whether the discipline is in the dropping state
+        drop_next: when to drop next in the dropping state
+        count: drops since entering the dropping state
+        last_count: count when the dropping state was last entered
+    """
+
+    def __init__(self, target=5.0, interval=100.0):
+        self.target = target
+        self.interval = interval
+        self.first_above_time = 0
+        self.dropping = False
+        self.drop_next = 0
+        self.count = 0
+        self.last_count = 0
+
+    def _control_law(self, time):
+        return time + self.interval / math.sqrt(self.count)
+
+    # Whether the delay has been above target for at least an interval
+    def _ok_to_drop(self, buffer, sojourn, now):
+        if sojourn < self.target or buffer.capacity - buffer.available_space <= FULL_PACKET_SIZE:
+            self.first_above_time = 0
+            return False
+        if self.first_above_time == 0:
+            self.first_above_time = now + self.interval
+            return False
+        return now >= self.first_above_time
+
+    def drop_on_dequeue(self, buffer, sojourn, now):
+        ok_to_drop = self._ok_to_drop(buffer, sojourn, now)
+        if self.dropping:
+            if not ok_to_drop:
+                self.dropping = False
+                return False
+            if now >= self.drop_next:
+                self.count += 1
+                self.drop_next = self._control_law(self.drop_next)
+                return True
+            return False
+        if ok_to_drop:
+            self.dropping = True
+            # If we were dropping recently, carry on at about the rate that last worked
+            delta = self.count - self.last_count
+            self.count = delta if delta > 1 and now - self.drop_next < 16 * self.interval else 1
+            self.drop_next = self._control_law(now)
+            self.last_count = self.count
+            return True
+        return False
+
+    def buffer_emptied(self, buffer, now):
+        self.first_above_time = 0
+        self.dropping = False
+
+"""The queue disciplines a link can use, keyed by the name used in test cases"""
+QUEUE_DISCIPLINES = {
+    "droptail": TailDrop,
+    "red": RandomEarlyDetection,
+    "codel": CoDel,
+}
+
+"""Creates the queue discipline described by `spec` for the link `link_id` with a buffer
+   of `capacity` bytes. `spec` is either a name from QUEUE_DISCIPLINES or a dictionary
+   with the name under "type" and any parameters: for RED, "min_threshold" and
+   "max_threshold" in KB (default a quarter and three quarters of the buffer), the
+   minimum below the maximum, "max_probability" and "weight"; for CoDel, "target" and "interval" in ms."""
+def make_queue_discipline(spec, link_id, capacity):
+    if spec is None:
+        spec = "droptail"
+    parameters = dict(spec) if isinstance(spec, dict) else {"type": spec}
+    name = parameters.pop("type", None)
+    if name not in QUEUE_DISCIPLINES:
+        sys.exit("Link " + str(link_id) + " has unknown queue discipline " + str(name) + "; expected one of " + ", ".join(sorted(QUEUE_DISCIPLINES)))
+    if name == "red":
+        for (threshold, default) in [("min_threshold", capacity / 4), ("max_threshold", capacity * 3 / 4)]:
+            parameters[threshold] = parameters[threshold] * BYTES_PER_KILOBYTE if threshold in parameters else default
+        if parameters["min_threshold"] >= parameters["max_threshold"]:
+            sys.exit("Link " + str(link_id) + " has a RED min_threshold that isn't below its max_threshold")
+        parameters["seed"] = zlib.crc32(link_id.encode("utf-8"))
+    try:
+        return QUEUE_DISCIPLINES[name](**parameters)
+    except TypeError:
+        sys.exit("Link " + str(link_id) + " has invalid parameters for queue discipline " + name + ": " + ", ".join(sorted(parameters)))
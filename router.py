@@ -1,29 +1,57 @@
-import sys
+import sys, heapq, itertools, zlib
 from device import Device
-from packet import StandardPacket, RoutingPacket
+from packet import PayloadPacket, AcknowledgementPacket, RoutingPacket
+from pooling import release
+
+"""Link weights that static routes can be computed with, keyed by name"""
+ROUTE_WEIGHTS = {
+    "delay": lambda link: link.delay,
+    "rate": lambda link: 1.0 / link.rate,
+}
 
 class RoutingTable():
     """A table that records which link ought to be used for a given host
        and can be updated based on new routing packets.
 
+       Static routes may give a host several equal-cost links, in which case
+       each flow is assigned one of them by a hash of the flow (ECMP), so the
+       packets of a flow all take the same path and are not reordered.
+
     Attributes:
         _table: The dictionary mapping host_identifier to the tuple (timestamp, link)
+        _multipath: The dictionary mapping host_identifier to its list of
+            equal-cost links, for hosts that have more than one
     """
 
     def __init__(self):
         self._table = {}
+        self._multipath = {}
 
-    def get_entry(self, host_identifier):
+    """Returns the link to send packets for the host over, or None if no route is known.
+       Among equal-cost links, the one at `flow_hash` modulo their number is chosen."""
+    def get_entry(self, host_identifier, flow_hash=0):
+        links = self._multipath.get(host_identifier)
+        if links is not None:
+            return links[flow_hash % len(links)]
         if host_identifier in self._table:
             return self._table[host_identifier][1]
         else:
             return None
 
+    """Installs fixed routes to the host over `links`, a list of one or more equal-cost
+       links, such as one computed by install_static_routes."""
+    def set_entry(self, host_identifier, links):
+        self._update_entry(host_identifier, 0, links[0])
+        if len(links) > 1:
+            self._multipath[host_identifier] = list(links)
+
     def _update_entry(self, host_identifier, timestamp, link):
         self._table[host_identifier] = (timestamp, link)
+        self._multipath.pop(host_identifier, None)
 
-    # Returns true when the information updated the routing table
-    def update_entry(self, host_identifier, timestamp, link):
+    # Returns true when the information updated the routing table.
+    # The cost of the path is ignored; the newest routing packet wins.
+    def update_entry(self, host_identifier, timestamp, link, cost=0):
         if host_identifier not in self._table:
             self._update_entry(host_identifier, timestamp, link)
             return True
@@ -35,6 +63,81 @@ class RoutingTable():
             else:
                 return False
 
+"""How much cheaper, as a fraction of the current route's cost, another route must be
+   before a CostRoutingTable moves a host's traffic onto it"""
+COST_HYSTERESIS = 0.25
+
+class CostRoutingTable(RoutingTable):
+    """A RoutingTable that routes each host over the cheapest of the links that routing
+       packets from it arrive on, rather than whichever link delivers a round of routing
+       packets first. A round (routing packets sent at the same timestamp) is over once
+       the first routing packet of a newer one arrives, and the route is chosen from the
+       costs of the links that carried the round.
+
+       Routes only move when another link is cheaper by more than COST_HYSTERESIS of
+       the current route's cost, and a router moves at most one route per round. Every
+       host's traffic sees the same costs, so otherwise they would all move onto the
+       same unloaded path at once, and all move back the next round. Until its first
+       round is over, a host is routed over the link its first routing packet arrived on.
+
+    Attributes:
+        _table: The dictionary mapping host_identifier to the tuple (timestamp, link)
+        _costs: The dictionary mapping host_identifier to a dictionary mapping each link
+            routing packets from the host arrived on to the tuple (timestamp, cost) of
+            the latest
+        _cheapest: The dictionary mapping host_identifier to the tuple (timestamp, cost)
+            of the cheapest routing packet of the latest round, the one last forwarded
+        _moved_round: The timestamp of the latest round in which a route moved
+    """
+
+    def __init__(self):
+        RoutingTable.__init__(self)
+        self._costs = {}
+        self._cheapest = {}
+        self._moved_round = None
+
+    # Returns true when the routing packet should be forwarded: when it is the first of
+    # a newer round, or is cheaper than those of its round forwarded so far
+    def update_entry(self, host_identifier, timestamp, link, cost=0):
+        costs = self._costs.setdefault(host_identifier, {})
+        if link in costs and costs[link][0] > timestamp:
+            return False
+        cheapest = self._cheapest.get(host_identifier)
+        if cheapest is not None and timestamp > cheapest[0]:
+            self._choose_route(host_identifier, cheapest[0])
+        costs[link] = (timestamp, cost)
+        if host_identifier not in self._table:
+            self._update_entry(host_identifier, timestamp, link)
+        if cheapest is None or timestamp > cheapest[0] or (timestamp == cheapest[0] and cost < cheapest[1]):
+            self._cheapest[host_identifier] = (timestamp, cost)
+            return True
+        return False
+
+    # Moves the host's route to the cheapest link that carried the round `timestamp`,
+    # which is over, if that is worth it. Links that carried nothing in the round are
+    # ignored, since a neighbor only forwards the copies on its cheapest path, and a
+    # route over one of them moves to the cheapest link regardless.
+    def _choose_route(self, host_identifier, timestamp):
+        costs = self._costs[host_identifier]
+        heard = [link for link in costs if costs[link][0] == timestamp]
+        cheapest_link = min(heard, key=lambda link: (costs[link][1], link.identifier))
+        current_link = self._table[host_identifier][1]
+        if cheapest_link is current_link:
+            return
+        if current_link not in heard:
+            self._update_entry(host_identifier, timestamp, cheapest_link)
+        elif self._moved_round != timestamp and costs[cheapest_link][1] < costs[current_link][1] * (1 - COST_HYSTERESIS):
+            self._update_entry(host_identifier, timestamp, cheapest_link)
+            self._moved_round = timestamp
+
+"""The routing table used by each routing mode, keyed by name. Static routes are
+   installed in plain RoutingTables by install_static_routes before the simulation."""
+ROUTING_TABLES = {
+    "dynamic": RoutingTable,
+    "cost": CostRoutingTable,
+    "static": RoutingTable,
+}
+
 class Router(Device):
     """A device that routes packets based on its routing table.
 
@@ -44,11 +147,17 @@ class Router(Device):
         logger: the Logger to be used
     """
 
-    def __init__(self, identifier):
+    def __init__(self, identifier, routing_table=None):
         Device.__init__(self, identifier)
-        self.routing_table = RoutingTable()
+        self.routing_table = routing_table if routing_table is not None else RoutingTable()
         self.links = []
         self.logger = None
+        self._flow_hashes = {}
+        self._packet_handlers = {
+            PayloadPacket: self._handle_standard_packet,
+            AcknowledgementPacket: self._handle_standard_packet,
+            RoutingPacket: self._handle_routing_packet,
+        }
 
     def __str__(self):
         return "Router ID  " + self.identifier + "\n"
@@ -56,37 +165,91 @@ class Router(Device):
     def set_logger(self, logger):
         self.logger = logger
 
-    """Update the routing table, and forward the routing packet over the proper links, if necessary."""
+    """Update the routing table, and forward the routing packet over the proper links, if necessary.
+       The forwarded packet carries the cost of its path so far, including `from_link`."""
     def _handle_routing_packet(self, packet, from_link):
-        assert isinstance(packet, RoutingPacket)
-        previous_link = self.routing_table.get_entry(packet.source) # Used for logging
-        if self.routing_table.update_entry(packet.source.identifier, packet.timestamp, from_link):
-            if from_link is not previous_link:
-                self.logger.log_updated_routing_table(self.identifier, packet.source.identifier, from_link.identifier, packet.timestamp)
+        host_identifier = packet.source.identifier
+        previous_link = self.routing_table.get_entry(host_identifier) # Used for logging
+        cost = packet.cost + from_link.cost()
+        forward = self.routing_table.update_entry(host_identifier, packet.timestamp, from_link, cost)
+        route = self.routing_table.get_entry(host_identifier)
+        if route is not previous_link:
+            self.logger.log_updated_routing_table(self.identifier, host_identifier, route.identifier, packet.timestamp)
+        if forward:
+            forwarded = RoutingPacket(packet.source, packet.timestamp, packet.size, cost)
             for link in self.links:
                 if link is not from_link:
-                    link.send_packet(packet, self)
+                    link.send_packet(forwarded, self)
 
     """Forward the packet over the correct link as determined by the routing table."""
-    def _handle_standard_packet(self, packet):
-        assert isinstance(packet, StandardPacket)
+    def _handle_standard_packet(self, packet, from_link):
         dest = packet.destination
-        link = self.routing_table.get_entry(dest.identifier)
+        link = self.routing_table.get_entry(dest.identifier, self._flow_hash(packet.flow_id))
         if link is not None:
             self.logger.log_router_sending_packet(self.identifier, packet, link.identifier)
             link.send_packet(packet, self)
         else:
             self.logger.log_router_dropped_packet_unknown_path(self.identifier, packet)
+            release(packet)
 
-    """Deliever a packet over `from_link` to the router for forwarding."""
+    """The link the router forwards the flow `flow_id` to the host `host_identifier`
+       over, or None if no route is known."""
+    def next_link(self, host_identifier, flow_id):
+        return self.routing_table.get_entry(host_identifier, self._flow_hash(flow_id))
+
+    # Hashes a flow for choosing among equal-cost links. The hash is salted with the
+    # router's identifier so that successive routers don't all make the same choice.
+    def _flow_hash(self, flow_id):
+        flow_hash = self._flow_hashes.get(flow_id)
+        if flow_hash is None:
+            flow_hash = zlib.crc32((self.identifier + ":" + flow_id).encode("utf-8")) & 0xffffffff
+            self._flow_hashes[flow_id] = flow_hash
+        return flow_hash
+
+    """Deliever a packet over `from_link` to the router for forwarding.
+       The handler is looked up by the packet's exact type."""
     def handle_packet(self, packet, from_link):
-        if isinstance(packet, StandardPacket):
-            self._handle_standard_packet(packet)
-        elif isinstance(packet, RoutingPacket):
-            self._handle_routing_packet(packet, from_link)
-        else:
+        try:
+            handler = self._packet_handlers[type(packet)]
+        except KeyError:
             sys.exit("Router doesn't know how to handle packet of type " + type(packet).__name__)
+        handler(packet, from_link)
 
     # Called during parsing to set up object graph
     def attach_link(self, link):
         self.links.append(link)
+
+"""Installs in every router's routing table the first link of its shortest path
+   to each host, where the length of a path is the sum of `weight` over its links.
+   Paths only pass through routers. With `multipath`, routers keep the first links
+   of every shortest path, and spread flows across them."""
+def install_static_routes(hosts, routers, weight, multipath=False):
+    for host in hosts.values():
+        for (router, links) in _shortest_path_links(host, weight).iteritems():
+            router.routing_table.set_entry(host.identifier, links if multipath else links[:1])
+
+# Dijkstra's algorithm outward from `host`. Returns, for each router that can
+# reach the host, the links the search reached it through at the shortest
+# distance, which are the first links of the router's shortest paths back to
+# the host, in the order they were found.
+def _shortest_path_links(host, weight):
+    distances = {host: 0}
+    first_links = {}
+    sequence = itertools.count()
+    queue = [(0, next(sequence), host)]
+    while queue:
+        (distance, _, device) = heapq.heappop(queue)
+        if distance > distances[device]:
+            continue
+        for link in ([device.link] if device is host else device.links):
+            neighbor = link.other_device(device)
+            if not isinstance(neighbor, Router):
+                continue
+            neighbor_distance = distance + weight(link)
+            if neighbor not in distances or neighbor_distance < distances[neighbor]:
+                distances[neighbor] = neighbor_distance
+                first_links[neighbor] = [link]
+                heapq.heappush(queue, (neighbor_distance, next(sequence), neighbor))
+            elif neighbor_distance == distances[neighbor] and link not in first_links[neighbor]:
+                first_links[neighbor].append(link)
+    return first_links
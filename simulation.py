@@ -1,9 +1,13 @@
-import sys, Queue
+import sys, time
 import stats
 from event import Event, FlowWakeEvent, RoutingUpdateEvent, PrintElapsedSimulationTimeEvent
 from logger import Logger
 from clock import Clock
-from event_queue import EventQueue
+from event_queue import SCHEDULERS, TRAIN_SCHEDULERS
+from pooling import use_pooling, release
+from profiler import EventProfiler
+from fluid import FluidModel
+import checkpoint
 
 class Simulation:
     """An instance of this class contains the data necessary
@@ -14,15 +18,32 @@ class Simulation:
         clock: the clock that must be updated whenever an event is dequeued
         links: dictionary of links (key is the ID, value is the Link object)
         flows: dictionary of flows (key is the ID, value is the Flow object)
+        fluid_flows: dictionary of flows modeled as fluid (key is the ID, value is the
+            FluidFlow object)
+        fluid_model: the FluidModel advancing the fluid flows
         hosts: dictionary of hosts (key is the ID, value is the Host object)
         routers: dictionary of routers (key is the ID, value is the Router object)
+        scheduler: name of the event queue implementation in event_queue.SCHEDULERS
+        unfinished_flows: number of flows, packet or fluid, that have not yet completed
+        log_file: path the logger streams its entries to, or None to keep them in memory
+        aggregate: whether the logger keeps only the windowed series that are graphed
+        routing: name of the routing mode in router.ROUTING_TABLES. Routing packets are
+            flooded periodically unless it is "static", in which case the routing
+            tables were filled in beforehand
+        pooling: whether delivered packets and performed events are reused (see pooling.py).
+            Every simulation alive in a process must have the same mode
+        profiler: the EventProfiler timing every event, or None unless profiling
     """
 
-    def __init__(self, links, flows, hosts, routers, verbose, fast_insteadof_reno):
+    def __init__(self, links, flows, hosts, routers, verbose, fast_insteadof_reno, scheduler="heap", log_file=None, aggregate=False, routing="dynamic", pooling=False, profile=False, fluid_flows=None):
         self.links = links
         self.flows = flows
+        self.fluid_flows = fluid_flows if fluid_flows is not None else {}
         self.hosts = hosts
         self.routers = routers
+        self.routing = routing
+        self.pooling = pooling
+        use_pooling(self, pooling)
 
         # Set up clocks
         self.clock = Clock()
@@ -31,57 +52,126 @@ class Simulation:
         for item in hosts.values():
             item.clock = self.clock
 
-        # Set up event schedulers
-        self.event_queue = EventQueue(self.clock)
+        # Set up event schedulers. Packet trains need to schedule events as of a later time
+        schedulers = TRAIN_SCHEDULERS if any(link.batching for link in links.values()) else SCHEDULERS
+        self.event_queue = schedulers[scheduler](self.clock)
         for flow in flows.values() + links.values() + hosts.values():
             flow.event_scheduler = self.event_queue
         for flow in flows.values():
             flow.controller.event_scheduler = self.event_queue
 
+        # Set up flow completion tracking
+        self.unfinished_flows = len(flows) + len(self.fluid_flows)
+        for flow in flows.values() + self.fluid_flows.values():
+            flow.completion_callback = self._flow_completed
+
         # Set up initial events
         for flow in flows.values():
             self.event_queue.delay_event(flow.start_time, FlowWakeEvent(flow))
-        for host in hosts.values():
-            self.event_queue.delay_event(0, RoutingUpdateEvent(host))
+        if routing != "static":
+            for host in hosts.values():
+                self.event_queue.delay_event(0, RoutingUpdateEvent(host))
 
         # Set up logging
-        self.logger = Logger(self.clock, verbose, fast_insteadof_reno)
-        for item in flows.values() + links.values() + hosts.values() + routers.values():
+        self.logger = Logger(self.clock, verbose, fast_insteadof_reno, log_file, aggregate)
+        for item in flows.values() + self.fluid_flows.values() + links.values() + hosts.values() + routers.values():
             item.set_logger(self.logger)
 
+        # Set up the fluid flows
+        self.fluid_model = FluidModel(self.fluid_flows.values(), self.event_queue, self.logger)
+
         # Set up PrintElapsedSimulationTimeEvents
         if not verbose:  # combining this with verbose mode would be chaos.
             self.event_queue.delay_event(0, PrintElapsedSimulationTimeEvent(self.clock.current_time, self.event_queue))
 
+        # Set up profiling
+        self.profiler = None
+        if profile:
+            self.enable_profiling()
+
         print "Simulation started..."
 
     """Performs a single event from the event queue."""
     def step(self):
-        try:
-            event = self.event_queue.dequeue_next_event()
-            event.perform()
-            return True
-        except Queue.Empty:
+        event = self.event_queue.dequeue_next_event()
+        if event is None:
+            return False
+        event.perform()
+        release(event)
+        return True
+
+    """Starts timing every event with an EventProfiler. Only a profiled simulation
+       replaces its step, so the others don't pay for the timing."""
+    def enable_profiling(self):
+        self.profiler = EventProfiler(self.event_queue)
+        self.step = self._profiled_step
+
+    # step for profiled simulations, which also times the event for the profiler
+    def _profiled_step(self):
+        started = time.time()
+        event = self.event_queue.dequeue_next_event()
+        if event is None:
             return False
+        dequeued = time.time()
+        name = event.__class__.__name__
+        event.perform()
+        release(event)
+        self.profiler.record(name, started, dequeued, time.time())
+        return True
+
+    """Called by each flow once it has completed."""
+    def _flow_completed(self, flow):
+        self.unfinished_flows -= 1
 
     """Determines whether all flows have been completed."""
     def all_flows_finished(self):
-        for flow in self.flows.values():
-            if not flow.completed():
-                return False
-        return True
+        return self.unfinished_flows == 0
 
     """Repeatedly performs events from the queue until all flows have been completed."""
     def run(self):
-        while not self.all_flows_finished():
+        while self.unfinished_flows > 0:
             if not self.step():
                 sys.exit("TCP deadlock: event queue empty but flows not complete")
 
         print "All flows finished transmitting!"
         print "Elapsed time in simulation world: " + str(self.clock)
 
+    """Performs events scheduled up to and including `time` (in milliseconds), stopping
+       early if all flows complete, and returns the number of events performed.
+       The clock is left at `time` unless the flows completed before it."""
+    def run_until(self, time):
+        performed = 0
+        while self.unfinished_flows > 0:
+            next_time = self.event_queue.next_event_time()
+            if next_time is None or next_time > time:
+                self.clock.current_time = max(self.clock.current_time, time)
+                break
+            self.step()
+            performed += 1
+        return performed
+
+    """Performs at most `count` events, stopping early if all flows complete or
+       the queue runs out, and returns the number of events performed."""
+    def run_events(self, count):
+        performed = 0
+        while performed < count and self.unfinished_flows > 0:
+            if not self.step():
+                break
+            performed += 1
+        return performed
+
+    """Saves the whole state of the simulation to a snapshot file at `path`, from which
+       checkpoint.load_checkpoint restores it, and returns the file's size in bytes."""
+    def checkpoint(self, path):
+        return checkpoint.save_checkpoint(self, path)
+
+    """Returns an independent copy of the simulation in its current state, which can
+       be changed and run without affecting this one."""
+    def fork(self):
+        return checkpoint.loads(checkpoint.dumps(self))
+
     def __str__(self):
         return ("----LINKS----\n" + "\n".join(map(str, self.links.values())) + "\n"
-                "----FLOWS----\n" + "\n".join(map(str, self.flows.values())) + "\n"
+                "----FLOWS----\n" + "\n".join(map(str, self.flows.values() + self.fluid_flows.values())) + "\n"
                 "----HOSTS----\n" + "\n".join(map(str, self.hosts.values())) + "\n"
                 "----ROUTERS----\n" + "\n".join(map(str, self.routers.values())))
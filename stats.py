@@ -1,79 +1,99 @@
-import sys
+import sys, os, csv, json
+import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 from collections import Counter
-from operator import itemgetter
 
 BYTES_PER_KILOBYTE = 1024.0
 BYTES_PER_MEGABYTE = 1048576.0
 BYTES_PER_MEGABIT = 131072.0
 
+WINDOW_SIZE = 100   # milliseconds
+
+"""Returns, for each of `times` (in milliseconds, ascending), the number of the window
+   it is counted in by block_average and block_sum.
+
+   Both move on to the next window when a sample lies beyond the end of the current
+   one, but by only one window per sample, so after a gap they catch up gradually. If
+   c_i is the number of whole windows that lie before sample i, sample i therefore lands
+   in window k_i = min(c_i, k_(i-1) + 1), starting from window 0, which unrolls into
+   k_i = i + min(1, min over j <= i of (c_j - j))."""
+def window_indices(times):
+    times = np.asarray(times, dtype=float)
+    # c_i is the largest n with times[i] > n * WINDOW_SIZE. Division can be off by one
+    # near window boundaries, so correct it with the same comparison the loop made.
+    passed = np.ceil(times / WINDOW_SIZE) - 1
+    passed += times > (passed + 1) * WINDOW_SIZE
+    passed -= times <= passed * WINDOW_SIZE
+    passed = np.maximum(passed, 0)
+    steps = np.arange(len(times))
+    return (steps + np.minimum(np.minimum.accumulate(passed - steps), 1)).astype(int)
 
 def block_average(input_times, input_values):   # input_times in milliseconds, return times in seconds
     assert(len(input_times) == len(input_values))
+    times = np.asarray(input_times, dtype=float)
+    values = np.asarray(input_values, dtype=float)
+
+    # the first data point is kept as is
+    output_times = [times[0] / 1000.0]
+    output_values = [values[0]]
+    if len(times) == 1:
+        return (output_times, output_values)
+
+    # average the rest per window; bincount adds up each window in order, like a loop would
+    (windows, inverse, counts) = np.unique(window_indices(times[1:]), return_inverse=True, return_counts=True)
+    averages = np.bincount(inverse, weights=values[1:]) / counts
 
-    output_times = []
-    output_values = []
-
-    # add first data point
-    output_times.append(input_times.pop(0) / 1000.0)
-    output_values.append(input_values.pop(0))
-
-    last_interval_start = 0;
-    window_size = 100;   # milliseconds
-    current_window_count = 0.0;
-    current_window_total = 0;
-
-    # add the rest of the averaged data points
-    for i in range(len(input_times)):
-        time = input_times[i]
-        if time - last_interval_start > window_size:
-            if current_window_count > 0:
-                output_times.append((last_interval_start + (window_size / 2)) / 1000.0)
-                output_values.append(current_window_total / current_window_count)
-            current_window_count = 0.0
-            current_window_total = 0
-            last_interval_start += window_size
-        current_window_count += 1
-        current_window_total += input_values[i]
-
-    # add last data point
-    output_times.append(input_times[-1] / 1000.0)
-    output_values.append(current_window_total / current_window_count)
+    # every window but the last is placed at its midpoint, the last at the last data point
+    output_times += ((windows[:-1] * WINDOW_SIZE + WINDOW_SIZE // 2) / 1000.0).tolist()
+    output_times.append(times[-1] / 1000.0)
+    output_values += averages.tolist()
 
     return (output_times, output_values)
 
-def block_sum(input_times, input_values):
+def block_sum(input_times, input_values):   # the final, partial window is left out
     assert(len(input_times) == len(input_values))
+    if len(input_times) == 0:
+        return ([], [])
 
-    output_times = []
-    output_values = []
+    windows = window_indices(input_times)
+    last_window = windows[-1]
+    totals = np.bincount(windows, weights=np.asarray(input_values, dtype=float), minlength=last_window + 1)
+    output_times = ((np.arange(last_window) * WINDOW_SIZE + WINDOW_SIZE // 2) / 1000.0).tolist()
 
-    last_interval_start = 0;
-    window_size = 100;   # milliseconds
-    current_window_total = 0;
+    return (output_times, totals[:last_window].tolist())
 
-    for i in range(len(input_times)):
-        time = input_times[i]
-        if time - last_interval_start > window_size:
-            output_times.append((last_interval_start + (window_size / 2)) / 1000.0)
-            output_values.append(current_window_total)
-            current_window_total = 0
-            last_interval_start += window_size
-        current_window_total += input_values[i]
+"""Returns the named column of a log stream as a NumPy array, without copying it."""
+def _column(stream, name):
+    column = stream.columns[name]
+    return np.frombuffer(column, dtype=column.typecode)
 
-    return (output_times, output_values)
+"""Returns a key for each packet in a log stream that is unique to its (identifier, flow_id)."""
+def _packet_keys(stream, name, identifier_count):
+    flow_ids = _column(stream, name + "_flow_id").astype(np.int64)
+    return flow_ids * identifier_count + _column(stream, name + "_identifier")
+
+"""Returns a dictionary mapping each identifier in the interned `ids` column to the
+   indices of its entries, in logged order."""
+def _group(logger, ids):
+    return dict((logger.identifiers.name(i), np.flatnonzero(ids == i)) for i in np.unique(ids))
+
+"""Selects plot `index` of `num_plots`, laid out in two columns."""
+def _subplot(num_plots, index):
+    return plt.subplot(-(-num_plots // 2), min(num_plots, 2), index)
 
+"""Free buffer space in KB averaged over windows, as {link_id: (times, values)}."""
+def free_buffer_space_series(logger):
+    if logger.windows is not None:
+        return logger.windows.free_buffer_space_series()
+    logs = logger.link_buffer_available_space_logs
+    times = _column(logs, "time")
+    spaces = _column(logs, "available_space") / BYTES_PER_KILOBYTE
+    return dict((link_id, block_average(times[i], spaces[i])) for (link_id, i) in _group(logger, _column(logs, "link_id")).iteritems())
 
 def display_free_buffers_space(logger, num_plots, index):
-    plt.subplot(num_plots / 2 + 1, 2, index)
-
-    graphs = {}  # keys are link_id, values are [(time, available_space)]
-    for log in logger.link_buffer_available_space_logs:
-        graphs.setdefault(log["link_id"], []).append((log["time"], log["available_space"] / BYTES_PER_KILOBYTE))
-    for link_id, link_data in graphs.iteritems():
-        times, spaces = [list(c) for c in zip(*link_data)]  # convert [(time, available_space)] to [time] and [available_space]
-        x, y = block_average(times, spaces)
+    _subplot(num_plots, index)
+    for link_id, (x, y) in free_buffer_space_series(logger).iteritems():
         plt.plot(x, y, label=link_id)
     plt.xlabel("time, seconds")
     plt.ylabel("free buffer space, KB")
@@ -81,14 +101,20 @@ def display_free_buffers_space(logger, num_plots, index):
     plt.ylim(ymin=0)
     plt.legend(loc='lower left', fontsize=8, ncol=3, fancybox=True)
 
+"""MB left to transmit averaged over windows, as {flow_id: (times, values)}."""
+def amounts_left_series(logger):
+    if logger.windows is not None:
+        return logger.windows.amounts_left_series()
+    series = {}
+    for logs in [logger.flow_received_acknowledgement_logs, logger.fluid_flow_logs]:
+        times = _column(logs, "time")
+        remaining = _column(logs, "amount_left") / BYTES_PER_MEGABYTE
+        series.update((flow_id, block_average(times[i], remaining[i])) for (flow_id, i) in _group(logger, _column(logs, "flow_id")).iteritems())
+    return series
+
 def display_amounts_left(logger, num_plots, index):
-    plt.subplot(-(-num_plots // 2), 2, index)
-    graphs = {}  # keys are flow_id, values are [(time, amount_left)]
-    for log in logger.flow_received_acknowledgement_logs:
-        graphs.setdefault(log["flow_id"], []).append((log["time"], log["amount_left"] / BYTES_PER_MEGABYTE))
-    for flow_id, flow_data in graphs.iteritems():
-        times, remaining = [list(c) for c in zip(*flow_data)]   # convert [(time, amount_left)] to [time] and [amount_left]
-        x, y = block_average(times, remaining)
+    _subplot(num_plots, index)
+    for flow_id, (x, y) in amounts_left_series(logger).iteritems():
         plt.plot(x, y, label=flow_id)
     plt.xlabel("time, seconds")
     plt.ylabel("amount left to transmit, MB")
@@ -96,40 +122,57 @@ def display_amounts_left(logger, num_plots, index):
     plt.ylim(ymin=0)
     plt.legend(loc='upper right', fontsize=8, fancybox=True)
 
-def display_packet_round_trip_time(logger, num_plots, index):
-    plt.subplot(-(-num_plots // 2), 2, index)
-
+"""Returns the time, round trip time in ms and flow id of each acknowledgement of a
+   packet that was logged as sent."""
+def _acknowledgement_round_trip_times(logger):
     # The tricky bit here is that we have to account for sending
     # the same packet id multiple times in the case of dropped packets.
     # Packet ID's are also not unique across flows, so we use (packet_id, flow_id) as
     # a unique(ish, see first sentence) identifier.
 
-    trips = {}  # keys are (packet_id, flow_id)'s, values are [start, finish] times
-    for log in logger.flow_received_acknowledgement_logs:
-        k = (log["packet"].identifier, log["packet"].flow_id)
-        # We should only ever receive an ack packet once
-        # assert(k not in trips)
-        trips[k] = [143143143143, log["time"]]
-    for log in logger.flow_send_packet_logs:
-        # We might have sent a packet 179 times, but we only care about the first time
-        k = (log["packet"].identifier, log["packet"].flow_id)
-        assert(k in trips)
-        if log["time"] < trips[k][0]:
-            trips[k][0] = log["time"]
-        assert(trips[k][0] != 143143143143)
-        assert(trips[k][1] - trips[k][0] > 0)
-
-    graphs = {}  # keys are flow_id, values are [(time, packet)]
-    for log in logger.flow_received_acknowledgement_logs:
-        graphs.setdefault(log["flow_id"], []).append((log["time"], log["packet"]))
-    for flow_id, flow_data in graphs.iteritems():
-        times = []
-        rtts = []
-        for d in flow_data:
-            trip = trips[(d[1].identifier, d[1].flow_id)]
-            times.append(d[0])
-            rtts.append(trip[1]-trip[0])
-        x, y = block_average(times, rtts)
+    # Each trip starts at the first time the packet was sent and ends at the last time it
+    # was acknowledged. Both are found by sorting on packet keys rather than a dict lookup
+    # per entry: the logs are in time order, so the first occurrence of each key in the
+    # sends, and the first occurrence in the reversed acknowledgements, are the ones we want.
+    acks = logger.flow_received_acknowledgement_logs
+    sends = logger.flow_send_packet_logs
+    identifier_count = max(_column(sends, "packet_identifier").max() if len(sends) else 0,
+                           _column(acks, "packet_identifier").max() if len(acks) else 0) + 1
+    ack_times = _column(acks, "time")
+    ack_keys = _packet_keys(acks, "packet", identifier_count)
+    (trip_keys, last_acks) = np.unique(ack_keys[::-1], return_index=True)
+    trip_ends = ack_times[::-1][last_acks]
+    (sent_keys, first_sends) = np.unique(_packet_keys(sends, "packet", identifier_count), return_index=True)
+    # A simulation stopped early has sent packets that aren't acknowledged yet, so only
+    # the packets both sent and acknowledged make trips
+    acknowledged = np.in1d(sent_keys, trip_keys)
+    trip_starts = _column(sends, "time")[first_sends[acknowledged]]
+    sent = np.in1d(trip_keys, sent_keys)
+    (trip_keys, trip_ends) = (trip_keys[sent], trip_ends[sent])
+    assert((trip_ends - trip_starts > 0).all())
+
+    matched = np.in1d(ack_keys, trip_keys)
+    trips = np.searchsorted(trip_keys, ack_keys[matched])
+    return (ack_times[matched], trip_ends[trips] - trip_starts[trips], _column(acks, "flow_id")[matched])
+
+"""Returns the round trip times of each flow's acknowledgements, as {flow_id: rtts}."""
+def _round_trip_times(logger):
+    (_, rtts, flow_ids) = _acknowledgement_round_trip_times(logger)
+    return dict((flow_id, rtts[i]) for (flow_id, i) in _group(logger, flow_ids).iteritems())
+
+"""Round trip times in ms averaged over windows, as {flow_id: (times, values)}."""
+def round_trip_time_series(logger):
+    if logger.windows is not None:
+        return logger.windows.round_trip_time_series()
+    (ack_times, rtts, flow_ids) = _acknowledgement_round_trip_times(logger)
+    series = dict((flow_id, block_average(ack_times[i], rtts[i])) for (flow_id, i) in _group(logger, flow_ids).iteritems())
+    fluid = logger.fluid_flow_logs
+    series.update((flow_id, block_average(_column(fluid, "time")[i], _column(fluid, "rtt")[i])) for (flow_id, i) in _group(logger, _column(fluid, "flow_id")).iteritems())
+    return series
+
+def display_packet_round_trip_time(logger, num_plots, index):
+    _subplot(num_plots, index)
+    for flow_id, (x, y) in round_trip_time_series(logger).iteritems():
         plt.plot(x, y, label=flow_id)
     plt.xlabel("time, seconds")
     plt.ylabel("RTT, ms")
@@ -137,25 +180,32 @@ def display_packet_round_trip_time(logger, num_plots, index):
     plt.ylim(ymin=0)
     plt.legend(loc="center right", fontsize=8, fancybox=True)
 
+"""Fraction of packets dropped averaged over windows, for the links and routers that
+   dropped any packets, as {link_id or router_id: (times, values)}."""
+def dropped_packets_series(logger):
+    if logger.windows is not None:
+        return logger.windows.dropped_packets_series()
+    # Pairs of (logs of dropped packets, logs of packets passed on) for routers and for links
+    droppers = [("router_id", [logger.router_dropped_packet_unknown_path_logs], [logger.router_sending_packet_logs]),
+                ("link_id", [logger.link_dropped_packet_buffer_full_logs, logger.link_dropped_packet_queue_discipline_logs],
+                            [logger.link_sent_packet_immediately_logs, logger.link_sent_packet_from_buffer_logs])]
+    series = {}
+    for (id_field, dropped_logs, sent_logs) in droppers:
+        dropped_times = np.concatenate([_column(logs, "time") for logs in dropped_logs])
+        dropped_ids = np.concatenate([_column(logs, id_field) for logs in dropped_logs])
+        sent = [(_column(logs, "time"), _column(logs, id_field)) for logs in sent_logs]
+        # we only want to log unlost packets for links/routers that lost some packets
+        for dropper in np.unique(dropped_ids):
+            times = [dropped_times[dropped_ids == dropper]] + [sent_times[sent_ids == dropper] for (sent_times, sent_ids) in sent]
+            drops = [np.ones(len(times[0]))] + [np.zeros(len(t)) for t in times[1:]]
+            times = np.concatenate(times)
+            order = np.argsort(times, kind="mergesort")   # stable sort by time
+            series[logger.identifiers.name(dropper)] = block_average(times[order], np.concatenate(drops)[order])
+    return series
+
 def display_dropped_packets(logger, num_plots, index):
-    sp = plt.subplot(-(-num_plots // 2), 2, index)
-
-    graphs = {}  # keys are link_id/router_id, values are [(time, num_dropped)]
-    for log in logger.router_dropped_packet_unknown_path_logs:
-        graphs.setdefault(log["router_id"], []).append((log["time"], 1))
-    for log in logger.router_sending_packet_logs:
-        if log["router_id"] in graphs:  # we only want to log unlost packets for links/routers that lost some packets
-            graphs[log["router_id"]].append((log["time"], 0))
-    for log in logger.link_dropped_packet_buffer_full_logs:
-        graphs.setdefault(log["link_id"], []).append((log["time"], 1))
-    for log in logger.link_sent_packet_immediately_logs + logger.link_sent_packet_from_buffer_logs:
-        if log["link_id"] in graphs:  # we only want to log unlost packets for links/routers that lost some packets
-            graphs[log["link_id"]].append((log["time"], 0))
-
-    for dropper_id, dropper_data in graphs.iteritems():
-        dropper_data.sort(key=itemgetter(0))   # sort by time
-        times, drops = [list(c) for c in zip(*dropper_data)]  # convert [(time, num_dropped)] to [time] and [num_dropped]
-        x, y = block_average(times, drops)
+    sp = _subplot(num_plots, index)
+    for dropper_id, (x, y) in dropped_packets_series(logger).iteritems():
         plt.plot(x, y, label=dropper_id)
     plt.xlabel("time, seconds")
     plt.ylabel("fraction of packets dropped")
@@ -163,19 +213,28 @@ def display_dropped_packets(logger, num_plots, index):
     # sp.yaxis.set_major_locator(MaxNLocator(integer=True))  # only show integer y-axis ticks
     plt.legend(loc="upper right", fontsize=8, fancybox=True)
 
-def display_link_rate(logger, num_plots, index):
-    sp = plt.subplot(-(-num_plots // 2), 2, index)
-
-    graphs = {}  # keys are link_id, values are [(time, bytes_sent)]
-    for log in logger.link_sent_packet_immediately_logs + logger.link_sent_packet_from_buffer_logs:
-        graphs.setdefault(log["link_id"], []).append((log["time"], log["packet"].size))
+"""Link rate in Mb/s over windows, as {link_id: (times, values)}."""
+def link_rate_series(logger):
+    if logger.windows is not None:
+        bytes_sent = logger.windows.bytes_sent_series()
+    else:
+        sent_logs = [logger.link_sent_packet_immediately_logs, logger.link_sent_packet_from_buffer_logs]
+        times = np.concatenate([_column(logs, "time") for logs in sent_logs])
+        sizes = np.concatenate([_column(logs, "packet_size") for logs in sent_logs])
+        link_ids = np.concatenate([_column(logs, "link_id") for logs in sent_logs])
+        bytes_sent = {}
+        for (link_id, i) in _group(logger, link_ids).iteritems():
+            order = np.argsort(times[i], kind="mergesort")   # stable sort by time
+            bytes_sent[link_id] = block_sum(times[i][order], sizes[i][order])
+    series = {}
+    for link_id, (x, y) in bytes_sent.iteritems():
+        series[link_id] = (x, [i * 10 / BYTES_PER_MEGABIT for i in y])  # Convert the graph from bytes/100ms to Mb/s
+    return series
 
-    for dropper_id, dropper_data in graphs.iteritems():
-        dropper_data.sort(key=itemgetter(0))   # sort by time
-        times, bytes_sent = [list(c) for c in zip(*dropper_data)]  # convert [(time, bytes_sent)] to [time] and [bytes_sent]
-        x, y = block_sum(times, bytes_sent)
-        y = [i * 10 / BYTES_PER_MEGABIT for i in y]  # Convert the graph from bytes/100ms to Mb/s
-        plt.plot(x, y, label=dropper_id)
+def display_link_rate(logger, num_plots, index):
+    sp = _subplot(num_plots, index)
+    for link_id, (x, y) in link_rate_series(logger).iteritems():
+        plt.plot(x, y, label=link_id)
     plt.xlabel("time, seconds")
     plt.ylabel("Mb/s")
     plt.xlim(xmin=0)
@@ -184,6 +243,9 @@ def display_link_rate(logger, num_plots, index):
 
 graph_functions = [display_free_buffers_space, display_amounts_left, display_packet_round_trip_time, display_dropped_packets, display_link_rate]
 
+"""The series plotted by each of graph_functions, in the same order"""
+series_functions = [free_buffer_space_series, amounts_left_series, round_trip_time_series, dropped_packets_series, link_rate_series]
+
 def show_graphs(logger):
     i = 1
     num_plots = len(graph_functions)
@@ -193,3 +255,111 @@ def show_graphs(logger):
     fig = plt.gcf()
     fig.canvas.set_window_title("TCP Fast" if logger.fast_insteadof_reno else "TCP Reno")
     plt.show()
+
+"""Per-flow start and completion times, bytes sent, throughput and round trip times,
+   the number of packets dropped by each link and router, and the bytes each link sent
+   with its average throughput until the last flow completed, as a dictionary."""
+def summarize(logger):
+    if logger.windows is not None:
+        (flows, drops, link_bytes) = logger.windows.summary()
+    else:
+        flows = {}
+        for (name, logs) in [("start", logger.flow_started_logs), ("completion", logger.flow_completed_logs)]:
+            for log in logs:
+                flows.setdefault(log["flow_id"], {})[name] = log["time"]
+        sends = logger.flow_send_packet_logs
+        identifiers = _column(sends, "packet_identifier")
+        sizes = _column(sends, "packet_size")
+        for (flow_id, i) in _group(logger, _column(sends, "flow_id")).iteritems():
+            (_, first_sends) = np.unique(identifiers[i], return_index=True)
+            flows.setdefault(flow_id, {})["bytes"] = int(sizes[i][first_sends].sum())
+        for (flow_id, rtts) in _round_trip_times(logger).iteritems():
+            flows.setdefault(flow_id, {}).update(mean_rtt=float(rtts.mean()), p99_rtt=float(np.percentile(rtts, 99)))
+        # Fluid flows' round trip times are sampled once per update
+        fluid = logger.fluid_flow_logs
+        for (flow_id, i) in _group(logger, _column(fluid, "flow_id")).iteritems():
+            rtts = _column(fluid, "rtt")[i]
+            flows.setdefault(flow_id, {}).update(bytes=int(_column(fluid, "delivered")[i].max()), mean_rtt=float(rtts.mean()), p99_rtt=float(np.percentile(rtts, 99)))
+        drops = {}
+        for (logs, id_field) in [(logger.link_dropped_packet_buffer_full_logs, "link_id"), (logger.link_dropped_packet_queue_discipline_logs, "link_id"),
+                                 (logger.router_dropped_packet_unknown_path_logs, "router_id")]:
+            for (dropper_id, i) in _group(logger, _column(logs, id_field)).iteritems():
+                drops[dropper_id] = drops.get(dropper_id, 0) + len(i)
+        link_sends = [logger.link_sent_packet_immediately_logs, logger.link_sent_packet_from_buffer_logs]
+        sizes = np.concatenate([_column(logs, "packet_size") for logs in link_sends])
+        link_ids = np.concatenate([_column(logs, "link_id") for logs in link_sends])
+        link_bytes = dict((link_id, int(sizes[i].sum())) for (link_id, i) in _group(logger, link_ids).iteritems())
+    for flow in flows.itervalues():
+        if "start" in flow and "completion" in flow and "bytes" in flow:
+            flow["duration"] = (flow["completion"] - flow["start"]) / 1000.0
+            flow["throughput"] = flow["bytes"] / BYTES_PER_MEGABIT / flow["duration"] if flow["duration"] > 0 else None
+    completions = [flow["completion"] for flow in flows.itervalues() if "completion" in flow]
+    end = max(completions) / 1000.0 if completions else None
+    links = dict((link_id, {"bytes": size, "throughput": size / BYTES_PER_MEGABIT / end if end else None}) for (link_id, size) in link_bytes.iteritems())
+    return {"congestion_control": "FAST" if logger.fast_insteadof_reno else "Reno", "flows": flows, "drops": drops, "links": links}
+
+"""Formats the dictionary returned by summarize as a table."""
+def format_summary(summary):
+    def cell(value, scale=1.0):
+        return "-" if value is None else "{0:.3f}".format(value * scale)
+    lines = ["TCP " + summary["congestion_control"],
+             "{0:<8}{1:>10}{2:>14}{3:>10}{4:>18}{5:>14}{6:>14}".format("flow", "start, s", "completion, s", "MB", "throughput, Mb/s", "mean RTT, ms", "p99 RTT, ms")]
+    for (flow_id, flow) in sorted(summary["flows"].iteritems()):
+        lines.append("{0:<8}{1:>10}{2:>14}{3:>10}{4:>18}{5:>14}{6:>14}".format(flow_id, cell(flow.get("start"), 0.001), cell(flow.get("completion"), 0.001),
+                     cell(flow.get("bytes"), 1 / BYTES_PER_MEGABYTE), cell(flow.get("throughput")), cell(flow.get("mean_rtt")), cell(flow.get("p99_rtt"))))
+    lines.append("{0:<8}{1:>10}".format("dropper", "dropped"))
+    for (dropper_id, count) in sorted(summary["drops"].iteritems()):
+        lines.append("{0:<8}{1:>10}".format(dropper_id, count))
+    lines.append("{0:<8}{1:>10}{2:>18}".format("link", "sent MB", "throughput, Mb/s"))
+    for (link_id, link) in sorted(summary["links"].iteritems()):
+        lines.append("{0:<8}{1:>10}{2:>18}".format(link_id, cell(link["bytes"], 1 / BYTES_PER_MEGABYTE), cell(link["throughput"])))
+    return "\n".join(lines) + "\n"
+
+"""Saves every graph to `directory` without displaying anything: each graph as its own
+   figure in each of `formats` (such as png, svg or pdf) and its series as CSV, all series
+   together as series.json, and the summary as summary.txt and summary.json."""
+def export_graphs(logger, directory, formats):
+    plt.switch_backend("agg")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    title = "TCP Fast" if logger.fast_insteadof_reno else "TCP Reno"
+    all_series = {}
+    for (f, series_function) in zip(graph_functions, series_functions):
+        name = series_function.__name__[:-len("_series")]
+        fig = plt.figure()
+        f(logger, 1, 1)
+        plt.title(title)
+        for extension in formats:
+            fig.savefig(os.path.join(directory, name + "." + extension))
+        plt.close(fig)
+
+        series = series_function(logger)
+        all_series[name] = dict((key, {"times": list(x), "values": list(y)}) for (key, (x, y)) in series.iteritems())
+        with open(os.path.join(directory, name + ".csv"), "wb") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(["id", "time", "value"])
+            for (key, (x, y)) in sorted(series.iteritems()):
+                writer.writerows([key, repr(time), repr(value)] for (time, value) in zip(x, y))
+    with open(os.path.join(directory, "series.json"), "w") as json_file:
+        json.dump(all_series, json_file, sort_keys=True)
+
+    summary = summarize(logger)
+    with open(os.path.join(directory, "summary.json"), "w") as json_file:
+        json.dump(summary, json_file, indent=2, sort_keys=True)
+    with open(os.path.join(directory, "summary.txt"), "w") as text_file:
+        text_file.write(format_summary(summary))
+    return summary
+
+if __name__ == "__main__":
+    import argparse
+    from logger import load_logger
+    parser = argparse.ArgumentParser(description='Display graphs from a log file written by main.py --log-file.')
+    parser.add_argument('-o', '--output-dir', action="store", dest="output_dir", default=None, help="save graphs, series and a summary to this directory instead of displaying them")
+    parser.add_argument('--formats', action="store", dest="formats", default="png", help="comma-separated image formats to save graphs in (default png)")
+    parser.add_argument('log_file', action="store")
+    results = parser.parse_args()
+    logger = load_logger(results.log_file)
+    if results.output_dir:
+        sys.stdout.write(format_summary(export_graphs(logger, results.output_dir, results.formats.split(","))))
+    else:
+        show_graphs(logger)
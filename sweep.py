@@ -0,0 +1,241 @@
+from __future__ import division
+import sys, os, copy, json, time, shutil, tempfile, argparse, itertools, multiprocessing
+from collections import OrderedDict
+from parsing import read_testcase, generate_simulation_from_testcase
+from benchmark import quiet, run_simulation
+from checkpoint import load_checkpoint
+
+BYTES_PER_MEGABIT = 131072.0
+
+"""Link properties of the test case that can be swept. A parameter named after one sets
+   it on every link, and one named property.link_id, such as buffer.L1, on that link only."""
+LINK_PROPERTIES = ["rate", "delay", "buffer", "queue_discipline"]
+
+"""Options of generate_simulation_from_testcase that can be swept"""
+SIMULATION_OPTIONS = ["scheduler", "routing", "route_weight", "multipath", "adaptive_timeout"]
+
+"""Parameters that configure the flows' congestion controllers: tcp is reno or fast,
+   and alpha is FAST's alpha"""
+CONTROLLER_PARAMETERS = ["tcp", "alpha"]
+
+"""Parameters that can be changed on a simulation that is already running. After a
+   warm-up they take effect from its end, so points that differ only in these share one
+   warm-up, while points differing in any other parameter are warmed up separately."""
+LIVE_PARAMETERS = ["alpha", "rate", "delay"]
+
+"""Parses a comma-separated list of parameter values, each as JSON if it can be and
+   as a string otherwise, so that 64 is a number and fast is a string."""
+def parse_values(text):
+    values = []
+    for value in text.split(","):
+        try:
+            values.append(json.loads(value))
+        except ValueError:
+            values.append(value)
+    return values
+
+"""Returns every combination of the values in `grid`, a list of (parameter, values),
+   as a dictionary per point in grid order. alpha only affects FAST, so it is set to
+   None for Reno points, and points that are then the same are only run once."""
+def grid_points(grid):
+    names = [name for (name, _) in grid]
+    points = []
+    for values in itertools.product(*[values for (_, values) in grid]):
+        point = OrderedDict(zip(names, values))
+        if point["tcp"] != "fast" and "alpha" in point:
+            point["alpha"] = None
+        if point not in points:
+            points.append(point)
+    return points
+
+"""Returns a copy of `testcase` with the link properties of `point` applied, and the
+   options of generate_simulation_from_testcase that `point` sets."""
+def configure(testcase, point):
+    testcase = copy.deepcopy(testcase)
+    options = {}
+    for (name, value) in point.iteritems():
+        (prop, _, link_id) = name.partition(".")
+        if prop in LINK_PROPERTIES:
+            links = [link for link in testcase["links"] if not link_id or link["id"] == link_id]
+            if not links:
+                sys.exit("Sweep parameter " + name + " names a link that isn't in the test case")
+            for link in links:
+                link[prop] = value
+        elif name in SIMULATION_OPTIONS:
+            options[name] = value
+        elif name not in CONTROLLER_PARAMETERS:
+            sys.exit("Unknown sweep parameter " + name + "; expected one of " + ", ".join(CONTROLLER_PARAMETERS + LINK_PROPERTIES + SIMULATION_OPTIONS))
+    if point["tcp"] not in ["reno", "fast"]:
+        sys.exit("Sweep parameter tcp must be reno or fast, not " + str(point["tcp"]))
+    return (testcase, options)
+
+"""Sets the live parameters of `point` on `sim`, which may already be running."""
+def apply_live_parameters(sim, point):
+    for (name, value) in point.iteritems():
+        (prop, _, link_id) = name.partition(".")
+        if prop in ["rate", "delay"]:
+            links = [link for link in sim.links.values() if not link_id or link.identifier == link_id]
+            if not links:
+                sys.exit("Sweep parameter " + name + " names a link that isn't in the test case")
+            for link in links:
+                if prop == "rate":
+                    link.rate = value * BYTES_PER_MEGABIT / 1000
+                else:
+                    link.delay = value
+    if point.get("alpha") is not None:
+        for flow in sim.flows.values():
+            flow.controller.alpha = float(point["alpha"])
+        for flow in sim.fluid_flows.values():
+            flow.alpha = float(point["alpha"])
+
+"""Returns `point` without its live parameters: the point its warm-up runs."""
+def warmup_point(point):
+    return OrderedDict((name, value) for (name, value) in point.iteritems() if name.partition(".")[0] not in LIVE_PARAMETERS)
+
+# The rest of a pool worker's run of a point, and its summary. `warmup_events` and
+# `warmup_time` are the events and wall seconds of the warm-up the run carries on from,
+# which are counted in its own, so that its figures compare with a run from the start.
+def _finish_point(index, sim, point, warmup_events=0, warmup_time=0.0):
+    import stats
+    apply_live_parameters(sim, point)
+    (sim, events, elapsed) = run_simulation(sim)
+    summary = stats.summarize(sim.logger)
+    summary.update(events=warmup_events + events, wall_time=warmup_time + elapsed, finished=sim.all_flows_finished(),
+                   warmup_events=warmup_events, warmup_wall_time=warmup_time)
+    return (index, summary)
+
+# Runs in a pool worker, which runs no other simulation, so nothing is shared between
+# runs. Returns the run's index with its summary, in aggregate mode to keep memory low.
+def _run_point(job):
+    (index, testcase, options, point) = job
+    with quiet():
+        sim = generate_simulation_from_testcase(testcase, False, point["tcp"] == "fast", aggregate=True, **options)
+    return _finish_point(index, sim, point)
+
+# Runs a point in a pool worker from the snapshot its warm-up left at `path`, after
+# `warmup_events` events taking `warmup_time` wall seconds
+def _resume_point(job):
+    (index, path, point, warmup_events, warmup_time) = job
+    return _finish_point(index, load_checkpoint(path), point, warmup_events, warmup_time)
+
+# Runs a warm-up in a pool worker until `warmup` ms and saves a snapshot to `path`.
+# Returns the snapshot's size with the events and wall seconds the warm-up took.
+def _warm_up(job):
+    (index, testcase, options, point, warmup, path) = job
+    with quiet():
+        sim = generate_simulation_from_testcase(testcase, False, point["tcp"] == "fast", aggregate=True, **options)
+    (sim, events, elapsed) = run_simulation(sim, warmup)
+    return (index, (sim.checkpoint(path), events, elapsed))
+
+# Runs `jobs` with `function` on `pool`, returning the results in the order of `jobs`
+def _map(pool, function, jobs, what):
+    results = [None] * len(jobs)
+    for (done, (index, result)) in enumerate(pool.imap_unordered(function, jobs), 1):
+        results[index] = result
+        sys.stderr.write("\r{0}/{1} {2} done".format(done, len(jobs), what))
+    sys.stderr.write("\n")
+    return results
+
+"""Runs every point of `points` on a pool of `processes` worker processes, each running
+   a single simulation, and returns their summaries in the order of `points`.
+
+   If `warmup` is given, each distinct warm-up point is first run once until `warmup`
+   seconds and saved as a snapshot in `checkpoint_dir`, and every point carries on from
+   its warm-up's snapshot with its live parameters applied. Unless a `checkpoint_dir`
+   is given the snapshots are kept in a temporary directory and removed afterwards."""
+def run_sweep(testcase, points, processes, warmup=None, checkpoint_dir=None):
+    pool = multiprocessing.Pool(processes, maxtasksperchild=1)
+    temporary = warmup is not None and checkpoint_dir is None
+    if temporary:
+        checkpoint_dir = tempfile.mkdtemp(prefix="sweep")
+    elif warmup is not None and not os.path.isdir(checkpoint_dir):
+        os.makedirs(checkpoint_dir)
+    try:
+        if warmup is None:
+            jobs = [(index,) + configure(testcase, point) + (point,) for (index, point) in enumerate(points)]
+            return _map(pool, _run_point, jobs, "runs")
+        warmups = []
+        for point in points:
+            configure(testcase, point)
+            if warmup_point(point) not in warmups:
+                warmups.append(warmup_point(point))
+        paths = [os.path.join(checkpoint_dir, "warmup{0}.ckpt".format(index)) for index in range(len(warmups))]
+        jobs = [(index,) + configure(testcase, point) + (point, warmup * 1000, path) for (index, (point, path)) in enumerate(zip(warmups, paths))]
+        warmed_up = _map(pool, _warm_up, jobs, "warm-ups")
+        sys.stderr.write("Snapshots take {0:.0f} KB on average\n".format(sum(size for (size, _, _) in warmed_up) / len(warmed_up) / 1024))
+        jobs = []
+        for (index, point) in enumerate(points):
+            warmup_index = warmups.index(warmup_point(point))
+            jobs.append((index, paths[warmup_index], point) + warmed_up[warmup_index][1:])
+        return _map(pool, _resume_point, jobs, "runs")
+    finally:
+        pool.terminate()
+        pool.join()
+        if temporary:
+            shutil.rmtree(checkpoint_dir)
+
+"""The figures of a run shown in the sweep table: when the last flow completed, the
+   aggregate throughput of every flow over the run, the mean and worst 99th percentile
+   round trip time over the flows, the packets dropped, and the events performed and
+   wall seconds taken. A run that carried on from a warm-up counts the warm-up's events
+   and time as well, although the warm-up was simulated once for every point sharing it,
+   so that its figures compare with those of a run from the start."""
+def sweep_metrics(summary):
+    flows = summary["flows"].values()
+    completion = max(flow["completion"] for flow in flows) if summary["finished"] else None
+    start = min(flow["start"] for flow in flows)
+    total = sum(flow.get("bytes", 0) for flow in flows)
+    rtts = [flow["mean_rtt"] for flow in flows if "mean_rtt" in flow]
+    return OrderedDict([
+        ("completion, s", completion / 1000 if completion is not None else None),
+        ("throughput, Mb/s", total / BYTES_PER_MEGABIT / ((completion - start) / 1000) if completion is not None else None),
+        ("mean RTT, ms", sum(rtts) / len(rtts) if rtts else None),
+        ("max p99 RTT, ms", max(flow["p99_rtt"] for flow in flows if "p99_rtt" in flow) if rtts else None),
+        ("dropped", sum(summary["drops"].values())),
+        ("events", summary["events"]),
+        ("wall, s", summary["wall_time"]),
+    ])
+
+"""Formats the points of a sweep and the metrics of their runs as a table."""
+def format_sweep(points, summaries):
+    def cell(value):
+        if value is None:
+            return "-"
+        return "{0:.3f}".format(value) if isinstance(value, float) else str(value)
+    rows = [[cell(value) for value in point.values()] + [cell(value) for value in sweep_metrics(summary).values()] for (point, summary) in zip(points, summaries)]
+    header = points[0].keys() + sweep_metrics(summaries[0]).keys()
+    widths = [max(len(row[i]) for row in rows + [header]) for i in range(len(header))]
+    return "\n".join("  ".join(value.rjust(width) for (value, width) in zip(row, widths)) for row in [header] + rows) + "\n"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a test case over a grid of parameters in parallel.')
+    parser.add_argument('-f', '--fast', action="store_true", dest="fast_insteadof_reno", default=False, help="TCP Fast, unless tcp is swept")
+    parser.add_argument('-p', '--param', action="append", dest="params", default=[], metavar="NAME=V1,V2", help="a parameter and the values to sweep it over, may be repeated")
+    parser.add_argument('-g', '--grid', action="store", dest="grid", default=None, help="JSON file mapping parameters to lists of values, swept before any --param")
+    parser.add_argument('-j', '--processes', action="store", dest="processes", type=int, default=multiprocessing.cpu_count(), help="worker processes (default one per core)")
+    parser.add_argument('--json', action="store", dest="json_file", default=None, help="also write every run's parameters and full summary to this JSON file")
+    parser.add_argument('--warmup', action="store", dest="warmup", type=float, default=None, metavar="SECONDS", help="simulate the first SECONDS once per distinct warm-up and carry each point on from a snapshot of it; " + ", ".join(LIVE_PARAMETERS) + " take effect after it")
+    parser.add_argument('--checkpoint-dir', action="store", dest="checkpoint_dir", default=None, help="keep the warm-up snapshots in this directory instead of removing them")
+    parser.add_argument('testcase_file', action="store", type=argparse.FileType('r'))
+    results = parser.parse_args()
+
+    grid = []
+    if results.grid is not None:
+        with open(results.grid) as grid_file:
+            grid.extend(json.load(grid_file, object_pairs_hook=OrderedDict).items())
+    for param in results.params:
+        (name, _, values) = param.partition("=")
+        grid.append((name, parse_values(values)))
+    if "tcp" not in [name for (name, _) in grid]:
+        grid.insert(0, ("tcp", ["fast" if results.fast_insteadof_reno else "reno"]))
+
+    points = grid_points(grid)
+    testcase = read_testcase(results.testcase_file)
+    print "Running {0} points on {1} processes".format(len(points), results.processes)
+    start = time.time()
+    summaries = run_sweep(testcase, points, results.processes, results.warmup, results.checkpoint_dir)
+    print format_sweep(points, summaries)
+    print "Sweep took {0:.1f}s".format(time.time() - start)
+    if results.json_file is not None:
+        with open(results.json_file, "w") as json_file:
+            json.dump([{"parameters": point, "summary": summary} for (point, summary) in zip(points, summaries)], json_file, indent=2)
@@ -0,0 +1,45 @@
+import unittest
+from benchmark import load_simulation, run_simulation
+
+# Every entry the simulation logged, in an order that doesn't depend on the order
+# entries for the same instant were appended in
+def sorted_logs(sim):
+    logger = sim.logger
+    return dict((name, sorted(repr(sorted(entry.items())) for entry in getattr(logger, name)))
+                for name in dir(logger) if name.endswith("_logs"))
+
+class BatchingTest(unittest.TestCase):
+    """Checks that links sending packet trains keep the timing of sending packet by
+       packet, with fewer events."""
+
+    def assert_same_run(self, name, fast_insteadof_reno, batched_links):
+        (unbatched, unbatched_events, _) = run_simulation(load_simulation(name, fast_insteadof_reno))
+        (batched, batched_events, _) = run_simulation(load_simulation(name, fast_insteadof_reno, batching=True))
+        self.assertEqual(sorted(link.identifier for link in batched.links.values() if link.batching), batched_links)
+        self.assertTrue(batched.all_flows_finished())
+        self.assertEqual(batched.clock.current_time, unbatched.clock.current_time)
+        self.assertLess(batched_events, unbatched_events)
+        self.assertEqual(sorted_logs(batched), sorted_logs(unbatched))
+
+    def test_testcase0(self):
+        self.assert_same_run("testcase0.json", False, ["L1"])
+        self.assert_same_run("testcase0.json", True, ["L1"])
+
+    # The links between routers tie with each other when routing packets are flooded
+    def test_testcase1(self):
+        self.assert_same_run("testcase1.json", False, ["L0", "L5"])
+
+    def test_testcase2_links(self):
+        sim = load_simulation("testcase2.json", False, batching=True)
+        self.assertEqual(sorted(link.identifier for link in sim.links.values() if link.batching), ["L6", "L7"])
+
+    def test_not_with_fluid_flows(self):
+        sim = load_simulation("testcase0.json", False, batching=True, fluid=["F1"])
+        self.assertFalse(any(link.batching for link in sim.links.values()))
+
+    def test_not_with_red(self):
+        sim = load_simulation("testcase0.json", False, batching=True, queue_discipline="red")
+        self.assertFalse(any(link.batching for link in sim.links.values()))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+from clock import Clock
+from event_queue import EventQueue
+from packet import AcknowledgementPacket
+from congestion_controller import CongestionControllerReno, CongestionControllerFast
+
+class FakeFlow(object):
+    """A flow that only records the copies its controller sends."""
+    def __init__(self):
+        self.total = 1024 * 1024
+        self.sent = []
+
+    def send_a_packet(self, packet_id, duplicate_num):
+        self.sent.append((packet_id, duplicate_num))
+
+class AdaptiveTimeoutTest(unittest.TestCase):
+    """Checks that a timeout backed off after packets time out lasts until the round
+       trip time of a copy that was never retransmitted is measured."""
+
+    # A controller 900 ms in, with packet 1 sent at 0 ms, packet 2 sent at 800 ms and
+    # a 300 ms timeout from a smoothed round trip time of 100 ms
+    def make_controller(self, controller_class):
+        controller = controller_class(adaptive_timeout=True)
+        controller.clock = Clock()
+        controller.event_scheduler = EventQueue(controller.clock)
+        controller.flow = FakeFlow()
+        controller.smoothed_RTT = 100.0
+        controller.RTT_variation = 25.0
+        controller.timeout = 300.0
+        controller.not_acknowledged.add(1, 0, 0)
+        controller.not_acknowledged.add(2, 0, 800)
+        controller.last_ack_received = 1
+        controller.window_start = 3
+        controller.clock.current_time = 900
+        return controller
+
+    def acknowledge(self, controller, time, identifier, duplicate_num, next_id):
+        controller.clock.current_time = time
+        controller.acknowledgement_received(AcknowledgementPacket(identifier, duplicate_num, next_id, "F1", None, None, 1024, 64))
+
+    def test_backoff_survives(self):
+        for controller_class in [CongestionControllerReno, CongestionControllerFast]:
+            name = controller_class.__name__
+            controller = self.make_controller(controller_class)
+            # Measures 100 ms, leaving 300 ms, and then finds packet 1 timed out
+            self.acknowledge(controller, 900, 2, 0, 1)
+            self.assertEqual(controller.timeout, 600, name)
+            self.assertIn((1, 1), controller.flow.sent, name)
+            # The retransmitted copy's round trip time is ignored
+            self.acknowledge(controller, 1000, 1, 1, 3)
+            self.assertEqual(controller.timeout, 600, name)
+            # Packet 3 was sent as the retransmitted copy was acknowledged
+            self.acknowledge(controller, 1100, 3, 0, 4)
+            self.assertLess(controller.timeout, 600, name)
+
+if __name__ == "__main__":
+    unittest.main()
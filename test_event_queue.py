@@ -0,0 +1,56 @@
+import unittest
+from clock import Clock
+from event import Event
+from event_queue import SCHEDULERS
+
+class MarkerEvent(Event):
+    """An event that only records the time it was scheduled for."""
+    __slots__ = ("time",)
+    def __init__(self, time):
+        Event.__init__(self)
+        self.time = time
+
+class EventQueueTest(unittest.TestCase):
+    """Checks that every scheduler dequeues events in the same order."""
+
+    # Dequeues every remaining event, returning their times
+    def drain(self, event_queue):
+        times = []
+        event = event_queue.dequeue_next_event()
+        while event is not None:
+            times.append(event.time)
+            event = event_queue.dequeue_next_event()
+        return times
+
+    # Simulation.run_until peeks at the next event and then moves the clock forward to
+    # a time before it, after which events may be scheduled before the peeked one
+    def test_schedule_after_peek(self):
+        for (name, scheduler) in sorted(SCHEDULERS.items()):
+            clock = Clock()
+            event_queue = scheduler(clock)
+            for time in [50, 100]:
+                event_queue.schedule_event(time, MarkerEvent(time))
+            self.assertEqual(event_queue.dequeue_next_event().time, 50, name)
+            self.assertEqual(event_queue.next_event_time(), 100, name)
+            clock.current_time = 60
+            event_queue.schedule_event(70, MarkerEvent(70))
+            self.assertEqual(self.drain(event_queue), [70, 100], name)
+
+    def test_same_order(self):
+        orders = []
+        for (name, scheduler) in sorted(SCHEDULERS.items()):
+            clock = Clock()
+            event_queue = scheduler(clock)
+            times = []
+            for i in range(200):
+                time = clock.current_time + (i * 37) % 101
+                event_queue.schedule_event(time, MarkerEvent(time))
+                if i % 5 == 0:
+                    times.append(event_queue.dequeue_next_event().time)
+                    event_queue.next_event_time()
+            orders.append(times + self.drain(event_queue))
+        for order in orders[1:]:
+            self.assertEqual(order, orders[0])
+
+if __name__ == "__main__":
+    unittest.main()
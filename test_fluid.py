@@ -0,0 +1,106 @@
+from __future__ import division
+import math, unittest
+from parsing import read_testcase, generate_simulation_from_testcase
+from benchmark import quiet
+from fluid import FluidFlow, FLUID_PACKET_SIZE
+
+"""The timestep and round trip time, in ms, the windows are advanced with"""
+TIMESTEP = 10.0
+RTT = 100.0
+
+# A flow with far more to send than it will, so its rate is never capped by what is left
+def make_flow(fast_insteadof_reno):
+    return FluidFlow("F1", None, None, 1e12, 0, fast_insteadof_reno)
+
+class UpdateWindowTest(unittest.TestCase):
+    """Checks that fluid windows settle where the packet-level controllers would."""
+
+    # FAST's update w = w * base_RTT / RTT + alpha settles at alpha * RTT / (RTT - base_RTT)
+    def test_fast_fixed_point(self):
+        flow = make_flow(True)
+        flow.update_window(TIMESTEP, RTT, 0.0)
+        for _ in range(500):
+            flow.update_window(TIMESTEP, 1.5 * RTT, 0.0)
+        self.assertAlmostEqual(flow.window, flow.alpha * 1.5 * RTT / (0.5 * RTT), places=6)
+
+    # Without losses FAST grows by alpha per acknowledgement
+    def test_fast_without_queueing(self):
+        flow = make_flow(True)
+        flow.update_window(TIMESTEP, RTT, 0.0)
+        window = flow.window
+        flow.update_window(TIMESTEP, RTT, 0.0)
+        acknowledged = window * FLUID_PACKET_SIZE / RTT * TIMESTEP / FLUID_PACKET_SIZE
+        self.assertAlmostEqual(flow.window, window + flow.alpha * acknowledged)
+
+    # Slow start doubles the window every round trip
+    def test_reno_slow_start(self):
+        flow = make_flow(False)
+        for _ in range(int(RTT / TIMESTEP)):
+            flow.update_window(TIMESTEP, RTT, 0.0)
+        self.assertAlmostEqual(flow.window, 4.0)
+        self.assertTrue(flow.slow_start)
+
+    # Growing by a packet a round trip and halving for every loss, Reno settles where
+    # dw/dt = 1 / RTT - w * ln 2 * w * p / RTT is zero, at w = sqrt(1 / (p ln 2)),
+    # approached as the timestep shrinks next to the round trip time
+    def test_reno_fixed_point(self):
+        for loss in [0.01, 0.001]:
+            flow = make_flow(False)
+            for _ in range(5000):
+                flow.update_window(TIMESTEP, RTT, loss)
+            self.assertFalse(flow.slow_start)
+            window = flow.window
+            flow.update_window(TIMESTEP, RTT, loss)
+            self.assertAlmostEqual(flow.window, window, places=6)
+            expected = math.sqrt(1 / (loss * math.log(2)))
+            self.assertLess(abs(window - expected), 0.01 * expected)
+
+class ZeroDelayTest(unittest.TestCase):
+    """Checks that fluid flows run over links without propagation delay, where the round
+       trip time is nothing but queueing."""
+
+    def test_zero_delay(self):
+        with open("testcase0.json") as testcase_file:
+            testcase = read_testcase(testcase_file)
+        for link in testcase["links"]:
+            link["delay"] = 0
+        for fast_insteadof_reno in [False, True]:
+            with quiet():
+                sim = generate_simulation_from_testcase(testcase, False, fast_insteadof_reno, aggregate=True, fluid=["F1"])
+                sim.run()
+            flow = sim.fluid_flows["F1"]
+            self.assertTrue(flow.done)
+            self.assertGreaterEqual(flow.rtt, TIMESTEP)
+
+class FluidBacklogTest(unittest.TestCase):
+    """Checks that the fluid waiting in a link's buffer always fits in the space
+       packets leave it."""
+
+    # Runs a bundled test case until `time` ms with the flows in `fluid` modeled as
+    # fluid, checking every link after every event, and returns the largest backlog
+    def run_checking_buffers(self, name, fluid, time):
+        with open(name) as testcase_file:
+            testcase = read_testcase(testcase_file)
+        with quiet():
+            sim = generate_simulation_from_testcase(testcase, False, False, aggregate=True, fluid=fluid)
+            largest = 0
+            while not sim.all_flows_finished() and sim.clock.current_time < time and sim.step():
+                for link in sim.fluid_model.links:
+                    buffer = link.buffer
+                    self.assertGreaterEqual(buffer.fluid_backlog, 0)
+                    self.assertGreaterEqual(buffer.available_space, 0)
+                    self.assertLessEqual(buffer.fluid_backlog, buffer.capacity)
+                    largest = max(largest, buffer.fluid_backlog)
+        return (sim, largest)
+
+    def test_fluid_alone(self):
+        (sim, largest) = self.run_checking_buffers("testcase0.json", ["F1"], float("inf"))
+        self.assertTrue(sim.all_flows_finished())
+        self.assertGreater(largest, 0)
+
+    def test_fluid_with_packets(self):
+        (sim, largest) = self.run_checking_buffers("testcase2.json", ["F2", "F3"], 25000)
+        self.assertGreater(largest, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+from __future__ import division
+import math, unittest
+from queue_discipline import RandomEarlyDetection, CoDel, make_queue_discipline
+
+class FakeLink(object):
+    """A link that only has a rate, in bytes per ms, as RED needs."""
+    def __init__(self, rate):
+        self.rate = rate
+
+class FakeBuffer(object):
+    """A buffer of `capacity` bytes holding `queued` of them."""
+    def __init__(self, capacity, queued, rate=1024.0):
+        self.capacity = capacity
+        self.available_space = capacity - queued
+        self.link = FakeLink(rate)
+
+class FakePacket(object):
+    def __init__(self, size=1024):
+        self.size = size
+
+class FakeRandom(object):
+    """Random numbers that are always `value`."""
+    def __init__(self, value):
+        self.value = value
+
+    def random(self):
+        return self.value
+
+class RandomEarlyDetectionTest(unittest.TestCase):
+    """Feeds RED known queue lengths. With a weight of 1 the average is the queue
+       length of the latest arrival."""
+
+    def make_red(self, random_value, weight=1.0):
+        red = RandomEarlyDetection(1000, 3000, max_probability=0.1, weight=weight)
+        red.random = FakeRandom(random_value)
+        return red
+
+    def test_thresholds(self):
+        red = self.make_red(0.0)
+        self.assertFalse(red.drop_on_enqueue(FakeBuffer(10000, 999), FakePacket(), 0))
+        self.assertEqual(red.count, -1)
+        red = self.make_red(1.0)
+        self.assertTrue(red.drop_on_enqueue(FakeBuffer(10000, 3000), FakePacket(), 0))
+        self.assertEqual(red.count, 0)
+
+    # Halfway between the thresholds the drop probability is 0.05, which RED spreads
+    # out by dividing it by 1 - count * 0.05, so that it reaches 1 once count is 19.
+    # count is 0 for the first arrival above min_threshold, and 1 for the first after
+    # a drop. Random numbers of 0.99 drop only once the probability reaches 1.
+    def test_count_spreads_drops(self):
+        red = self.make_red(0.99)
+        drops = [red.drop_on_enqueue(FakeBuffer(10000, 2000), FakePacket(), 0) for _ in range(40)]
+        self.assertEqual([i for (i, drop) in enumerate(drops) if drop], [19, 38])
+
+    # Smaller packets are dropped in proportion to their size
+    def test_byte_mode(self):
+        red = self.make_red(0.04)
+        self.assertTrue(red.drop_on_enqueue(FakeBuffer(10000, 2000), FakePacket(1024), 0))
+        red = self.make_red(0.04)
+        self.assertFalse(red.drop_on_enqueue(FakeBuffer(10000, 2000), FakePacket(512), 0))
+
+    # While the queue is empty the average decays as though a full packet had arrived
+    # to the empty queue every time the link could have sent one
+    def test_idle_decay(self):
+        red = self.make_red(1.0, weight=0.5)
+        buffer = FakeBuffer(10000, 4000)
+        red.drop_on_enqueue(buffer, FakePacket(), 0)
+        self.assertEqual(red.average, 2000)
+        red.buffer_emptied(buffer, 10)
+        # Idle for 3 ms at a packet per ms, then a packet arrives to an empty queue
+        red.drop_on_enqueue(FakeBuffer(10000, 0), FakePacket(), 13)
+        self.assertAlmostEqual(red.average, 2000 * 0.5 ** 3 * 0.5)
+
+class CoDelTest(unittest.TestCase):
+    """Feeds CoDel known sojourn times, with a 5 ms target and a 100 ms interval."""
+
+    def setUp(self):
+        self.codel = CoDel(target=5.0, interval=100.0)
+        self.buffer = FakeBuffer(64 * 1024, 10 * 1024)
+
+    # Returns the drop decision for each (sojourn, now)
+    def dequeue(self, sequence):
+        return [self.codel.drop_on_dequeue(self.buffer, sojourn, now) for (sojourn, now) in sequence]
+
+    def test_below_target(self):
+        self.assertEqual(self.dequeue([(4, now) for now in range(0, 500, 10)]), [False] * 50)
+        self.assertEqual(self.codel.first_above_time, 0)
+
+    # A queue of at most one packet is never dropped from, however long it waited
+    def test_single_packet(self):
+        self.buffer = FakeBuffer(64 * 1024, 1024)
+        self.assertEqual(self.dequeue([(50, now) for now in range(0, 500, 10)]), [False] * 50)
+
+    # Drops once the delay has stayed above target for an interval, then after an
+    # interval / sqrt(count) each, until the delay falls below target
+    def test_control_law(self):
+        self.assertEqual(self.dequeue([(10, 0), (10, 50), (10, 100)]), [False, False, True])
+        self.assertTrue(self.codel.dropping)
+        self.assertEqual((self.codel.count, self.codel.drop_next), (1, 200))
+        self.assertEqual(self.dequeue([(10, 150), (10, 200)]), [False, True])
+        self.assertEqual(self.codel.count, 2)
+        self.assertAlmostEqual(self.codel.drop_next, 200 + 100 / math.sqrt(2))
+        self.assertEqual(self.dequeue([(10, 270), (10, 271)]), [False, True])
+        self.assertEqual(self.codel.count, 3)
+        self.assertEqual(self.dequeue([(1, 300)]), [False])
+        self.assertFalse(self.codel.dropping)
+
+    # Re-entering the dropping state soon after leaving it carries on from the drops of
+    # the last episode, and long after leaving it starts again from one drop
+    def test_reentry(self):
+        self.dequeue([(10, 0), (10, 100), (10, 200), (10, 271), (1, 300)])
+        drop_next = self.codel.drop_next
+        self.assertEqual(self.dequeue([(10, 310), (10, 410)]), [False, True])
+        self.assertEqual(self.codel.count, 2)
+        self.assertAlmostEqual(self.codel.drop_next, 410 + 100 / math.sqrt(2))
+        self.assertLess(410 - drop_next, 16 * 100)
+        later = 410 + 20 * 100
+        self.assertEqual(self.dequeue([(1, later), (10, later + 10), (10, later + 110)]), [False, False, True])
+        self.assertEqual(self.codel.count, 1)
+
+    def test_buffer_emptied(self):
+        self.dequeue([(10, 0), (10, 100)])
+        self.codel.buffer_emptied(self.buffer, 110)
+        self.assertFalse(self.codel.dropping)
+        self.assertEqual(self.dequeue([(10, 120)]), [False])
+
+class MakeQueueDisciplineTest(unittest.TestCase):
+    """Checks the parameters accepted for RED."""
+
+    def test_red_thresholds(self):
+        red = make_queue_discipline({"type": "red", "min_threshold": 16, "max_threshold": 48}, "L1", 64 * 1024)
+        self.assertEqual((red.min_threshold, red.max_threshold), (16 * 1024, 48 * 1024))
+        for (minimum, maximum) in [(48, 16), (32, 32)]:
+            with self.assertRaises(SystemExit):
+                make_queue_discipline({"type": "red", "min_threshold": minimum, "max_threshold": maximum}, "L1", 64 * 1024)
+        # A default threshold counts as well
+        with self.assertRaises(SystemExit):
+            make_queue_discipline({"type": "red", "min_threshold": 60}, "L1", 64 * 1024)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+from router import CostRoutingTable
+from parsing import read_testcase, generate_simulation_from_testcase
+from benchmark import quiet, run_simulation
+
+class FakeLink(object):
+    """A link that only has an identifier, as the routing tables need."""
+    def __init__(self, identifier):
+        self.identifier = identifier
+
+class CostRoutingTableTest(unittest.TestCase):
+    """Checks that routes move only on the costs of a whole round, and only when the
+       other link is cheaper by more than the hysteresis."""
+
+    def setUp(self):
+        self.table = CostRoutingTable()
+        (self.upper, self.lower) = (FakeLink("L1"), FakeLink("L2"))
+        for link in [self.upper, self.lower]:
+            self.table.update_entry("T1", 0, link, 30)
+            self.table.update_entry("T2", 0, link, 30)
+
+    # Ends the round before `timestamp` for the host with a copy of the next one
+    def end_round(self, host_identifier, timestamp):
+        self.table.update_entry(host_identifier, timestamp + 3000, self.upper, 30)
+
+    def test_waits_for_the_round_to_end(self):
+        self.table.update_entry("T1", 3000, self.lower, 30)
+        self.table.update_entry("T1", 3000, self.upper, 60)
+        self.assertIs(self.table.get_entry("T1"), self.upper)
+        self.end_round("T1", 3000)
+        self.assertIs(self.table.get_entry("T1"), self.lower)
+
+    # A link that stops carrying routing packets neither holds up the other links
+    # nor keeps a route
+    def test_ignores_silent_links(self):
+        self.table.update_entry("T1", 3000, self.upper, 60)
+        self.table.update_entry("T1", 6000, self.upper, 60)
+        self.assertIs(self.table.get_entry("T1"), self.upper)
+        self.table.update_entry("T1", 9000, self.lower, 60)
+        self.table.update_entry("T1", 12000, self.lower, 60)
+        self.assertIs(self.table.get_entry("T1"), self.lower)
+        self.table.update_entry("T1", 12000, self.upper, 30)
+        self.table.update_entry("T1", 12000, self.lower, 60)
+        self.end_round("T1", 12000)
+        self.assertIs(self.table.get_entry("T1"), self.upper)
+
+    def test_hysteresis(self):
+        self.table.update_entry("T1", 3000, self.upper, 36)
+        self.table.update_entry("T1", 3000, self.lower, 30)
+        self.end_round("T1", 3000)
+        self.assertIs(self.table.get_entry("T1"), self.upper)
+
+    def test_one_move_per_round(self):
+        for host in ["T1", "T2"]:
+            self.table.update_entry(host, 3000, self.upper, 60)
+            self.table.update_entry(host, 3000, self.lower, 30)
+            self.end_round(host, 3000)
+        self.assertIs(self.table.get_entry("T1"), self.lower)
+        self.assertIs(self.table.get_entry("T2"), self.upper)
+
+    def test_forwards_cheaper_copies(self):
+        self.assertTrue(self.table.update_entry("T1", 3000, self.upper, 60))
+        self.assertTrue(self.table.update_entry("T1", 3000, self.lower, 30))
+        self.assertFalse(self.table.update_entry("T1", 3000, self.upper, 45))
+        self.assertFalse(self.table.update_entry("T1", 0, self.upper, 10))
+
+class StaticMultipathTest(unittest.TestCase):
+    """Checks that static routes spread flows over both branches of testcase1's diamond
+       with multipath, and keep them on one branch without it."""
+
+    # Runs testcase1 with four flows from H1 to H2 in place of its single one, and
+    # returns the bytes each link carried
+    def run_four_flows(self, multipath):
+        with open("testcase1.json") as testcase_file:
+            testcase = read_testcase(testcase_file)
+        testcase["flows"] = [{"id": "F" + str(i), "source": "H1", "destination": "H2", "amount": 1, "start": 0.5} for i in range(1, 5)]
+        with quiet():
+            sim = generate_simulation_from_testcase(testcase, False, False, routing="static", multipath=multipath)
+        run_simulation(sim)
+        self.assertTrue(sim.all_flows_finished())
+        return dict((link.identifier, link.packet_bytes) for link in sim.links.values())
+
+    def test_both_branches(self):
+        carried = self.run_four_flows(True)
+        for link in ["L1", "L2", "L3", "L4"]:
+            self.assertGreater(carried[link], 0)
+
+    def test_one_branch(self):
+        carried = self.run_four_flows(False)
+        self.assertEqual(len([link for link in ["L1", "L2"] if carried[link] > 0]), 1)
+
+if __name__ == "__main__":
+    unittest.main()
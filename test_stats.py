@@ -0,0 +1,38 @@
+import os, sys, unittest
+import stats
+from parsing import read_testcase, generate_simulation_from_testcase
+
+# Builds testcase0 and runs it until `time` ms, silencing its progress output
+def run_testcase0_until(time, aggregate):
+    with open("testcase0.json") as testcase_file:
+        testcase = read_testcase(testcase_file)
+    devnull = open(os.devnull, "w")
+    stdout = sys.stdout
+    sys.stdout = devnull
+    try:
+        sim = generate_simulation_from_testcase(testcase, False, False, aggregate=aggregate)
+        sim.run_until(time)
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+    return sim
+
+class PartialRunTest(unittest.TestCase):
+    """Checks that the statistics of a simulation stopped before its flows completed,
+       which has packets that were sent but not yet acknowledged, can be computed."""
+
+    def test_summary_matches_aggregate(self):
+        summaries = [stats.summarize(run_testcase0_until(5000, aggregate).logger) for aggregate in [False, True]]
+        (full, aggregated) = [summary["flows"]["F1"] for summary in summaries]
+        self.assertNotIn("completion", full)
+        self.assertEqual(full["bytes"], aggregated["bytes"])
+        self.assertGreater(full["mean_rtt"], 0)
+
+    def test_round_trip_times(self):
+        logger = run_testcase0_until(5000, False).logger
+        (times, rtts) = stats.round_trip_time_series(logger)["F1"]
+        self.assertEqual(len(times), len(rtts))
+        self.assertTrue(all(rtt > 0 for rtt in rtts))
+
+if __name__ == "__main__":
+    unittest.main()
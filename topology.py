@@ -0,0 +1,173 @@
+import sys, json, random, argparse
+
+"""Rate in Mb/s, delay in ms and buffer size in KB of the links from hosts to routers,
+   as in the bundled test cases"""
+ACCESS_LINK = {"rate": 12.5, "delay": 10, "buffer": 128}
+
+"""Rate in Mb/s, delay in ms and buffer size in KB of the links between routers"""
+CORE_LINK = {"rate": 10, "delay": 10, "buffer": 128}
+
+class TopologyBuilder:
+    """Builds a test case in the JSON schema read by parsing.generate_simulation_from_testcase.
+       Links and flows are numbered L1, L2, ... and F1, F2, ... as they are added.
+
+    Attributes:
+        links: The link objects of the test case
+        flows: The flow objects of the test case
+        hosts: The host objects of the test case
+        routers: The router objects of the test case
+    """
+
+    def __init__(self):
+        self.links = []
+        self.flows = []
+        self.hosts = []
+        self.routers = []
+
+    def add_router(self, identifier):
+        self.routers.append({"id": identifier})
+        return identifier
+
+    """Adds a host attached to `router` by an access link."""
+    def add_host(self, identifier, router):
+        self.hosts.append({"id": identifier})
+        self.add_link(identifier, router, ACCESS_LINK)
+        return identifier
+
+    """Adds a link between two devices with the rate, delay and buffer of `kind`."""
+    def add_link(self, deviceA, deviceB, kind=CORE_LINK):
+        link = dict(kind, id="L" + str(len(self.links) + 1), endpoints=[deviceA, deviceB])
+        self.links.append(link)
+        return link["id"]
+
+    """Adds a flow of `amount` MB starting at `start` seconds."""
+    def add_flow(self, source, destination, amount, start):
+        self.flows.append({"id": "F" + str(len(self.flows) + 1), "source": source, "destination": destination,
+                           "amount": amount, "start": start})
+
+    def testcase(self):
+        return {"links": self.links, "flows": self.flows, "hosts": self.hosts, "routers": self.routers}
+
+"""A dumbbell: `size` flows, each from its own host on one side of a single bottleneck
+   link between two routers to its own host on the other side."""
+def dumbbell(size, amount=1, start=0.5, stagger=0.0, seed=0):
+    topology = TopologyBuilder()
+    left = topology.add_router("R1")
+    right = topology.add_router("R2")
+    topology.add_link(left, right)
+    for i in range(1, size + 1):
+        source = topology.add_host("S" + str(i), left)
+        destination = topology.add_host("T" + str(i), right)
+        topology.add_flow(source, destination, amount, start + (i - 1) * stagger)
+    return topology.testcase()
+
+"""A diamond: `size` flows, each from its own host on one router to its own host on
+   another, which are joined by two parallel paths of two links each, as in testcase1."""
+def diamond(size, amount=1, start=0.5, stagger=0.0, seed=0):
+    topology = TopologyBuilder()
+    (left, upper, lower, right) = [topology.add_router("R" + str(i)) for i in range(1, 5)]
+    for (deviceA, deviceB) in [(left, upper), (left, lower), (upper, right), (lower, right)]:
+        topology.add_link(deviceA, deviceB)
+    for i in range(1, size + 1):
+        source = topology.add_host("S" + str(i), left)
+        destination = topology.add_host("T" + str(i), right)
+        topology.add_flow(source, destination, amount, start + (i - 1) * stagger)
+    return topology.testcase()
+
+"""A parking lot: a chain of `size` links between `size` + 1 routers, with one flow
+   across the whole chain and one cross flow over each link of it."""
+def parking_lot(size, amount=1, start=0.5, stagger=0.0, seed=0):
+    topology = TopologyBuilder()
+    routers = [topology.add_router("R" + str(i)) for i in range(1, size + 2)]
+    for (router, next_router) in zip(routers, routers[1:]):
+        topology.add_link(router, next_router)
+    topology.add_flow(topology.add_host("S0", routers[0]), topology.add_host("T0", routers[-1]), amount, start)
+    for i in range(1, size + 1):
+        source = topology.add_host("S" + str(i), routers[i - 1])
+        destination = topology.add_host("T" + str(i), routers[i])
+        topology.add_flow(source, destination, amount, start + i * stagger)
+    return topology.testcase()
+
+"""A k-ary fat tree (Al-Fares et al., 2008) with k = `size`: (k/2)^2 core routers and k
+   pods of k/2 aggregation and k/2 edge routers, with k/2 hosts on each edge router.
+   Hosts are paired at random, and each pair has a flow."""
+def fat_tree(size, amount=1, start=0.5, stagger=0.0, seed=0):
+    if size < 2 or size % 2 != 0:
+        sys.exit("A fat tree needs an even k of at least 2, not " + str(size))
+    half = size // 2
+    topology = TopologyBuilder()
+    cores = [topology.add_router("C" + str(i)) for i in range(1, half * half + 1)]
+    hosts = []
+    for pod in range(1, size + 1):
+        aggregations = [topology.add_router("A{0}_{1}".format(pod, i)) for i in range(1, half + 1)]
+        edges = [topology.add_router("E{0}_{1}".format(pod, i)) for i in range(1, half + 1)]
+        for (i, aggregation) in enumerate(aggregations):
+            # Aggregation router i of every pod connects to the same k/2 core routers
+            for core in cores[i * half:(i + 1) * half]:
+                topology.add_link(aggregation, core)
+            for edge in edges:
+                topology.add_link(aggregation, edge)
+        for (i, edge) in enumerate(edges, 1):
+            hosts.extend(topology.add_host("H{0}_{1}_{2}".format(pod, i, j), edge) for j in range(1, half + 1))
+    _pair_hosts(topology, hosts, amount, start, stagger, random.Random(seed))
+    return topology.testcase()
+
+"""A random connected graph of `size` routers with an average degree of about three:
+   a random spanning tree plus random extra links. Each router has one host, and the
+   hosts are paired at random, each pair having a flow."""
+def random_graph(size, amount=1, start=0.5, stagger=0.0, seed=0, degree=3):
+    rng = random.Random(seed)
+    topology = TopologyBuilder()
+    routers = [topology.add_router("R" + str(i)) for i in range(1, size + 1)]
+    connected = set()
+    for (i, router) in enumerate(routers[1:], 1):
+        neighbour = routers[rng.randrange(i)]
+        topology.add_link(neighbour, router)
+        connected.add(frozenset([neighbour, router]))
+    # Extra links, avoiding duplicates, until the average degree is reached
+    extra = max(0, size * degree // 2 - (size - 1))
+    candidates = [frozenset([a, b]) for (i, a) in enumerate(routers) for b in routers[i + 1:]]
+    rng.shuffle(candidates)
+    for pair in [pair for pair in candidates if pair not in connected][:extra]:
+        topology.add_link(*sorted(pair))
+    hosts = [topology.add_host("H" + str(i), router) for (i, router) in enumerate(routers, 1)]
+    _pair_hosts(topology, hosts, amount, start, stagger, rng)
+    return topology.testcase()
+
+# Shuffles the hosts and adds a flow between each consecutive pair, so every host
+# takes part in at most one flow.
+def _pair_hosts(topology, hosts, amount, start, stagger, rng):
+    hosts = list(hosts)
+    rng.shuffle(hosts)
+    for (i, (source, destination)) in enumerate(zip(hosts[0::2], hosts[1::2])):
+        topology.add_flow(source, destination, amount, start + i * stagger)
+
+"""The topology generators, keyed by name. Each takes a size first: the number of flows of
+   a dumbbell or diamond, the number of hops of a parking lot, the k of a fat tree, or the number of
+   routers of a random graph."""
+TOPOLOGIES = {
+    "dumbbell": dumbbell,
+    "diamond": diamond,
+    "parking_lot": parking_lot,
+    "fat_tree": fat_tree,
+    "random": random_graph,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Generate a network test case.')
+    parser.add_argument('topology', action="store", choices=sorted(TOPOLOGIES))
+    parser.add_argument('size', action="store", type=int, help="flows of a dumbbell or diamond, hops of a parking lot, k of a fat tree or routers of a random graph")
+    parser.add_argument('--amount', action="store", type=float, default=1, help="MB sent by each flow (default 1)")
+    parser.add_argument('--start', action="store", type=float, default=0.5, help="when the first flow starts, in seconds (default 0.5)")
+    parser.add_argument('--stagger', action="store", type=float, default=0.0, help="seconds between the starts of consecutive flows (default 0)")
+    parser.add_argument('--seed', action="store", type=int, default=0, help="seed for the random choices of fat trees and random graphs (default 0)")
+    parser.add_argument('-o', '--output', action="store", dest="output", default=None, help="file to write the test case to (default stdout)")
+    results = parser.parse_args()
+
+    testcase = TOPOLOGIES[results.topology](results.size, results.amount, results.start, results.stagger, results.seed)
+    if results.output is None:
+        json.dump(testcase, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(results.output, "w") as output_file:
+            json.dump(testcase, output_file, indent=2)